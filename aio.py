@@ -0,0 +1,168 @@
+# coding=utf-8
+#
+# Async versions of the functions in data.py, for asyncio based applications.
+#
+# SQLAlchemy (1.3) has no asyncio support, so each call runs the function
+# of data.py in a bounded thread pool, where every thread checks out its
+# own connection from the engine's pool. The event loop is free while the
+# database round trip is in progress, and at most maxWorkers calls hit the
+# database at the same time, the rest wait in the pool's queue.
+#
+# Call (and await) initializeDatastore before any other function, and
+# shutdown when the application exits.
+#
+
+from repo_data import data
+from repo_data.utils.error_handling import DataStoreNotYetInitializeError
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from itertools import islice
+import asyncio, contextvars, threading
+
+
+
+"""
+	the thread pool that runs the functions of data.py, created by
+	initializeDatastore.
+"""
+executor = None
+executorLock = threading.Lock()
+
+
+
+def getExecutor():
+	"""
+	=> [ThreadPoolExecutor] the thread pool of the async functions
+	"""
+	with executorLock:
+		if executor is None:
+			raise DataStoreNotYetInitializeError('Plase call initializeDatastore to initialize datastore')
+		return executor
+
+
+
+def runInExecutor(func):
+	"""
+	[Function] func of data.py => [Coroutine Function] async version of func
+
+	The current context is copied to the thread, so that an active
+	IngestionReport still applies.
+	"""
+	@wraps(func)
+	async def asyncFunc(*args, **kwargs):
+		context = contextvars.copy_context()
+		return await asyncio.get_running_loop().run_in_executor(
+					getExecutor(), partial(context.run, func, *args, **kwargs))
+
+	return asyncFunc
+
+
+
+async def initializeDatastore(mode, maxWorkers=10):
+	"""
+	[String] mode ('production' means produciton mode, test mode otherwise),
+	[Int] max. no. of concurrent database calls (optional)
+
+	side effect: initialize the underlying data store in test or production
+	mode, and (re)create the thread pool of maxWorkers threads.
+
+	maxWorkers should not exceed the pool_size plus max_overflow of the
+	engine (5 + 10 by default), otherwise threads wait for a connection.
+	"""
+	global executor
+	with executorLock:
+		oldExecutor, executor = executor, ThreadPoolExecutor( max_workers=maxWorkers
+															, thread_name_prefix='repo_data_aio')
+	if oldExecutor is not None:
+		oldExecutor.shutdown(wait=False)
+
+	return await runInExecutor(data.initializeDatastore)(mode)
+
+
+
+def shutdown(wait=True):
+	"""
+	[Bool] wait for the pending calls to finish (optional)
+
+	side effect: shut down the thread pool, initializeDatastore must be
+	called again before using the other functions.
+	"""
+	global executor
+	with executorLock:
+		oldExecutor, executor = executor, None
+	if oldExecutor is not None:
+		oldExecutor.shutdown(wait=wait)
+
+
+
+clearRepoData = runInExecutor(data.clearRepoData)
+
+getRepo = runInExecutor(data.getRepo)
+
+
+
+async def iterRepo( status='openclose', portfolio='all', custodian='all', repoName='all'
+				  , broker='all', hasHairCut='all', chunkSize=1000, maturityFrom=None
+				  , maturityTo=None, asOfDate=None):
+	"""
+	Same arguments as data.iterRepo => [AsyncIterator] ([Dictionary] repo transaction)
+
+	Each chunk of transactions is fetched in the thread pool.
+	"""
+	iterator = await runInExecutor(data.iterRepo)( status, portfolio, custodian, repoName
+												 , broker, hasHairCut, chunkSize
+												 , maturityFrom, maturityTo, asOfDate)
+	nextChunk = runInExecutor(lambda: list(islice(iterator, chunkSize)))
+	try:
+		while True:
+			chunk = await nextChunk()
+			if len(chunk) == 0:
+				break
+			for transaction in chunk:
+				yield transaction
+	finally:
+		await runInExecutor(iterator.close)()
+
+
+
+getRepoPage = runInExecutor(data.getRepoPage)
+
+getRepoTransactionHistory = runInExecutor(data.getRepoTransactionHistory)
+
+getRepoTransactionHistoryPage = runInExecutor(data.getRepoTransactionHistoryPage)
+
+getRepoAtTime = runInExecutor(data.getRepoAtTime)
+
+takeRepoSnapshot = runInExecutor(data.takeRepoSnapshot)
+
+getUserTranIdsFromRepoName = runInExecutor(data.getUserTranIdsFromRepoName)
+
+addRepoMaster = runInExecutor(data.addRepoMaster)
+
+addRepoMasters = runInExecutor(data.addRepoMasters)
+
+addRepoTransaction = runInExecutor(data.addRepoTransaction)
+
+addRepoTransactions = runInExecutor(data.addRepoTransactions)
+
+closeRepoTransaction = runInExecutor(data.closeRepoTransaction)
+
+closeRepoTransactions = runInExecutor(data.closeRepoTransactions)
+
+cancelRepoTransaction = runInExecutor(data.cancelRepoTransaction)
+
+cancelRepoTransactions = runInExecutor(data.cancelRepoTransactions)
+
+rerateRepoTransaction = runInExecutor(data.rerateRepoTransaction)
+
+rerateRepoTransactions = runInExecutor(data.rerateRepoTransactions)
+
+isFileIngested = runInExecutor(data.isFileIngested)
+
+addIngestedFile = runInExecutor(data.addIngestedFile)
+
+getIngestedRecordHashes = runInExecutor(data.getIngestedRecordHashes)
+
+addIngestedRecordHashes = runInExecutor(data.addIngestedRecordHashes)
+
+getResultCacheStats = runInExecutor(data.getResultCacheStats)
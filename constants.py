@@ -3,6 +3,7 @@ class Constants:
 	DBMODE_TEST = 0
 	DBMODE_UAT =  1
 	DBMODE_PRODUCTION =  2
+	DBMODE_MEMORY = 3
 	
 	REPO_TRANS_STATUS_OPEN = "open"
 	REPO_TRANS_STATUS_CLOSE = "closed"
@@ -13,5 +14,21 @@ class Constants:
 	REPO_TRANS_HISTORY_ACTION_CANCEL = "cancel"
 	REPO_TRANS_HISTORY_ACTION_RERATE = "rerate"
 
+	#-- state of repo_transactions.maturity_date, which is null unless the state is date.
+	#-- The MaturityDate of getRepo is yyyy-mm-dd, '' for an open repo or 'ERROR' for
+	#-- ActualSettleDate CALC without OpenEnded CALC
+	REPO_TRANS_MATURITY_STATE_DATE = "date"
+	REPO_TRANS_MATURITY_STATE_OPEN = "open"
+	REPO_TRANS_MATURITY_STATE_ERROR = "error"
+
 	#
-	GETREPO_STATUS_OPENCLOSE = "openclose"
\ No newline at end of file
+	GETREPO_STATUS_OPENCLOSE = "openclose"
+
+	#-- result format of getRepo, list of dictionary if not given
+	GETREPO_FORMAT_COLUMNS = "columns"
+	GETREPO_FORMAT_NUMPY = "numpy"
+	GETREPO_FORMAT_PANDAS = "pandas"
+	GETREPO_FORMAT_ARROW = "arrow"
+	#-- result format of getRepo and getRepoTransactionHistory, list of compact
+	#-- read only records instead of dictionaries
+	GETREPO_FORMAT_RECORDS = "records"
\ No newline at end of file
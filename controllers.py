@@ -1,15 +1,32 @@
 # coding=utf-8
 # 
+import base64
+import json
 import logging
+import threading
+from collections import namedtuple
+from datetime import datetime
 from repo_data.constants import Constants
 from repo_data.utils.error_handling import (NoDataClearingInProuctionModeError,
 											InvalidRepoTransactionTypeError,
 											DataStoreNotYetInitializeError)
 from repo_data.utils.database import DBConn
 from repo_data.utils.validator import AppValidatorFactory
+from repo_data.utils import columnar
+from repo_data.utils import records
+from repo_data.utils.ingestion_report import IngestionReport, stage
+from repo_data.services.repo_master_cache import RepoMasterCache
+from repo_data.services.result_cache import ResultCache
 from repo_data.services.repo_master_services import RepoMasterServices
 from repo_data.services.repo_transaction_services import RepoTransactionServices
 from repo_data.services.repo_transaction_history_services import RepoTransactionHistoryServices
+from repo_data.services.repo_ingestion_ledger_services import RepoIngestionLedgerServices
+from repo_data.services.repo_snapshot_services import RepoSnapshotServices
+from repo_data.services.memory_repo_master_services import MemoryRepoMasterServices
+from repo_data.services.memory_repo_transaction_services import MemoryRepoTransactionServices
+from repo_data.services.memory_repo_transaction_history_services import MemoryRepoTransactionHistoryServices
+from repo_data.services.memory_repo_ingestion_ledger_services import MemoryRepoIngestionLedgerServices
+from repo_data.services.memory_repo_snapshot_services import MemoryRepoSnapshotServices
 from cerberus import SchemaError
 
 #-- serivce and DB connection shall be stateless so it is safe to have a singleton
@@ -18,61 +35,182 @@ from cerberus import SchemaError
 #repo_transaction_services = RepoTransactionServices(db)
 #repo_transaction_history_services = RepoTransactionHistoryServices(db)
 
+#-- the services of one datastore mode. It is never changed after creation, so a
+#-- call that has got the bundle keeps using the same services even if another
+#-- thread calls initializeDatastore in the meantime
+ServiceBundle = namedtuple("ServiceBundle", ["dbmode",
+											"repo_master_services",
+											"repo_transaction_services",
+											"repo_transaction_history_services",
+											"repo_ingestion_ledger_services",
+											"repo_snapshot_services",
+											"result_cache"])
+
 class AppController:
 
+	#-- Concurrency: an AppController is safe to share between threads. Each call
+	#-- gets the current service bundle once, and each service method uses its
+	#-- own session (and so its own pooled connection) that is closed before it
+	#-- returns. initializeDatastore swaps the bundle under a lock, calls already
+	#-- in progress finish with the bundle they started with.
+
 	logger = None
-	dbmode = None
-	repo_master_services = None
-	repo_transaction_services = None
-	repo_transaction_history_services = None
 
 	def __init__(self):
 		self.logger = logging.getLogger(__name__)
-		self.dbmode = None
+		self.services = None
+		#-- service bundles by mode, created once and reused
+		self.service_bundles = {}
+		self.lock = threading.Lock()
+
+	@property
+	def dbmode(self):
+		services = self.services
+		return None if services is None else services.dbmode
+
+	@property
+	def repo_master_services(self):
+		return self._get_services().repo_master_services
+
+	@property
+	def repo_transaction_services(self):
+		return self._get_services().repo_transaction_services
+
+	@property
+	def repo_transaction_history_services(self):
+		return self._get_services().repo_transaction_history_services
+
+	@property
+	def repo_ingestion_ledger_services(self):
+		return self._get_services().repo_ingestion_ledger_services
+
+	@property
+	def repo_snapshot_services(self):
+		return self._get_services().repo_snapshot_services
+
+	def _get_services(self):
+		services = self.services
+		if services is None:
+			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
+		return services
 
 	def initializeDatastore(self, mode):
 		if (mode == "production"):
-			self.dbmode = Constants.DBMODE_PRODUCTION
+			dbmode = Constants.DBMODE_PRODUCTION
 			self.logger.info("Change datastore mode to DBMODE_PRODUCTION")
 		elif (mode == "uat"):
-			self.dbmode = Constants.DBMODE_UAT
+			dbmode = Constants.DBMODE_UAT
 			self.logger.info("Change datastore mode to DBMODE_UAT")
+		elif (mode == "memory"):
+			#-- in-memory datastore without database, e.g. for replay and backtesting
+			dbmode = Constants.DBMODE_MEMORY
+			self.logger.info("Change datastore mode to DBMODE_MEMORY")
 		else:
-			self.dbmode = Constants.DBMODE_TEST
+			dbmode = Constants.DBMODE_TEST
 			self.logger.info("Change datastore mode to DBMODE_TEST")
-		db = DBConn.get_db(self.dbmode)
-		self.repo_master_services = RepoMasterServices(db)
-		self.repo_transaction_services = RepoTransactionServices(db)
-		self.repo_transaction_history_services = RepoTransactionHistoryServices(db)
+		with self.lock:
+			services = self.service_bundles.get(dbmode)
+			if services is None:
+				services = self._create_services(dbmode)
+				self.service_bundles[dbmode] = services
+			elif dbmode != Constants.DBMODE_MEMORY:
+				services.repo_transaction_services.master_cache.ttl = \
+					DBConn.get_master_cache_ttl(dbmode)
+				self._configure_result_cache(services.result_cache, dbmode)
+			self.services = services
 		return 0
 
+	def _create_services(self, dbmode):
+		if dbmode == Constants.DBMODE_MEMORY:
+			return ServiceBundle(dbmode,
+								MemoryRepoMasterServices(),
+								MemoryRepoTransactionServices(),
+								MemoryRepoTransactionHistoryServices(),
+								MemoryRepoIngestionLedgerServices(),
+								MemoryRepoSnapshotServices(),
+								None)
+		db = DBConn.get_db(dbmode)
+		#-- repo master cache shared by the services of the same database
+		master_cache = RepoMasterCache.get_instance(db)
+		master_cache.ttl = DBConn.get_master_cache_ttl(dbmode)
+		#-- result cache shared by the services of the same database, so that
+		#-- every write drops the cached results
+		result_cache = ResultCache.get_instance(db)
+		self._configure_result_cache(result_cache, dbmode)
+		return ServiceBundle(dbmode,
+							RepoMasterServices(db, master_cache, result_cache),
+							RepoTransactionServices(db, master_cache, result_cache),
+							RepoTransactionHistoryServices(db, result_cache),
+							RepoIngestionLedgerServices(db),
+							RepoSnapshotServices(db),
+							result_cache)
+
+	def _configure_result_cache(self, result_cache, dbmode):
+		result_cache.max_bytes = DBConn.get_result_cache_size(dbmode)
+		result_cache.ttl = DBConn.get_result_cache_ttl(dbmode)
+		if not result_cache.is_enabled():
+			result_cache.clear()
+
 	def clearRepoData(self):
-		if self.dbmode is None:
-			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
-		print(self.dbmode)
-		if self.dbmode == Constants.DBMODE_PRODUCTION:
+		services = self._get_services()
+		self.logger.debug("clearRepoData under dbmode " + str(services.dbmode))
+		if services.dbmode == Constants.DBMODE_PRODUCTION:
 			error_message = "clearRepoData can only run under DBMODE_TEST mode"
 			self.logger.warn(error_message)
 			raise NoDataClearingInProuctionModeError(error_message)
 		else:
 			self.logger.warn("clear data in repo_transaction_history table")
-			self.repo_transaction_history_services.delete_all()
+			services.repo_transaction_history_services.delete_all()
 			self.logger.warn("clear data in repo_transaction table")
-			self.repo_transaction_services.delete_all()
+			services.repo_transaction_services.delete_all()
 			self.logger.debug("clear data in repo_master")			
-			self.repo_master_services.delete_all()
+			services.repo_master_services.delete_all()
+			self.logger.debug("clear data in repo ingestion ledger")
+			services.repo_ingestion_ledger_services.delete_all()
+			self.logger.debug("clear data in repo snapshots")
+			services.repo_snapshot_services.delete_all()
 			return 0
 			#repo_transaction_history.clear()
 
 	def addRepoMaster(self, master):
-		if self.dbmode is None:
-			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
-		v = AppValidatorFactory().get_validator("addRepoMaster")
-		if not v.validate(master):
+		services = self._get_services()
+		with stage(IngestionReport.STAGE_VALIDATE):
+			v = AppValidatorFactory().get_validator("addRepoMaster")
+			is_valid = v.validate(master)
+		if not is_valid:
 			message = "Input validation error. Details: " + str(v.errors)
 			self.logger.error(message)
 			raise ValueError(message)
-		#-- data parsing
+		data_master = self._to_data_master(master)
+		with stage(IngestionReport.STAGE_DB):
+			services.repo_master_services.create(data_master)
+		return 0
+
+	def addRepoMasters(self, masters, chunkSize=1000):
+		services = self._get_services()
+		#-- result of each master in input order, 0 if added or the exception otherwise
+		results = [None] * len(masters)
+		data_masters = []
+		positions = []
+		#-- validate all masters at once
+		with stage(IngestionReport.STAGE_VALIDATE):
+			errors = AppValidatorFactory().get_batch_validator("addRepoMaster").validate(masters)
+		for i, master in enumerate(masters):
+			if errors[i]:
+				message = "Input validation error. Details: " + str(errors[i])
+				self.logger.error(message)
+				results[i] = ValueError(message)
+				continue
+			data_masters.append(self._to_data_master(master))
+			positions.append(i)
+		with stage(IngestionReport.STAGE_DB):
+			outcomes = services.repo_master_services.create_batch(data_masters, chunkSize)
+		for i, outcome in zip(positions, outcomes):
+			results[i] = outcome
+		return results
+
+	def _to_data_master(self, master):
+		#-- data parsing of a valid master
 		accrualDaysPerMonth = master["AccrualDaysPerMonth"]
 		if master["AccrualDaysPerMonth"].lower() == "actual":
 			accrualDaysPerMonth = "ACT"
@@ -87,19 +225,56 @@ class AppController:
 							"/" + 
 							accrualDaysPerYear
 		}
-		self.repo_master_services.create(data_master)
-		return 0
+		return data_master
 
 	def addRepoTransaction(self, transaction):
-		if self.dbmode is None:
-			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
-		v = AppValidatorFactory().get_validator("addRepoTransaction")
-		#-- validate input fields
-		if not v.validate(transaction):
+		services = self._get_services()
+		data_transaction = self._get_data_transaction(transaction)
+		#-- add to repo_transaction and repo_transaction_history
+		with stage(IngestionReport.STAGE_DB):
+			services.repo_transaction_services.create(data_transaction)
+		return 0
+
+	def addRepoTransactions(self, transactions, chunkSize=1000):
+		services = self._get_services()
+		#-- result of each transaction in input order, 0 if added or the exception otherwise
+		results = [None] * len(transactions)
+		data_transactions = []
+		positions = []
+		#-- validate all transactions at once
+		with stage(IngestionReport.STAGE_VALIDATE):
+			errors = AppValidatorFactory().get_batch_validator("addRepoTransaction").validate(transactions)
+		for i, transaction in enumerate(transactions):
+			if errors[i]:
+				message = "Input validation error. Details: " + str(errors[i])
+				self.logger.error(message)
+				results[i] = ValueError(message)
+				continue
+			try:
+				data_transactions.append(self._to_data_transaction(transaction))
+				positions.append(i)
+			except InvalidRepoTransactionTypeError as e:
+				results[i] = e
+		#-- add valid transactions in chunks, one commit per chunk
+		with stage(IngestionReport.STAGE_DB):
+			outcomes = services.repo_transaction_services.create_batch(data_transactions, chunkSize)
+		for i, outcome in zip(positions, outcomes):
+			results[i] = outcome
+		return results
+
+	def _get_data_transaction(self, transaction):
+		with stage(IngestionReport.STAGE_VALIDATE):
+			v = AppValidatorFactory().get_validator("addRepoTransaction")
+			#-- validate input fields
+			is_valid = v.validate(transaction)
+		if not is_valid:
 			message = "Input validation error. Details: " + str(v.errors)
 			self.logger.error(message)
 			raise ValueError(message)
-		#-- data parsing
+		return self._to_data_transaction(transaction)
+
+	def _to_data_transaction(self, transaction):
+		#-- data parsing of a valid transaction
 		#-- get transaction_type
 		transaction_type = ""
 		if transaction["TransactionType"] == "Repo_InsertUpdate":
@@ -119,14 +294,15 @@ class AppController:
 		if "OpenEnded" in transaction and transaction["OpenEnded"].lower() == "calc":
 			is_open_repo = 1
 		#-- maturity_date
-		maturity_date = ""
+		maturity_date = None
 		if transaction["ActualSettleDate"].lower() == "calc":
 			if is_open_repo:
-				maturity_date = ""
+				maturity_state = Constants.REPO_TRANS_MATURITY_STATE_OPEN
 			else:
-				maturity_date = "ERROR"
+				maturity_state = Constants.REPO_TRANS_MATURITY_STATE_ERROR
 		else:
 			maturity_date = transaction["ActualSettleDate"][0:10]
+			maturity_state = Constants.REPO_TRANS_MATURITY_STATE_DATE
 		#-- create data model
 		data_transaction = {
 			"transaction_id" : transaction["UserTranId1"],
@@ -140,6 +316,7 @@ class AppController:
 			"settle_date" : transaction["SettleDate"][0:10],
 			"is_open_repo" : is_open_repo,
 			"maturity_date" : maturity_date,
+			"maturity_state" : maturity_state,
 			"quantity" :  float(transaction["Quantity"]),
 			"currency" :  transaction["CounterInvestment"],
 			"price" : float(transaction["Price"]),
@@ -151,16 +328,15 @@ class AppController:
 			"haircut" : 0,
 			"status" : Constants.REPO_TRANS_HISTORY_ACTION_OPEN
 		}
-		#-- add to repo_transaction and repo_transaction_history
-		self.repo_transaction_services.create(data_transaction)
-		return 0
+		return data_transaction
 
 	def cancelRepoTransaction(self, transaction):
-		if self.dbmode is None:
-			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
-		v = AppValidatorFactory().get_validator("cancelRepoTransaction")
-		#-- validate input fields
-		if not v.validate(transaction):
+		services = self._get_services()
+		with stage(IngestionReport.STAGE_VALIDATE):
+			v = AppValidatorFactory().get_validator("cancelRepoTransaction")
+			#-- validate input fields
+			is_valid = v.validate(transaction)
+		if not is_valid:
 			message = "Input validation error. Details: " + str(v.errors)
 			self.logger.error(message)
 			raise ValueError(message)
@@ -168,15 +344,43 @@ class AppController:
 		data_transaction = {
 			"transaction_id" : transaction["UserTranId1"]
 		}
-		self.repo_transaction_services.cancel(data_transaction)
+		with stage(IngestionReport.STAGE_DB):
+			services.repo_transaction_services.cancel(data_transaction)
 		return 0
 
+	def cancelRepoTransactions(self, transactions, chunkSize=1000):
+		services = self._get_services()
+		#-- result of each transaction in input order, 0 if canceled or the exception otherwise
+		results = [None] * len(transactions)
+		data_transactions = []
+		positions = []
+		#-- validate all transactions at once
+		with stage(IngestionReport.STAGE_VALIDATE):
+			errors = AppValidatorFactory().get_batch_validator("cancelRepoTransaction").validate(transactions)
+		for i, transaction in enumerate(transactions):
+			if errors[i]:
+				message = "Input validation error. Details: " + str(errors[i])
+				self.logger.error(message)
+				results[i] = ValueError(message)
+				continue
+			#-- create data model
+			data_transactions.append({
+				"transaction_id" : transaction["UserTranId1"]
+			})
+			positions.append(i)
+		with stage(IngestionReport.STAGE_DB):
+			outcomes = services.repo_transaction_services.cancel_batch(data_transactions, chunkSize)
+		for i, outcome in zip(positions, outcomes):
+			results[i] = outcome
+		return results
+
 	def closeRepoTransaction(self, transaction):
-		if self.dbmode is None:
-			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
-		v = AppValidatorFactory().get_validator("closeRepoTransaction")
-		#-- validate input fields
-		if not v.validate(transaction):
+		services = self._get_services()
+		with stage(IngestionReport.STAGE_VALIDATE):
+			v = AppValidatorFactory().get_validator("closeRepoTransaction")
+			#-- validate input fields
+			is_valid = v.validate(transaction)
+		if not is_valid:
 			message = "Input validation error. Details: " + str(v.errors)
 			self.logger.error(message)
 			raise ValueError(message)
@@ -188,15 +392,44 @@ class AppController:
 			"transaction_id" : transaction["UserTranId1"],
 			"maturity_date" : maturity_date
 		}
-		self.repo_transaction_services.close(data_transaction)
+		with stage(IngestionReport.STAGE_DB):
+			services.repo_transaction_services.close(data_transaction)
 		return 0
 
+	def closeRepoTransactions(self, transactions, chunkSize=1000):
+		services = self._get_services()
+		#-- result of each transaction in input order, 0 if closed or the exception otherwise
+		results = [None] * len(transactions)
+		data_transactions = []
+		positions = []
+		#-- validate all transactions at once
+		with stage(IngestionReport.STAGE_VALIDATE):
+			errors = AppValidatorFactory().get_batch_validator("closeRepoTransaction").validate(transactions)
+		for i, transaction in enumerate(transactions):
+			if errors[i]:
+				message = "Input validation error. Details: " + str(errors[i])
+				self.logger.error(message)
+				results[i] = ValueError(message)
+				continue
+			#-- create data model
+			data_transactions.append({
+				"transaction_id" : transaction["UserTranId1"],
+				"maturity_date" : transaction["ActualSettleDate"][0:10]
+			})
+			positions.append(i)
+		with stage(IngestionReport.STAGE_DB):
+			outcomes = services.repo_transaction_services.close_batch(data_transactions, chunkSize)
+		for i, outcome in zip(positions, outcomes):
+			results[i] = outcome
+		return results
+
 	def rerateRepoTransaction(self, transaction):
-		if self.dbmode is None:
-			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
-		v = AppValidatorFactory().get_validator("rerateRepoTransaction")
-		#-- validate input fields
-		if not v.validate(transaction):
+		services = self._get_services()
+		with stage(IngestionReport.STAGE_VALIDATE):
+			v = AppValidatorFactory().get_validator("rerateRepoTransaction")
+			#-- validate input fields
+			is_valid = v.validate(transaction)
+		if not is_valid:
 			message = "Input validation error. Details: " + str(v.errors)
 			self.logger.error(message)
 			raise ValueError(message)
@@ -209,20 +442,88 @@ class AppController:
 			"interest_rate" : transaction["RateTable"]["Rate"],
 			"rate_date" : rate_date
 		}
-		self.repo_transaction_services.rerate(data_transaction)
+		with stage(IngestionReport.STAGE_DB):
+			services.repo_transaction_services.rerate(data_transaction)
 		return 0
 	
+	def rerateRepoTransactions(self, transactions):
+		services = self._get_services()
+		#-- result of each transaction in input order, 0 if rerated or the exception otherwise
+		results = [None] * len(transactions)
+		data_transactions = []
+		positions = []
+		#-- validate all transactions at once
+		with stage(IngestionReport.STAGE_VALIDATE):
+			errors = AppValidatorFactory().get_batch_validator("rerateRepoTransaction").validate(transactions)
+		for i, transaction in enumerate(transactions):
+			if errors[i]:
+				message = "Input validation error. Details: " + str(errors[i])
+				self.logger.error(message)
+				results[i] = ValueError(message)
+				continue
+			#-- create data model
+			data_transactions.append({
+				"transaction_id" : transaction["UserTranId1"],
+				"interest_rate" : transaction["RateTable"]["Rate"],
+				"rate_date" : transaction["RateTable"]["RateDate"][0:10]
+			})
+			positions.append(i)
+		with stage(IngestionReport.STAGE_DB):
+			outcomes = services.repo_transaction_services.rerate_batch(data_transactions)
+		for i, outcome in zip(positions, outcomes):
+			results[i] = outcome
+		return results
+	
 	def getRepo( self, status='openclose', portfolio='all', custodian='all', repo_code='all'
-		   , broker='all', has_hair_cut='all'):
-		if self.dbmode is None:
-			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
+		   , broker='all', has_hair_cut='all', format=None, maturity_from=None, maturity_to=None
+		   , as_of_date=None):
+		services = self._get_services()
+		params = self._get_repo_params( status, portfolio, custodian, repo_code, broker, has_hair_cut
+									  , maturity_from, maturity_to, as_of_date)
+		if format == Constants.GETREPO_FORMAT_RECORDS:
+			transactions = self._query_cached(services, "getRepo", params,
+												services.repo_transaction_services.query)
+			return records.to_records(transactions, records.RepoTransactionRecord)
+		if not format is None:
+			#-- typed columns built from the fetched values
+			columnar.check_format(format)
+			columns = services.repo_transaction_services.query_columns(params)
+			return columnar.to_format(columns, format)
+		transactions = self._query_cached(services, "getRepo", params,
+											services.repo_transaction_services.query)
+		return transactions
+
+	def iterRepo( self, status='openclose', portfolio='all', custodian='all', repo_code='all'
+		   , broker='all', has_hair_cut='all', chunkSize=1000, maturity_from=None, maturity_to=None
+		   , as_of_date=None):
+		services = self._get_services()
+		#-- validate now, not when the iteration starts
+		params = self._get_repo_params( status, portfolio, custodian, repo_code, broker, has_hair_cut
+									  , maturity_from, maturity_to, as_of_date)
+		return services.repo_transaction_services.query_iter(params, chunkSize)
+
+	def getRepoPage( self, status='openclose', portfolio='all', custodian='all', repo_code='all'
+		   , broker='all', has_hair_cut='all', page_size=500, page_token=None
+		   , maturity_from=None, maturity_to=None, as_of_date=None):
+		services = self._get_services()
+		params = self._get_repo_params( status, portfolio, custodian, repo_code, broker, has_hair_cut
+									  , maturity_from, maturity_to, as_of_date)
+		after_id = self._get_page_key("getRepo", page_size, page_token)
+		transactions, last_id = services.repo_transaction_services.query_page(params, page_size, after_id)
+		return transactions, self._get_page_token("getRepo", last_id)
+
+	def _get_repo_params( self, status, portfolio, custodian, repo_code, broker, has_hair_cut
+						, maturity_from=None, maturity_to=None, as_of_date=None):
 		params = {
 			"status" : status,
 			"portfolio" : portfolio,
 			"custodian" : custodian,
 			"repo_code" : repo_code,
 			"broker" : broker,
-			"has_hair_cut" : has_hair_cut
+			"has_hair_cut" : has_hair_cut,
+			"maturity_from" : maturity_from,
+			"maturity_to" : maturity_to,
+			"as_of_date" : as_of_date
 		}
 		v = AppValidatorFactory().get_validator("getRepo")
 		#-- validate input fields
@@ -230,12 +531,10 @@ class AppController:
 			message = "Input validation error. Details: " + str(v.errors)
 			self.logger.error(message)
 			raise ValueError(message)
-		transactions = self.repo_transaction_services.query(params)
-		return transactions
+		return params
 
-	def getRepoTransactionHistory(self, userTranId):
-		if self.dbmode is None:
-			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
+	def getRepoTransactionHistory(self, userTranId, format=None):
+		services = self._get_services()
 		params = {
 			"transaction_id" : userTranId
 		}
@@ -245,12 +544,145 @@ class AppController:
 			message = "Input validation error. Details: " + str(v.errors)
 			self.logger.error(message)
 			raise ValueError(message)
-		transaction_histories = self.repo_transaction_history_services.query(params)
+		if not format is None and not format == Constants.GETREPO_FORMAT_RECORDS:
+			message = "Input validation error. Details: {'format': ['unallowed value " + \
+							str(format) + "']}"
+			self.logger.error(message)
+			raise ValueError(message)
+		transaction_histories = self._query_cached(services, "getRepoTransactionHistory", params,
+													services.repo_transaction_history_services.query)
+		if format == Constants.GETREPO_FORMAT_RECORDS:
+			return records.to_records(transaction_histories, records.RepoTransactionHistoryRecord)
 		return transaction_histories
 
+	def getRepoTransactionHistoryPage(self, userTranId, page_size=500, page_token=None):
+		services = self._get_services()
+		params = {
+			"transaction_id" : userTranId
+		}
+		v = AppValidatorFactory().get_validator("getRepoTransactionHistory")
+		#-- validate input fields
+		if not v.validate(params):
+			message = "Input validation error. Details: " + str(v.errors)
+			self.logger.error(message)
+			raise ValueError(message)
+		after_id = self._get_page_key("getRepoTransactionHistory", page_size, page_token)
+		transaction_histories, last_id = services.repo_transaction_history_services \
+											.query_page(params, page_size, after_id)
+		return transaction_histories, self._get_page_token("getRepoTransactionHistory", last_id)
+
+	def getRepoAtTime( self, time_stamp, status='openclose', portfolio='all', custodian='all'
+					 , repo_code='all', broker='all', has_hair_cut='all'):
+		services = self._get_services()
+		params = {
+			"time_stamp" : time_stamp,
+			"status" : status,
+			"portfolio" : portfolio,
+			"custodian" : custodian,
+			"repo_code" : repo_code,
+			"broker" : broker,
+			"has_hair_cut" : has_hair_cut
+		}
+		v = AppValidatorFactory().get_validator("getRepoAtTime")
+		#-- validate input fields
+		if not v.validate(params):
+			message = "Input validation error. Details: " + str(v.errors)
+			self.logger.error(message)
+			raise ValueError(message)
+		#-- one query with the status and interest rate at the time, replayed from
+		#-- the history in the database. Not cached, as the result cache is for
+		#-- the current states
+		params["time_stamp"] = self._to_time_stamp(time_stamp)
+		params["maturity_from"] = None
+		params["maturity_to"] = None
+		params["as_of_date"] = None
+		return services.repo_transaction_services.query(params)
+
+	def takeRepoSnapshot(self, time_stamp=None):
+		services = self._get_services()
+		params = {
+			"time_stamp" : time_stamp
+		}
+		v = AppValidatorFactory().get_validator("takeRepoSnapshot")
+		#-- validate input fields
+		if not v.validate(params):
+			message = "Input validation error. Details: " + str(v.errors)
+			self.logger.error(message)
+			raise ValueError(message)
+		if not time_stamp is None:
+			time_stamp = self._to_time_stamp(time_stamp)
+		return str(services.repo_snapshot_services.create(time_stamp))
+
+	def _to_time_stamp(self, time_stamp):
+		#-- yyyy-mm-dd HH:MM:SS or yyyy-mm-ddTHH:MM:SS, validated
+		return datetime.strptime(time_stamp.replace("T", " "), "%Y-%m-%d %H:%M:%S")
+
+	def _query_cached(self, services, method_name, params, query):
+		#-- return query(params), from the result cache if it is enabled
+		result_cache = services.result_cache
+		if result_cache is None or not result_cache.is_enabled():
+			return query(params)
+		key = self._get_cache_key(method_name, params)
+		rows = result_cache.get(key)
+		if rows is None:
+			#-- the version before querying, a write in the meantime discards the result
+			version = result_cache.version
+			rows = query(params)
+			result_cache.put(key, version, rows)
+		return rows
+
+	def _get_cache_key(self, method_name, params):
+		#-- the validated params normalized as the query reads them, e.g. status
+		#-- 'OPEN' and 'open', or None and 'all' give the same result
+		key = [method_name]
+		for name in sorted(params):
+			value = params[name]
+			if value is None:
+				value = "all"
+			elif name == "status" or name == "has_hair_cut":
+				value = str(value).lower()
+			key.append((name, value))
+		return tuple(key)
+
+	def getResultCacheStats(self):
+		services = self._get_services()
+		if services.result_cache is None:
+			return None
+		return services.result_cache.get_stats()
+
+	def _get_page_key(self, method_name, page_size, page_token):
+		#-- return the id after which the page starts, None for the first page
+		params = {
+			"page_size" : page_size,
+			"page_token" : page_token
+		}
+		v = AppValidatorFactory().get_validator("getPage")
+		#-- validate input fields
+		if not v.validate(params):
+			message = "Input validation error. Details: " + str(v.errors)
+			self.logger.error(message)
+			raise ValueError(message)
+		if page_token is None:
+			return None
+		#-- the token is the method name and the id of the last record of the previous page
+		try:
+			name, after_id = json.loads(base64.urlsafe_b64decode(page_token.encode()).decode())
+		except Exception:
+			name, after_id = None, None
+		if name != method_name or not isinstance(after_id, int):
+			message = "Input validation error. Details: {'page_token': ['invalid page token']}"
+			self.logger.error(message)
+			raise ValueError(message)
+		return after_id
+
+	def _get_page_token(self, method_name, last_id):
+		#-- None if there is no more page
+		if last_id is None:
+			return None
+		return base64.urlsafe_b64encode(json.dumps([method_name, last_id]).encode()).decode()
+
 	def getUserTranIdsFromRepoName(self, repoName):
-		if self.dbmode is None:
-			raise DataStoreNotYetInitializeError("Plase call initializeDatastore to initialize datastore")
+		services = self._get_services()
 		params = {
 			"repo_code" : repoName
 		}
@@ -260,5 +692,67 @@ class AppController:
 			message = "Input validation error. Details: " + str(v.errors)
 			self.logger.error(message)
 			raise ValueError(message)
-		transaction_ids = self.repo_transaction_services.getUserTranIdsFromRepoName(params)
-		return transaction_ids
\ No newline at end of file
+		transaction_ids = services.repo_transaction_services.getUserTranIdsFromRepoName(params)
+		return transaction_ids
+
+	def isFileIngested(self, fileHash):
+		services = self._get_services()
+		params = {
+			"file_hash" : fileHash
+		}
+		v = AppValidatorFactory().get_validator("isFileIngested")
+		#-- validate input fields
+		if not v.validate(params):
+			message = "Input validation error. Details: " + str(v.errors)
+			self.logger.error(message)
+			raise ValueError(message)
+		with stage(IngestionReport.STAGE_DB):
+			return services.repo_ingestion_ledger_services.has_file(params["file_hash"])
+
+	def addIngestedFile(self, ingestedFile):
+		services = self._get_services()
+		v = AppValidatorFactory().get_validator("addIngestedFile")
+		#-- validate input fields
+		if not v.validate(ingestedFile):
+			message = "Input validation error. Details: " + str(v.errors)
+			self.logger.error(message)
+			raise ValueError(message)
+		#-- create data model
+		data_ingested_file = {
+			"file_hash" : ingestedFile["FileHash"],
+			"file_name" : ingestedFile["FileName"],
+			"file_type" : ingestedFile["FileType"],
+			"record_count" : ingestedFile["RecordCount"]
+		}
+		with stage(IngestionReport.STAGE_DB):
+			services.repo_ingestion_ledger_services.add_file(data_ingested_file)
+		return 0
+
+	def getIngestedRecordHashes(self, recordHashes):
+		services = self._get_services()
+		params = {
+			"record_hashes" : recordHashes
+		}
+		v = AppValidatorFactory().get_validator("getIngestedRecordHashes")
+		#-- validate input fields
+		if not v.validate(params):
+			message = "Input validation error. Details: " + str(v.errors)
+			self.logger.error(message)
+			raise ValueError(message)
+		with stage(IngestionReport.STAGE_DB):
+			return services.repo_ingestion_ledger_services.query_records(params["record_hashes"])
+
+	def addIngestedRecordHashes(self, recordHashes):
+		services = self._get_services()
+		params = {
+			"record_hashes" : recordHashes
+		}
+		v = AppValidatorFactory().get_validator("addIngestedRecordHashes")
+		#-- validate input fields
+		if not v.validate(params):
+			message = "Input validation error. Details: " + str(v.errors)
+			self.logger.error(message)
+			raise ValueError(message)
+		with stage(IngestionReport.STAGE_DB):
+			services.repo_ingestion_ledger_services.add_records(params["record_hashes"])
+		return 0
\ No newline at end of file
@@ -5,22 +5,26 @@ from repo_data.constants import Constants
 from repo_data.controllers import AppController
 
 #controller supposed to be stateless so it is safe to have a singleton , one for all users 
+#the functions below are safe to call from multiple threads, a call in progress keeps
+#using the datastore it started with even if initializeDatastore is called meanwhile
 controller = AppController()
 
 def initializeDatastore(mode):
 	"""
-	[String] mode ('production' means produciton mode, test mode otherwise)
+	[String] mode ('production' means produciton mode, 'memory' means an
+	in-memory data store without database, test mode otherwise)
 
 	side effect: initialize the underlying data store in test or production
-	mode.
+	mode, or in memory. The in-memory data store is shared by the whole
+	process and lost when it exits.
 	"""
 	return controller.initializeDatastore(mode)
 	
 
 def clearRepoData():
 	"""
-	Clears all the data in the repo master, repo transaction, and repo
-	transaction history.
+	Clears all the data in the repo master, repo transaction, repo
+	transaction history and the ingestion ledger.
 
 	Throws NoDataClearingInProuctionMode if the underlying datastore is
 	in production mode.
@@ -30,19 +34,139 @@ def clearRepoData():
 
 
 def getRepo( status='openclose', portfolio='all', custodian='all', repoName='all'
-		   , broker='all', hasHairCut='all'):
+		   , broker='all', hasHairCut='all', format=None, maturityFrom=None, maturityTo=None
+		   , asOfDate=None):
 	"""
 	[String] date (yyyy-mm-dd) => [Iterable] repo transactions
+
+	maturityFrom and maturityTo (yyyy-mm-dd, optional) keep the repo
+	transactions maturing within the dates, inclusive. Open repos and those
+	with MaturityDate 'ERROR' have no maturity date, so they are excluded
+	once either date is given.
+
+	asOfDate (yyyy-mm-dd, optional) returns the repo transactions settled on
+	or before the date, with their Status as of the date: canceled if
+	canceled on or before it, closed if closed or matured on or before it,
+	open otherwise. The status filter applies to that Status, e.g.
+	getRepo('open', asOfDate='2020-03-31') for the repos open at the end of
+	March.
+
+	format (optional) returns the repo transactions as typed columns instead
+	of a list of dictionary:
+
+	'records': [List] ([Mapping] repo transaction), compact read only
+		records with the same keys as the dictionaries
+	'columns': [Dictionary] column name => [List] values
+	'numpy': [Dictionary] column name => [numpy.ndarray] values
+	'pandas': [pandas.DataFrame]
+	'arrow': [pyarrow.Table]
+
+	TradeDate and SettleDate are dates (datetime64[D] for numpy), amounts are
+	floats, IsOpenRepo is bool and the others are strings. numpy, pandas and
+	pyarrow are optional, ImportError is raised if the one needed is not
+	installed.
+	"""
+	return controller.getRepo( status, portfolio, custodian, repoName, broker, hasHairCut, format
+							 , maturityFrom, maturityTo, asOfDate)
+
+
+
+def iterRepo( status='openclose', portfolio='all', custodian='all', repoName='all'
+			, broker='all', hasHairCut='all', chunkSize=1000, maturityFrom=None, maturityTo=None
+			, asOfDate=None):
+	"""
+	[String] status, portfolio, custodian, repoName, broker, hasHairCut (same
+	as getRepo), [Int] chunk size, [String] maturityFrom, maturityTo, asOfDate
+	(same as getRepo)
+		=> [Iterator] ([Dictionary] repo transaction)
+
+	Same result as getRepo, but the repo transactions are fetched chunkSize
+	rows at a time while iterating, so the memory used does not grow with
+	the no. of transactions. The database session is held until the
+	iterator is exhausted or closed, use contextlib.closing to release it
+	early.
 	"""
-	return controller.getRepo(status, portfolio, custodian, repoName, broker, hasHairCut)
+	return controller.iterRepo( status, portfolio, custodian, repoName, broker
+							  , hasHairCut, chunkSize, maturityFrom, maturityTo, asOfDate)
 
 
 
-def getRepoTransactionHistory(userTranId):
+def getRepoPage( status='openclose', portfolio='all', custodian='all', repoName='all'
+			   , broker='all', hasHairCut='all', pageSize=500, pageToken=None
+			   , maturityFrom=None, maturityTo=None, asOfDate=None):
 	"""
-	[String] userTranId	=> [Iterable] ([Dictionary] transaction)
+	[String] status, portfolio, custodian, repoName, broker, hasHairCut (same
+	as getRepo), [Int] page size, [String] page token (None for the first page),
+	[String] maturityFrom, maturityTo, asOfDate (same as getRepo)
+		=> [Tuple] ([List] repo transactions, [String] token of the next page,
+					None if this is the last page)
+
+	Pages of getRepo in a fixed order. Pass the returned token with the same
+	filters to get the next page, each page costs the same however deep it
+	is. Repo transactions added after the first page are included in later
+	pages.
 	"""
-	return controller.getRepoTransactionHistory(userTranId)
+	return controller.getRepoPage( status, portfolio, custodian, repoName, broker
+								 , hasHairCut, pageSize, pageToken, maturityFrom, maturityTo, asOfDate)
+
+
+
+def getRepoTransactionHistory(userTranId, format=None):
+	"""
+	[String] userTranId, [String] format (optional)
+		=> [Iterable] ([Dictionary] transaction)
+
+	format 'records' returns compact read only records (Mapping) with the
+	same keys instead of dictionaries.
+	"""
+	return controller.getRepoTransactionHistory(userTranId, format)
+
+
+
+def getRepoTransactionHistoryPage(userTranId, pageSize=500, pageToken=None):
+	"""
+	[String] userTranId, [Int] page size, [String] page token (None for the
+	first page)
+		=> [Tuple] ([List] ([Dictionary] transaction history), [String] token
+					of the next page, None if this is the last page)
+
+	Pages of the transaction history in the order added.
+	"""
+	return controller.getRepoTransactionHistoryPage(userTranId, pageSize, pageToken)
+
+
+
+def getRepoAtTime( timeStamp, status='openclose', portfolio='all', custodian='all'
+				 , repoName='all', broker='all', hasHairCut='all'):
+	"""
+	[String] time stamp (yyyy-mm-dd HH:MM:SS), [String] status ('all',
+	'openclose', 'open', 'closed' or 'canceled'), portfolio, custodian,
+	repoName, broker, hasHairCut (same as getRepo)
+		=> [Iterable] ([Dictionary] repo transaction)
+
+	The repo transactions as recorded at the time, for audit: those added
+	on or before it, with Status and InterestRate replayed from the
+	transaction history recorded on or before it (TimeStamp of
+	getRepoTransactionHistory, by the clock of the database). The replay
+	starts from the nearest snapshot before the time, see takeRepoSnapshot.
+	"""
+	return controller.getRepoAtTime( timeStamp, status, portfolio, custodian, repoName
+								   , broker, hasHairCut)
+
+
+
+def takeRepoSnapshot(timeStamp=None):
+	"""
+	[String] time stamp (yyyy-mm-dd HH:MM:SS, optional, the last second if
+	not given) => [String] time stamp of the snapshot
+
+	side effect: store the status and interest rate of all repo
+	transactions at the time, so that getRepoAtTime replays only the
+	history recorded after it. Call it periodically, e.g. after each
+	day's ingestion. The time must be in the past, as the history of the
+	current second may still grow.
+	"""
+	return controller.takeRepoSnapshot(timeStamp)
 
 
 
@@ -66,6 +190,19 @@ def addRepoMaster(master):
 
 
 
+def addRepoMasters(masters, chunkSize=1000):
+	"""
+	[Iterable] ([Dictionary] master), [Int] chunk size
+		=> [List] result of each master, 0 if added, the exception otherwise
+
+	Side effect: add the repo masters to datastore in chunks, one commit per
+	chunk. A bad master does not stop the rest from being added, its exception
+	(ValueError, RepoMasterAlreadyExistError) is returned in its place instead.
+	"""
+	return controller.addRepoMasters(list(masters), chunkSize)
+
+
+
 def addRepoTransaction(transaction):
 	"""
 	[Dictionary] transaction
@@ -79,6 +216,21 @@ def addRepoTransaction(transaction):
 
 
 
+def addRepoTransactions(transactions, chunkSize=1000):
+	"""
+	[Iterable] ([Dictionary] transaction), [Int] chunk size
+		=> [List] result of each transaction, 0 if added, the exception otherwise
+
+	Side effect: add the repo transactions to datastore in chunks, one commit
+	per chunk. Unlike addRepoTransaction, a bad transaction does not stop the
+	rest from being added, its exception (ValueError, InvalidRepoTransactionTypeError,
+	RepoTransactionAlreadyExistError, RepoMasterNotExistError) is returned
+	in its place instead.
+	"""
+	return controller.addRepoTransactions(list(transactions), chunkSize)
+
+
+
 def closeRepoTransaction(transaction):
 	"""
 	[Dictionary] transaction
@@ -92,6 +244,22 @@ def closeRepoTransaction(transaction):
 
 
 
+def closeRepoTransactions(transactions, chunkSize=1000):
+	"""
+	[Iterable] ([Dictionary] transaction), [Int] chunk size
+		=> [List] result of each transaction, 0 if closed, the exception otherwise
+
+	Side effect: close the repo transactions in datastore, chunkSize sets the
+	size of the IN lists of the updates and of the history inserts. If the
+	batch fails, each transaction is closed again with its own commit. A bad
+	transaction does not stop the rest, its exception (ValueError,
+	RepoTransactionNotExistError, CloseCanceledRepoTransactionError) is
+	returned in its place instead.
+	"""
+	return controller.closeRepoTransactions(list(transactions), chunkSize)
+
+
+
 def cancelRepoTransaction(transaction):
 	"""
 	[Dictionary] transaction
@@ -104,6 +272,21 @@ def cancelRepoTransaction(transaction):
 
 
 
+def cancelRepoTransactions(transactions, chunkSize=1000):
+	"""
+	[Iterable] ([Dictionary] transaction), [Int] chunk size
+		=> [List] result of each transaction, 0 if canceled, the exception otherwise
+
+	Side effect: cancel the repo transactions in datastore, chunkSize sets the
+	size of the IN lists of the updates and of the history inserts. If the
+	batch fails, each transaction is canceled again with its own commit. A bad
+	transaction does not stop the rest, its exception (ValueError,
+	RepoTransactionNotExistError) is returned in its place instead.
+	"""
+	return controller.cancelRepoTransactions(list(transactions), chunkSize)
+
+
+
 def rerateRepoTransaction(transaction):
 	"""
 	[Dictionary] transaction
@@ -113,3 +296,73 @@ def rerateRepoTransaction(transaction):
 	Throws: RepoTransactionNotExistError
 	"""
 	return controller.rerateRepoTransaction(transaction)
+
+
+
+def rerateRepoTransactions(transactions):
+	"""
+	[Iterable] ([Dictionary] transaction)
+		=> [List] result of each transaction, 0 if rerated, the exception otherwise
+
+	Side effect: update the interest rate of the repo transactions in datastore.
+	The rerates are grouped by UserTranId1 and sorted by RateDate, one history
+	record is added for each rerate, and each repo transaction is updated once
+	with the rate of its latest RateDate. If the batch fails, each rerate is
+	done again with its own commit. A bad rerate does not stop the rest,
+	its exception (ValueError, RepoTransactionNotExistError,
+	CloseCanceledRepoTransactionError) is returned in its place instead.
+	"""
+	return controller.rerateRepoTransactions(list(transactions))
+
+
+
+def isFileIngested(fileHash):
+	"""
+	[String] file hash (sha256 hex digest of the file content)
+		=> [Bool] whether the file has been recorded in the ingestion ledger
+	"""
+	return controller.isFileIngested(fileHash)
+
+
+
+def addIngestedFile(ingestedFile):
+	"""
+	[Dictionary] ingested file (FileHash, FileName, FileType, RecordCount)
+
+	Side effect: record the file in the ingestion ledger
+	"""
+	return controller.addIngestedFile(ingestedFile)
+
+
+
+def getIngestedRecordHashes(recordHashes):
+	"""
+	[Iterable] ([String] record hash)
+		=> [Set] ([String] record hash) those recorded in the ingestion ledger
+	"""
+	return controller.getIngestedRecordHashes(list(recordHashes))
+
+
+
+def addIngestedRecordHashes(recordHashes):
+	"""
+	[Iterable] ([String] record hash)
+
+	Side effect: record the record hashes in the ingestion ledger
+	"""
+	return controller.addIngestedRecordHashes(list(recordHashes))
+
+
+
+def getResultCacheStats():
+	"""
+	=> [Dictionary] hits, misses, entries, bytes and version of the result
+		cache of getRepo and getRepoTransactionHistory, None in memory mode
+
+	The cache is enabled by result_cache_size (bytes) in the section of the
+	mode in database_config.ini. Results are cached by their (normalized)
+	arguments, least recently used ones are evicted beyond the size, and
+	every write of this process drops them. Writes of other processes are
+	not seen until result_cache_ttl (seconds, optional) expires them.
+	"""
+	return controller.getResultCacheStats()
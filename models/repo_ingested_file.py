@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint, func, text
+from sqlalchemy.ext.declarative import declarative_base
+
+BaseModel = declarative_base(name='BaseModel')
+
+class RepoIngestedFile(BaseModel):
+	__tablename__ = "repo_ingested_files"
+	__table_args__ = (
+		UniqueConstraint("file_hash", name="udx_repo_ingested_files__file_hash"),
+		{
+			"mysql_engine" : "InnoDB",
+			"mysql_charset" : "utf8mb4",
+			"mysql_collate" : "utf8mb4_unicode_ci"
+		}
+	)
+	id = Column(Integer, primary_key=True)
+	file_hash = Column(String(64), nullable=False)
+	file_name = Column(String(255), nullable=False)
+	file_type = Column(String(20), nullable=False)
+	record_count = Column(Integer, nullable=False, server_default=text("0"))
+	created_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+	updated_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"),
+						onupdate=func.now())
+
+	def __init__(self, \
+				file_hash, \
+				file_name, \
+				file_type, \
+				record_count):
+		self.file_hash = file_hash
+		self.file_name = file_name
+		self.file_type = file_type
+		self.record_count = record_count
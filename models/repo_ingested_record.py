@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint, func, text
+from sqlalchemy.ext.declarative import declarative_base
+
+BaseModel = declarative_base(name='BaseModel')
+
+class RepoIngestedRecord(BaseModel):
+	__tablename__ = "repo_ingested_records"
+	__table_args__ = (
+		UniqueConstraint("record_hash", name="udx_repo_ingested_records__record_hash"),
+		{
+			"mysql_engine" : "InnoDB",
+			"mysql_charset" : "utf8mb4",
+			"mysql_collate" : "utf8mb4_unicode_ci"
+		}
+	)
+	id = Column(Integer, primary_key=True)
+	record_hash = Column(String(64), nullable=False)
+	created_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+	updated_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"),
+						onupdate=func.now())
+
+	def __init__(self, record_hash):
+		self.record_hash = record_hash
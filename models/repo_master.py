@@ -1,17 +1,28 @@
 # from repo_data.models.base_model import BaseModel, ModelException
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint, func, text
 from sqlalchemy.ext.declarative import declarative_base
 
 BaseModel = declarative_base(name='BaseModel')
 
 class RepoMaster(BaseModel):
 	__tablename__ = "repo_masters"
+	__table_args__ = (
+		UniqueConstraint("code", name="udx_repo_masters__code"),
+		{
+			"mysql_engine" : "InnoDB",
+			"mysql_charset" : "utf8mb4",
+			"mysql_collate" : "utf8mb4_unicode_ci"
+		}
+	)
 	id = Column(Integer, primary_key=True)
-	code = Column(String(100))
-	currency = Column(String(5))
+	code = Column(String(100), nullable=False)
+	currency = Column(String(5), nullable=False)
 	date_count = Column(String(100))
-	created_at = Column(DateTime)
-	updated_at = Column(DateTime)
+	created_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+	updated_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"),
+						onupdate=func.now())
+	created_by = Column(Integer)
+	updated_by = Column(Integer)
 
 	def __init__(self, code, currency, date_count):
 		self.code = code
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, DateTime, UniqueConstraint, func, text
+from sqlalchemy.ext.declarative import declarative_base
+
+BaseModel = declarative_base(name='BaseModel')
+
+class RepoSnapshot(BaseModel):
+	#-- the state of all repo transactions at time_stamp, replayed from the
+	#-- repo transaction history up to history_id, the last history recorded
+	#-- (created_at) on or before time_stamp when the snapshot was taken. A
+	#-- history committed later may still be recorded before time_stamp, so
+	#-- the history after the snapshot is the history of id > history_id, not
+	#-- created_at > time_stamp. The states are in repo_snapshot_transactions
+	__tablename__ = "repo_snapshots"
+	__table_args__ = (
+		UniqueConstraint("time_stamp", name="udx_repo_snapshots__time_stamp"),
+		{
+			"mysql_engine" : "InnoDB",
+			"mysql_charset" : "utf8mb4",
+			"mysql_collate" : "utf8mb4_unicode_ci"
+		}
+	)
+	id = Column(Integer, primary_key=True)
+	time_stamp = Column(DateTime, nullable=False)
+	history_id = Column(Integer, nullable=False, server_default=text("0"))
+	transaction_count = Column(Integer, nullable=False, server_default=text("0"))
+	created_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+	updated_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"),
+						onupdate=func.now())
+
+	def __init__(self, \
+				time_stamp, \
+				history_id, \
+				transaction_count):
+		self.time_stamp = time_stamp
+		self.history_id = history_id
+		self.transaction_count = transaction_count
@@ -0,0 +1,57 @@
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, UniqueConstraint, func, text
+from sqlalchemy.ext.declarative import declarative_base
+from repo_data.constants import Constants
+
+BaseModel = declarative_base(name='BaseModel')
+
+class RepoSnapshotTransaction(BaseModel):
+	#-- status and interest rate of a repo transaction in a repo snapshot
+	__tablename__ = "repo_snapshot_transactions"
+	__table_args__ = (
+		UniqueConstraint("snapshot_id", "transaction_id",
+						name="udx_repo_snapshot_transactions__snapshot_id_transaction_id"),
+		{
+			"mysql_engine" : "InnoDB",
+			"mysql_charset" : "utf8mb4",
+			"mysql_collate" : "utf8mb4_unicode_ci"
+		}
+	)
+	id = Column(Integer, primary_key=True)
+	snapshot_id = Column(Integer, nullable=False)
+	transaction_id = Column(String(20), nullable=False)
+	status = Column(String(10), nullable=False)
+	interest_rate = Column(Numeric(18, 6, asdecimal=False), nullable=False)
+	created_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+	updated_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"),
+						onupdate=func.now())
+
+	def __init__(self, \
+				snapshot_id, \
+				transaction_id, \
+				status, \
+				interest_rate):
+		self.snapshot_id = snapshot_id
+		self.transaction_id = transaction_id
+		self.status = status
+		self.interest_rate = interest_rate
+
+	@staticmethod
+	def replay(states, histories):
+		#-- apply the repo transaction histories (transaction_id, action, interest_rate),
+		#-- in the order added, to the states transaction_id => (status, interest_rate)
+		#-- as the services change repo_transactions. Return the states
+		for transaction_id, action, interest_rate in histories:
+			if action == Constants.REPO_TRANS_HISTORY_ACTION_OPEN:
+				states[transaction_id] = (Constants.REPO_TRANS_STATUS_OPEN, float(interest_rate))
+				continue
+			state = states.get(transaction_id)
+			if state is None:
+				#-- no open before, not a repo transaction yet
+				continue
+			if action == Constants.REPO_TRANS_HISTORY_ACTION_CLOSE:
+				states[transaction_id] = (Constants.REPO_TRANS_STATUS_CLOSE, state[1])
+			elif action == Constants.REPO_TRANS_HISTORY_ACTION_CANCEL:
+				states[transaction_id] = (Constants.REPO_TRANS_STATUS_CANCEL, state[1])
+			elif action == Constants.REPO_TRANS_HISTORY_ACTION_RERATE:
+				states[transaction_id] = (state[0], float(interest_rate))
+		return states
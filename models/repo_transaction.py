@@ -1,34 +1,60 @@
-from sqlalchemy import Column, Integer, String, DateTime, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, Index, UniqueConstraint, func, text
 from sqlalchemy.ext.declarative import declarative_base
+from repo_data.constants import Constants
+from repo_data.models.types import StringDate, StringDateTime
 
 BaseModel = declarative_base(name='BaseModel')
 
 class RepoTransaction(BaseModel):
 	__tablename__ = "repo_transactions"
+	__table_args__ = (
+		Index("idx_repo_transactions__repo_code", "repo_code"),
+		#-- indexes of the getRepo filters, so that any combination of them is
+		#-- an index search (see tests/test_query_plan.py and sql/migrate_getrepo_indexes.sql)
+		Index("idx_repo_transactions__status_portfolio", "status", "portfolio"),
+		Index("idx_repo_transactions__portfolio", "portfolio"),
+		Index("idx_repo_transactions__custodian_status", "custodian", "status"),
+		Index("idx_repo_transactions__broker_status", "broker", "status"),
+		Index("idx_repo_transactions__haircut_status", "haircut", "status"),
+		#-- maturity windows are range scans of maturity_date, after the status if given
+		Index("idx_repo_transactions__maturity_date", "maturity_date"),
+		Index("idx_repo_transactions__status_maturity_date", "status", "maturity_date"),
+		#-- getRepo as of a date keeps the transactions settled on or before it
+		Index("idx_repo_transactions__settle_date", "settle_date"),
+		UniqueConstraint("transaction_id", name="udx_repo_transactions__transaction_id"),
+		{
+			"mysql_engine" : "InnoDB",
+			"mysql_charset" : "utf8mb4",
+			"mysql_collate" : "utf8mb4_unicode_ci"
+		}
+	)
 	id = Column(Integer, primary_key=True)
-	transaction_id = Column(String(20))
+	transaction_id = Column(String(20), nullable=False)
 	transaction_type = Column(String(100))
 	portfolio = Column(String(100))
 	custodian = Column(String(100))
 	collateral_id_type = Column(String(100))
 	collateral_id = Column(String(100))
 	collateral_global_id = Column(String(100))
-	trade_date = Column(DateTime)
-	settle_date = Column(DateTime)
-	is_open_repo = Column(Integer)
-	maturity_date = Column(String(100))
-	quantity = Column(Numeric(asdecimal=False))
-	currency = Column(String(5))
-	price = Column(Numeric(asdecimal=False))
-	collateral_value = Column(Numeric(asdecimal=False))
-	repo_code = Column(String(100))
-	interest_rate = Column(Numeric(asdecimal=False))
-	loan_amount = Column(Numeric(asdecimal=False))
+	trade_date = Column(StringDateTime, nullable=False)
+	settle_date = Column(StringDateTime, nullable=False)
+	is_open_repo = Column(Integer, nullable=False, server_default=text("0"))
+	#-- null for an open repo or a maturity in error, see maturity_state
+	maturity_date = Column(StringDate)
+	maturity_state = Column(String(10), nullable=False)
+	quantity = Column(Numeric(18, 6, asdecimal=False), nullable=False)
+	currency = Column(String(5), nullable=False)
+	price = Column(Numeric(18, 6, asdecimal=False), nullable=False)
+	collateral_value = Column(Numeric(18, 6, asdecimal=False), nullable=False)
+	repo_code = Column(String(100), nullable=False)
+	interest_rate = Column(Numeric(18, 6, asdecimal=False), nullable=False)
+	loan_amount = Column(Numeric(18, 6, asdecimal=False), nullable=False)
 	broker = Column(String(100))
-	haircut = Column(Numeric(asdecimal=False))
-	status = Column(String(10))
-	created_at = Column(DateTime)
-	updated_at = Column(DateTime)
+	haircut = Column(Numeric(18, 6, asdecimal=False), nullable=False)
+	status = Column(String(10), nullable=False)
+	created_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+	updated_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"),
+						onupdate=func.now())
 	created_by = Column(Integer)
 	updated_by = Column(Integer)
 
@@ -44,6 +70,7 @@ class RepoTransaction(BaseModel):
 				settle_date, \
 				is_open_repo, \
 				maturity_date, \
+				maturity_state, \
 				quantity, \
 				currency, \
 				price, \
@@ -65,6 +92,7 @@ class RepoTransaction(BaseModel):
 		self.settle_date = settle_date
 		self.is_open_repo = is_open_repo
 		self.maturity_date = maturity_date
+		self.maturity_state = maturity_state
 		self.quantity = quantity
 		self.currency =currency
 		self.price = price
@@ -76,6 +104,15 @@ class RepoTransaction(BaseModel):
 		self.haircut = haircut
 		self.status = status
 
+	@staticmethod
+	def get_maturity_date_string(maturity_date, maturity_state):
+		#-- return MaturityDate of getRepo, yyyy-mm-dd, '' for an open repo or 'ERROR'
+		if maturity_state == Constants.REPO_TRANS_MATURITY_STATE_OPEN:
+			return ""
+		elif maturity_state == Constants.REPO_TRANS_MATURITY_STATE_ERROR:
+			return "ERROR"
+		return str(maturity_date)[0:10]
+
 	def __repr__(self):
 		res = {}
 		columns = [m.key for m in model.__table__.columns]
@@ -1,17 +1,32 @@
-from sqlalchemy import Column, Integer, String, DateTime, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, Index, func, text
 from sqlalchemy.ext.declarative import declarative_base
+from repo_data.models.types import StringDateTime
 
 BaseModel = declarative_base(name='BaseModel')
 
 class RepoTransactionHistory(BaseModel):
 	__tablename__ = "repo_transaction_history"
+	__table_args__ = (
+		Index("idx_repo_transaction_history__transaction_id", "transaction_id"),
+		Index("idx_repo_transaction_history__action", "action"),
+		#-- the close or cancel of a transaction on or before a date, for getRepo as of a date
+		Index("idx_repo_transaction_history__transaction_id_action_date", "transaction_id", "action", "date"),
+		#-- the histories recorded after a repo snapshot, for getRepoAtTime
+		Index("idx_repo_transaction_history__created_at", "created_at"),
+		{
+			"mysql_engine" : "InnoDB",
+			"mysql_charset" : "utf8mb4",
+			"mysql_collate" : "utf8mb4_unicode_ci"
+		}
+	)
 	id = Column(Integer, primary_key=True)
-	transaction_id = Column(String(20))
-	action = Column(String(10))
-	date = Column(DateTime)
-	interest_rate = Column(Numeric(asdecimal=False))
-	created_at = Column(DateTime)
-	updated_at = Column(DateTime)
+	transaction_id = Column(String(20), nullable=False)
+	action = Column(String(10), nullable=False)
+	date = Column(StringDateTime, nullable=False)
+	interest_rate = Column(Numeric(18, 6, asdecimal=False), nullable=False)
+	created_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+	updated_at = Column(DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"),
+						onupdate=func.now())
 	created_by = Column(Integer)
 	updated_by = Column(Integer)
 
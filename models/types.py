@@ -0,0 +1,26 @@
+from datetime import datetime
+from sqlalchemy import Date, DateTime
+from sqlalchemy.types import TypeDecorator
+
+class StringDateTime(TypeDecorator):
+	#-- DateTime column that also accepts date strings such as "2018-08-27",
+	#-- "2018-08-27T00:00:00" or "2018-08-27 00:00:00". MySQL converts
+	#-- such strings itself, but other databases like SQLite do not
+	impl = DateTime
+
+	def process_bind_param(self, value, dialect):
+		if isinstance(value, str):
+			if len(value) <= 10:
+				return datetime.strptime(value, '%Y-%m-%d')
+			return datetime.strptime(value[0:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S')
+		return value
+
+class StringDate(TypeDecorator):
+	#-- Date column that also accepts date strings such as "2018-08-27" or
+	#-- "2018-08-27T00:00:00", as StringDateTime
+	impl = Date
+
+	def process_bind_param(self, value, dialect):
+		if isinstance(value, str):
+			return datetime.strptime(value[0:10], '%Y-%m-%d').date()
+		return value
@@ -11,13 +11,21 @@ from aim_xml.repo_xml import getRawDataFromXML, getRepoTradeFromFile \
 							, getRepoRerateFromFile
 from steven_utils.utility import mergeDict
 from repo_data.data import addRepoMaster, addRepoTransaction \
-						, cancelRepoTransaction, closeRepoTransaction \
-						, rerateRepoTransaction, initializeDatastore \
-						, clearRepoData, getRepo
+						, addRepoTransactions, cancelRepoTransaction, closeRepoTransaction \
+						, rerateRepoTransaction, rerateRepoTransactions, initializeDatastore \
+						, clearRepoData, getRepo, isFileIngested, addIngestedFile \
+						, getIngestedRecordHashes, addIngestedRecordHashes
 from repo_data.utils.error_handling import RepoMasterAlreadyExistError \
 						, RepoTransactionAlreadyExistError
+from repo_data.utils.ingestion_report import IngestionReport, active_report \
+						, get_active_report, stage, add_error
 from toolz.functoolz import compose
 from functools import partial
+from itertools import groupby, chain
+from toolz.itertoolz import partition_all
+from xml.etree.ElementTree import XMLPullParser
+from concurrent.futures import ProcessPoolExecutor
+import codecs, hashlib, json, os, re, sys, time
 import logging
 logger = logging.getLogger(__name__)
 
@@ -32,41 +40,154 @@ keepKeys = lambda keys, d: \
 
 
 
-def saveRepoMasterFileToDB(file):
+# result of a record already in datastore (the repo master or repo transaction
+# exists), neither saved (1) nor failed (0)
+ALREADY_EXIST = -1
+
+
+
+"""
+	[Iterable] ([Int] result of each record) => [Int] no. of records saved
+"""
+countSaved = lambda results: \
+	sum(1 for result in results if result == 1)
+
+
+
+def timeParse(reader):
+	"""
+	[Function] ([String] file => [Iterable] records)
+		=> [Function] ([String] file => [Iterable] records)
+
+	If there is an active ingestion report, the time used in reading the
+	file and each record is added to its parse stage.
+	"""
+	def timedReader(file):
+		if get_active_report() is None:
+			yield from reader(file)
+			return
+
+		with stage(IngestionReport.STAGE_PARSE):
+			records = iter(reader(file))
+		while True:
+			with stage(IngestionReport.STAGE_PARSE):
+				record = next(records, None)
+			if record is None:
+				break
+			yield record
+
+	return timedReader
+
+
+
+def timeRecord(recordId, saveRecord):
+	"""
+	[Function] ([Dictionary] record => [String] record id),
+	[Function] ([Dictionary] record => [Int] result)
+		=> [Function] ([Dictionary] record => [Int] result)
+
+	If there is an active ingestion report, the time used in saving each
+	record, its result, and the exception (if any) are added to the report.
+	"""
+	def timedSaveRecord(record):
+		if get_active_report() is None:
+			return saveRecord(record)
+
+		start = time.perf_counter()
+		try:
+			result = saveRecord(record)
+		except Exception as e:
+			add_error(e)
+			recordResult(recordId(record), time.perf_counter() - start, 0)
+			raise
+
+		recordResult(recordId(record), time.perf_counter() - start, result)
+		return result
+
+	return timedSaveRecord
+
+
+
+def recordResult(recordId, seconds, result):
+	"""
+	[String] record id, [Float] seconds used (None if not timed), [Int] result
+
+	Side effect: add the record to the active ingestion report, if any.
 	"""
-	[String] repo master file (without Geneva header) 
+	report = get_active_report()
+	if report is not None:
+		report.add_record(recordId, seconds, result)
+
+
+
+def saveRepoMasterFileToDB(file, streaming=False, ledger=False, report=None):
+	"""
+	[String] repo master file (without Geneva header),
+	[Bool] streaming (optional),
+	[Bool] ledger (optional),
+	[IngestionReport] report (optional)
 		=> [Int] no. of master entries saved into datastore
+
+	If streaming is True, the file (with or without Geneva header) is read
+	by iterRecordsFromXML, one record at a time.
+
+	If ledger is True, the file and records already in the ingestion ledger
+	are skipped, see saveFileWithLedger().
 	"""
 	logger.debug('saveRepoMasterFileToDB(): {0}'.format(file))
-	def addRepo(masterInfo):
-		"""
-		[Dictionary] repo master info => [Int] result
-		return 1 if the master info is added to DB, 0 otherwise
-		"""
-		try:
-			logger.debug('saveRepoMasterFileToDB(): add repo master code {0}'.format(
-							masterInfo.get('Code', '')))
-			addRepoMaster(keepKeys(
-				['Code', 'BifurcationCurrency', 'AccrualDaysPerMonth', 'AccrualDaysPerYear']
-			  , masterInfo))
-			return 1
+	reader = timeParse(iterRecordsFromXML if streaming else getRawDataFromXML)
+	with active_report(report):
+		if ledger:
+			return saveFileWithLedger('RepoMaster', saveRepoMasters, reader, file)
 
-		except RepoMasterAlreadyExistError: 
-			logger.warning('saveRepoMasterFileToDB(): repo master code {0} already exists'.format(
-							masterInfo.get('Code', '')))
-			return 0
+		return \
+		compose(
+			saveRepoMastersToDB
+		  , reader
+		)(file)
 
-		else:
-			logger.exception('saveRepoMasterFileToDB()')
-			return 0
 
 
-	return \
-	compose(
-		sum
-	  , partial(map, addRepo)
-	  , getRawDataFromXML
-	)(file)
+def saveRepoMasters(masters):
+	"""
+	[Iterable] repo master info
+		=> [Iterator] ([Int] result of each master info, 1 if saved,
+			ALREADY_EXIST if it exists, 0 otherwise)
+	"""
+	return map(timeRecord(lambda m: m.get('Code', ''), addRepoMasterInfo), masters)
+
+
+
+"""
+	[Iterable] repo master info => [Int] no. of master entries saved into datastore
+"""
+saveRepoMastersToDB = compose(countSaved, saveRepoMasters)
+
+
+
+def addRepoMasterInfo(masterInfo):
+	"""
+	[Dictionary] repo master info => [Int] result
+	return 1 if the master info is added to DB, ALREADY_EXIST if the repo
+	master exists, 0 otherwise
+	"""
+	try:
+		logger.debug('saveRepoMasterFileToDB(): add repo master code {0}'.format(
+						masterInfo.get('Code', '')))
+		addRepoMaster(keepKeys(
+			['Code', 'BifurcationCurrency', 'AccrualDaysPerMonth', 'AccrualDaysPerYear']
+		  , masterInfo))
+		return 1
+
+	except RepoMasterAlreadyExistError as e: 
+		add_error(e)
+		logger.warning('saveRepoMasterFileToDB(): repo master code {0} already exists'.format(
+						masterInfo.get('Code', '')))
+		return ALREADY_EXIST
+
+	else:
+		logger.exception('saveRepoMasterFileToDB()')
+		return 0
 
 
 
@@ -85,103 +206,612 @@ isRepoCancelTrade = lambda t: \
 
 
 
-def saveRepoTradeFileToDB(file):
+def saveRepoTradeFileToDB(file, batchSize=None, streaming=False, ledger=False, report=None):
 	"""
-	[String] repo trade file (without Geneva header) 
+	[String] repo trade file (without Geneva header),
+	[Int] batch size (optional),
+	[Bool] streaming (optional),
+	[Bool] ledger (optional),
+	[IngestionReport] report (optional)
 		=> [Int] no. of trades saved into datastore
+
+	If batchSize is given, consecutive open trades are added in chunks of
+	batchSize trades, one database commit per chunk, instead of one by one.
+
+	If streaming is True, the file (with or without Geneva header) is read
+	by iterRecordsFromXML, one record at a time.
+
+	If ledger is True, the file and records already in the ingestion ledger
+	are skipped, see saveFileWithLedger().
 	"""
 	logger.debug('saveRepoTradeFileToDB(): {0}'.format(file))
+	reader = timeParse(iterRecordsFromXML if streaming else getRepoTradeFromFile)
+	with active_report(report):
+		if ledger:
+			return saveFileWithLedger('RepoTrade', partial(saveRepoTrades, batchSize), reader, file)
 
-	def addRepo(trade):
-		try:
-			logger.debug('saveRepoTradeFileToDB(): add repo transaction id {0}'.format(
+		return \
+		compose(
+			partial(saveRepoTradesToDB, batchSize)
+		  , reader
+		)(file)
+
+
+
+openTradeKeys = \
+	[ 'TransactionType', 'UserTranId1', 'Portfolio'
+	, 'LocationAccount', 'Investment', 'EventDate'
+	, 'SettleDate', 'OpenEnded', 'ActualSettleDate'
+	, 'Quantity', 'CounterInvestment', 'Price'
+	, 'NetCounterAmount', 'RepoName', 'Coupon'
+	, 'LoanAmount', 'Broker'
+	]
+
+
+
+def saveRepoTrades(batchSize, trades):
+	"""
+	[Int] batch size (None means no batch), [Iterable] trades
+		=> [Iterator] ([Int] result of each trade, 1 if saved,
+			ALREADY_EXIST if it exists, 0 otherwise)
+	"""
+	timedAddRepoTrade = timeRecord(lambda t: t.get('UserTranId1', ''), addRepoTrade)
+	if batchSize is None:
+		return map(timedAddRepoTrade, trades)
+
+	def saveGroup(group):
+		isOpen, trades = group
+		if isOpen:
+			return addRepoOpenTrades(batchSize, list(trades))
+		else:
+			return list(map(timedAddRepoTrade, trades))
+
+	# keep the file order between open trades and close/cancel trades
+	return \
+	compose(
+		chain.from_iterable
+	  , partial(map, saveGroup)
+	  , partial(groupby, key=lambda t: 'TransactionType' in t and isRepoOpenTrade(t))
+	)(trades)
+
+
+
+"""
+	[Int] batch size (None means no batch), [Iterable] trades
+		=> [Int] no. of trades saved into datastore
+"""
+saveRepoTradesToDB = compose(countSaved, saveRepoTrades)
+
+
+
+def addRepoTrade(trade):
+	"""
+	[Dictionary] trade => [Int] result
+	return 1 if the trade is saved to DB, ALREADY_EXIST if the repo
+	transaction exists, 0 otherwise
+	"""
+	try:
+		logger.debug('saveRepoTradeFileToDB(): add repo transaction id {0}'.format(
+					trade.get('UserTranId1', '')))
+
+		if isRepoOpenTrade(trade):
+			addRepoTransaction(keepKeys(openTradeKeys, trade))
+			return 1
+
+		elif isRepoCloseTrade(trade):
+			closeRepoTransaction(keepKeys(['UserTranId1', 'ActualSettleDate'], trade))
+			return 1
+
+		elif isRepoCancelTrade(trade):
+			cancelRepoTransaction(keepKeys(['UserTranId1'], trade))
+			return 1
+
+		else:
+			logger.error('saveRepoTradeFileToDB(): invalid trade type'.format(
+						trade.get('TransactionType', '')))
+			return 0
+
+	except RepoTransactionAlreadyExistError as e:
+		add_error(e)
+		logger.warning('saveRepoTradeFileToDB(): repo transaction {0} already exists'.format(
 						trade.get('UserTranId1', '')))
+		return ALREADY_EXIST
+
+	except:
+		add_error(sys.exc_info()[1])
+		logger.exception('saveRepoTradeFileToDB():')
+		return 0
+
 
-			if isRepoOpenTrade(trade):
-				addRepoTransaction(keepKeys( 
-				  [ 'TransactionType', 'UserTranId1', 'Portfolio'
-				  , 'LocationAccount', 'Investment', 'EventDate'
-				  , 'SettleDate', 'OpenEnded', 'ActualSettleDate'
-				  , 'Quantity', 'CounterInvestment', 'Price'
-				  , 'NetCounterAmount', 'RepoName', 'Coupon'
-				  , 'LoanAmount', 'Broker'
-				  ]
-				, trade))
-				return 1
-
-			elif isRepoCloseTrade(trade):
-				closeRepoTransaction(keepKeys(['UserTranId1', 'ActualSettleDate'], trade))
-				return 1
-
-			elif isRepoCancelTrade(trade):
-				cancelRepoTransaction(keepKeys(['UserTranId1'], trade))
-				return 1
-
-			else:
-				logger.error('saveRepoTradeFileToDB(): invalid trade type'.format(
-							trade.get('TransactionType', '')))
-				return 0
-
-		except RepoTransactionAlreadyExistError:
+
+def addRepoOpenTrades(batchSize, trades):
+	"""
+	[Int] batch size, [List] open trades
+		=> [List] ([Int] result of each trade, 1 if saved,
+			ALREADY_EXIST if it exists, 0 otherwise)
+	"""
+	def countResult(trade, result):
+		# trades saved in batch are not timed one by one
+		recordResult(trade.get('UserTranId1', ''), None, 1 if result == 0 else 0)
+		if result == 0:
+			return 1
+
+		add_error(result)
+		if isinstance(result, RepoTransactionAlreadyExistError):
 			logger.warning('saveRepoTradeFileToDB(): repo transaction {0} already exists'.format(
 							trade.get('UserTranId1', '')))
-			return 0
+			return ALREADY_EXIST
 
-		except:
-			logger.exception('saveRepoTradeFileToDB():')
+		else:
+			logger.error('saveRepoTradeFileToDB(): failed to add repo transaction {0}: {1}'.format(
+							trade.get('UserTranId1', ''), result))
 			return 0
-	# end of addRepo
+
 
 	return \
-	compose(
-		sum
-	  , partial(map, addRepo)
-	  , getRepoTradeFromFile
-	)(file)
+	list(map( countResult
+			, trades
+			, addRepoTransactions(map(partial(keepKeys, openTradeKeys), trades), batchSize)
+			))
 
 
 
-def saveRepoRerateFileToDB(file):
+def saveRepoRerateFileToDB(file, batchSize=None, streaming=False, ledger=False, report=None):
 	"""
-	[String] repo rerate file (without Geneva header) 
+	[String] repo rerate file (without Geneva header),
+	[Int] batch size (optional),
+	[Bool] streaming (optional),
+	[Bool] ledger (optional),
+	[IngestionReport] report (optional)
 		=> [Int] no. of rerate actions saved into datastore
+
+	If batchSize is given, rerates are applied in chunks of batchSize records
+	by rerateRepoTransactions(), so that each repo transaction is updated
+	once per chunk with its latest rate, instead of once per rerate.
+
+	If streaming is True, the file (with or without Geneva header) is read
+	by iterRecordsFromXML, one record at a time.
+
+	If ledger is True, the file and records already in the ingestion ledger
+	are skipped, see saveFileWithLedger().
 	"""
 	logger.debug('saveRepoRerateFileToDB(): {0}'.format(file))
+	reader = timeParse(iterRecordsFromXML if streaming else getRepoRerateFromFile)
+	with active_report(report):
+		if ledger:
+			return saveFileWithLedger('Repo_ReRate', partial(saveRepoRerates, batchSize), reader, file)
 
-	def rerateEntry(el):
-		"""
-		[Dictionary] el => [Dictionary] rerate entry
-		"""
-		if el['Loan'].startswith('UserTranId1='):
-			d = {}
-			d['RateDate'] = el['RateTable']['RateDate']
-			d['Rate'] = el['RateTable']['Rate']
-
-			return { 'UserTranId1': el['Loan'][12:]
-				   , 'RateTable': d
-				   }
-		else:
-			logger.error('saveRepoRerateFileToDB(): failed to find UserTranId1: {0}'.format(
-						el['Loan']))
-			raise ValueError
+		return \
+		compose(
+			partial(saveRepoReratesToDB, batchSize)
+		  , reader
+		)(file)
+
+
+
+def saveRepoRerates(batchSize, rerates):
+	"""
+	[Int] batch size (None means no batch), [Iterable] rerate records
+		=> [Iterator] ([Int] result of each rerate record, 1 if saved, 0 otherwise)
+	"""
+	if batchSize is None:
+		return map( timeRecord(lambda el: el.get('Loan', ''), compose(addRepoRerate, rerateEntry))
+				  , rerates)
+
+	return \
+	compose(
+		chain.from_iterable
+	  , partial(map, addRepoRerates)
+	  , partial(partition_all, batchSize)
+	)(rerates)
+
+
+
+"""
+	[Int] batch size (None means no batch), [Iterable] rerate records
+		=> [Int] no. of rerate actions saved into datastore
+"""
+saveRepoReratesToDB = compose(countSaved, saveRepoRerates)
+
+
+
+def rerateEntry(el):
+	"""
+	[Dictionary] el => [Dictionary] rerate entry
+	"""
+	if el['Loan'].startswith('UserTranId1='):
+		d = {}
+		d['RateDate'] = el['RateTable']['RateDate']
+		d['Rate'] = el['RateTable']['Rate']
+
+		return { 'UserTranId1': el['Loan'][12:]
+			   , 'RateTable': d
+			   }
+	else:
+		logger.error('saveRepoRerateFileToDB(): failed to find UserTranId1: {0}'.format(
+					el['Loan']))
+		raise ValueError
+
+
+
+def addRepoRerate(el):
+	"""
+	[Dictionary] rerate entry => [Int] result
+	return 1 if the rerate action is saved to DB, 0 otherwise
+	"""
+	try:
+		logger.debug('saveRepoRerateFileToDB(): add repo rerate id {0}'.format(
+					el['UserTranId1']))
+		rerateRepoTransaction(el)
+		return 1
+
+	except:
+		add_error(sys.exc_info()[1])
+		logger.exception('saveRepoRerateFileToDB()')
+		return 0
 
 
-	def addRepo(el):
+
+def addRepoRerates(rerates):
+	"""
+	[Iterable] rerate records
+		=> [List] ([Int] result of each rerate record, 1 if saved, 0 otherwise)
+
+	The rerate records are applied together by rerateRepoTransactions(), a
+	record without a valid Loan field fails alone.
+	"""
+	def toEntry(el):
 		try:
-			logger.debug('saveRepoRerateFileToDB(): add repo rerate id {0}'.format(
-						el['UserTranId1']))
-			rerateRepoTransaction(el)
+			return rerateEntry(el)
+		except:
+			return sys.exc_info()[1]
+
+	def countResult(el, result):
+		# rerates saved in batch are not timed one by one
+		recordResult(el.get('Loan', ''), None, 1 if result == 0 else 0)
+		if result == 0:
 			return 1
 
-		except:
-			logger.exception('saveRepoRerateFileToDB()')
-			return 0
+		add_error(result)
+		logger.error('saveRepoRerateFileToDB(): failed to rerate {0}: {1}'.format(
+						el.get('Loan', ''), result))
+		return 0
 
 
+	rerates = list(rerates)
+	entries = list(map(toEntry, rerates))
+	isEntry = lambda e: not isinstance(e, Exception)
+	outcomes = iter(rerateRepoTransactions(filter(isEntry, entries)))
 	return \
+	list(map( countResult
+			, rerates
+			, [next(outcomes) if isEntry(e) else e for e in entries]
+			))
+
+
+def getFileHash(file):
+	"""
+	[String] file => [String] sha256 hex digest of the file content
+	"""
+	h = hashlib.sha256()
+	with open(file, 'rb') as f:
+		for data in iter(partial(f.read, 1048576), b''):
+			h.update(data)
+
+	return h.hexdigest()
+
+
+
+"""
+	[String] file type, [Dictionary] record
+		=> [String] sha256 hex digest of the file type and record content
+"""
+getRecordHash = lambda fileType, record: \
+	hashlib.sha256(
+		json.dumps([fileType, record], sort_keys=True).encode('utf-8')
+	).hexdigest()
+
+
+
+def saveFileWithLedger(fileType, saveRecords, reader, file):
+	"""
+	[String] file type, 
+	[Function] ([Iterable] records => [Iterator] result of each record),
+	[Function] ([String] file => [Iterable] records),
+	[String] file
+		=> [Int] no. of records saved into datastore
+
+	Save the file with the help of the ingestion ledger:
+
+	1. If the file content is in the ledger (byte-identical to a file saved
+	before), skip the file without reading it.
+
+	2. Otherwise skip the records in the ledger and save the rest, then
+	add the records saved or already in datastore (ALREADY_EXIST) to the
+	ledger. So a partially changed file only replays the records changed.
+
+	3. Add the file to the ledger if none of its records failed, otherwise
+	the failed records are retried when the file is saved again. A file
+	saved before without the ledger is added, as its records exist.
+	"""
+	fileHash = getFileHash(file)
+	if isFileIngested(fileHash):
+		logger.info('saveFileWithLedger(): {0} already saved, skip'.format(file))
+		return 0
+
+	# [no. of records, no. of records failed]
+	counter = [0, 0]
+	def countResult(result):
+		counter[0] = counter[0] + 1
+		counter[1] = counter[1] + (1 if result == 0 else 0)
+		return 1 if result == 1 else 0
+
+	def saveChunk(records):
+		hashes = list(map(partial(getRecordHash, fileType), records))
+		ingested = getIngestedRecordHashes(hashes)
+		newRecords = [(h, r) for h, r in zip(hashes, records) if not h in ingested]
+		results = list(saveRecords(map(lambda x: x[1], newRecords)))
+		addIngestedRecordHashes([ h for (h, _), result in zip(newRecords, results) \
+									if result in (1, ALREADY_EXIST)])
+		counter[0] = counter[0] + len(records) - len(newRecords)
+		return results
+
+	saved = \
 	compose(
 		sum
-	  , partial(map, addRepo)
-	  , partial(map, rerateEntry)
-	  , getRepoRerateFromFile
-	)(file)
\ No newline at end of file
+	  , partial(map, countResult)
+	  , chain.from_iterable
+	  , partial(map, saveChunk)
+	  , partial(partition_all, 1000)
+	  , reader
+	)(file)
+
+	if counter[1] == 0:
+		addIngestedFile({ 'FileHash': fileHash
+						, 'FileName': os.path.basename(file)
+						, 'FileType': fileType
+						, 'RecordCount': counter[0]
+						})
+	else:
+		logger.warning('saveFileWithLedger(): {0} records failed in {1}'.format(
+						counter[1], file))
+
+	return saved
+
+
+
+"""
+	[String] tag name, may be with namespace like {namespace}tag
+		=> [String] tag name without namespace
+"""
+stripNamespace = lambda tag: \
+	tag.rsplit('}', 1)[-1]
+
+
+
+"""
+	[String] tag name => [Bool] whether the element wraps the records, like
+	the GenevaLoader header or the xxxRecords element under it
+"""
+isRecordWrapper = lambda tag: \
+	tag == 'GenevaLoader' or tag.endswith('Records')
+
+
+
+def elementToDict(el):
+	"""
+	[Element] el => [Dictionary] child tag -> text, or dictionary if the
+	child has its own children, such as RateTable in a rerate record.
+	"""
+	return { stripNamespace(child.tag): \
+				elementToDict(child) if len(child) > 0 else (child.text or '')
+			 for child in el
+		   }
+
+
+
+def iterRecordsFromXML(file, chunkSize=65536):
+	"""
+	[String] Geneva XML file (with or without Geneva header),
+	[Int] no. of bytes read at a time (optional)
+		=> [Iterator] ([Dictionary] record)
+
+	Parse the file incrementally and yield one record at a time, each record
+	as from elementToDict() plus its tag as 'TransactionType'. A record is
+	cleared once yielded, so memory usage stays flat however big the file is.
+
+	A file without Geneva header has several root elements, so the content
+	is wrapped in a dummy root element before parsing.
+	"""
+	parser = XMLPullParser(events=('start', 'end'))
+	with open(file, 'rb') as f:
+		data = f.read(chunkSize)
+		# keep the XML declaration (if any) in front of the dummy root
+		head = data.lstrip(codecs.BOM_UTF8).lstrip()
+		if head.startswith(b'<?xml'):
+			end = head.index(b'?>') + 2
+			parser.feed(head[:end])
+			data = head[end:]
+
+		parser.feed(b'<root>')
+		stack = []			# elements being parsed
+		record = None		# the record element being parsed
+		while data:
+			parser.feed(data)
+			for event, el in parser.read_events():
+				if event == 'start':
+					if record is None and len(stack) > 0 \
+						and not isRecordWrapper(stripNamespace(el.tag)):
+						record = el
+					stack.append(el)
+
+				else:
+					stack.pop()
+					if el is record:
+						yield dict( elementToDict(el)
+								  , TransactionType=stripNamespace(el.tag))
+						el.clear()
+						stack[-1].remove(el)
+						record = None
+
+			data = f.read(chunkSize)
+
+		parser.feed(b'</root>')
+		parser.close()
+
+
+
+"""
+	[String] file name => [Match] with groups (type, date, timestamp) if it is
+	a repo master, repo trade or repo rerate file, None otherwise.
+
+	For example, RepoTrade_20210305_WithHeaders_20210305155621.xml
+"""
+matchRepoFileName = lambda fileName: \
+	re.match( r'^(RepoMaster|RepoTrade|Repo_ReRate)_(\d{8})(?:_WithHeaders)?(?:_(\d{14}))?\.xml$'
+			, fileName)
+
+
+
+"""
+	[String] file name => [Bool] whether it is the variant with Geneva header
+"""
+isWithHeaders = lambda fileName: \
+	'_WithHeaders' in fileName
+
+
+
+# the order in which the types of files are saved, a repo trade needs its
+# repo master, and a rerate needs its repo trade.
+repoFileTiers = ['RepoMaster', 'RepoTrade', 'Repo_ReRate']
+
+
+
+def readRecordsFromXML(file):
+	"""
+	[String] file => ([List] records, [Float] seconds used)
+
+	Run in a worker process, so the records are returned as a list.
+	"""
+	start = time.perf_counter()
+	records = list(iterRecordsFromXML(file))
+	return records, time.perf_counter() - start
+
+
+
+def saveRepoDirectoryToDB(path, workers=None, batchSize=None, ledger=False, report=None):
+	"""
+	[String] directory, [Int] no. of worker processes (optional, default
+	to no. of CPUs), [Int] batch size for trades and rerates (optional), [Bool] ledger
+	(optional), [IngestionReport] report (optional)
+		=> [Dictionary] result
+
+	Save all repo master, repo trade and repo rerate files (with or without
+	Geneva header) in the directory to datastore.
+
+	All files are parsed concurrently in a process pool. The records are
+	saved in the order of repo masters, repo trades, then repo rerates, and
+	by the date and timestamp in the file name within each type, because a
+	trade file may close or cancel a trade opened by an earlier file. Files
+	of other names are skipped. If an export is in the directory both with and
+	without Geneva header (same type, date and timestamp), only the file with
+	header is saved and the other is skipped.
+
+	If ledger is True, files in the ingestion ledger are skipped before
+	being parsed, and the rest are saved as in saveFileWithLedger().
+
+	If report is given, it covers all the files and the parse stage is the
+	total time used by the worker processes.
+
+	The result is like:
+	{ 'files': [ { 'file': 'RepoTrade_20210305_20210305155621.xml'
+				 , 'type': 'RepoTrade'
+				 , 'records': 9		# no. of records in the file
+				 , 'saved': 9		# no. of records saved into datastore
+				 , 'parseSeconds': 0.01
+				 , 'saveSeconds': 0.2
+				 }
+			   , ...
+			   ]
+	, 'skipped': ['README.txt']
+	, 'saved': 9
+	, 'elapsedSeconds': 0.3
+	}
+	"""
+	logger.debug('saveRepoDirectoryToDB(): {0}'.format(path))
+	start = time.perf_counter()
+
+	fileNames, skipped = [], []
+	for fileName in sorted(os.listdir(path)):
+		if not os.path.isfile(os.path.join(path, fileName)):
+			continue
+		elif matchRepoFileName(fileName) is None:
+			logger.warning('saveRepoDirectoryToDB(): skip file {0}'.format(fileName))
+			skipped.append(fileName)
+		else:
+			fileNames.append(fileName)
+
+	# an export may come in both variants, with and without Geneva header, keep
+	# the one with header only, otherwise its records are saved twice
+	exports = {}
+	for fileName in fileNames:
+		exports.setdefault(matchRepoFileName(fileName).groups(), []).append(fileName)
+	for variants in exports.values():
+		for fileName in sorted(variants, key=lambda f: not isWithHeaders(f))[1:]:
+			logger.warning('saveRepoDirectoryToDB(): skip file {0}, same export with header'.format(
+							fileName))
+			skipped.append(fileName)
+			fileNames.remove(fileName)
+
+	def sortKey(fileName):
+		fileType, date, timestamp = matchRepoFileName(fileName).groups()
+		return repoFileTiers.index(fileType), date, timestamp or '', fileName
+
+	if ledger:
+		isIngested = { fileName: isFileIngested(getFileHash(os.path.join(path, fileName)))
+					   for fileName in fileNames}
+		skipped = skipped + [fileName for fileName in fileNames if isIngested[fileName]]
+		fileNames = [fileName for fileName in fileNames if not isIngested[fileName]]
+
+	saveRecords = { 'RepoMaster': saveRepoMasters
+				  , 'RepoTrade': partial(saveRepoTrades, batchSize)
+				  , 'Repo_ReRate': partial(saveRepoRerates, batchSize)
+				  }
+
+	def saveFile(fileType, fileName, records):
+		if ledger:
+			return saveFileWithLedger( fileType, saveRecords[fileType]
+									 , lambda _: records, os.path.join(path, fileName))
+		else:
+			return countSaved(saveRecords[fileType](records))
+
+	results = []
+	with active_report(report), ProcessPoolExecutor(max_workers=workers) as executor:
+		fileNames = sorted(fileNames, key=sortKey)
+		# submit all files at once, so that later tiers are being parsed while
+		# earlier tiers are being saved
+		futures = [ executor.submit(readRecordsFromXML, os.path.join(path, fileName)) 
+					for fileName in fileNames]
+
+		for fileName, future in zip(fileNames, futures):
+			fileType = matchRepoFileName(fileName).group(1)
+			records, parseSeconds = future.result()
+			if report is not None:
+				report.stage_seconds[IngestionReport.STAGE_PARSE] += parseSeconds
+			saveStart = time.perf_counter()
+			saved = saveFile(fileType, fileName, records)
+			logger.info('saveRepoDirectoryToDB(): {0} records saved from {1}'.format(
+						saved, fileName))
+			results.append({ 'file': fileName
+						   , 'type': fileType
+						   , 'records': len(records)
+						   , 'saved': saved
+						   , 'parseSeconds': parseSeconds
+						   , 'saveSeconds': time.perf_counter() - saveStart
+						   })
+
+	return { 'files': results
+		   , 'skipped': skipped
+		   , 'saved': sum(map(lambda r: r['saved'], results))
+		   , 'elapsedSeconds': time.perf_counter() - start
+		   }
@@ -0,0 +1,40 @@
+# coding=utf-8
+# 
+import logging
+from repo_data.services.memory_store import MemoryStore
+
+class MemoryRepoIngestionLedgerServices:
+
+	#-- same interface as RepoIngestionLedgerServices, on the in-memory store
+
+	def __init__(self, store=None):
+		self.logger = logging.getLogger(__name__)
+		self.store = store
+		if self.store is None:
+			self.store = MemoryStore.get_instance()
+
+	def delete_all(self):
+		with self.store.lock:
+			self.store.ingested_records.clear()
+			self.store.ingested_files.clear()
+
+	def has_file(self, file_hash):
+		with self.store.lock:
+			return file_hash in self.store.ingested_files
+
+	def add_file(self, ingested_file):
+		with self.store.lock:
+			if not ingested_file['file_hash'] in self.store.ingested_files:
+				now = self.store.now()
+				self.store.ingested_files[ingested_file['file_hash']] = \
+					dict(ingested_file, created_at=now, updated_at=now)
+				self.logger.info("File " + ingested_file['file_name'] + " added to ledger")
+
+	def query_records(self, record_hashes, chunk_size=1000):
+		#-- return the subset of record_hashes found in the ledger
+		with self.store.lock:
+			return set(record_hashes) & self.store.ingested_records
+
+	def add_records(self, record_hashes):
+		with self.store.lock:
+			self.store.ingested_records.update(record_hashes)
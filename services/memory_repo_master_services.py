@@ -0,0 +1,40 @@
+# coding=utf-8
+# 
+import logging
+from repo_data.utils.error_handling import RepoMasterAlreadyExistError
+from repo_data.services.memory_store import MemoryStore
+
+class MemoryRepoMasterServices:
+
+	#-- same interface and exceptions as RepoMasterServices, on the in-memory store
+
+	def __init__(self, store=None):
+		self.logger = logging.getLogger(__name__)
+		self.store = store
+		if self.store is None:
+			self.store = MemoryStore.get_instance()
+
+	def delete_all(self):
+		with self.store.lock:
+			self.store.repo_masters.clear()
+
+	def create(self, master):
+		with self.store.lock:
+			if master['code'] in self.store.repo_masters:
+				message = "Record " + master['code'] + " already exists"
+				self.logger.warn(message)
+				raise RepoMasterAlreadyExistError(message)
+			now = self.store.now()
+			self.store.repo_masters[master['code']] = dict(master, created_at=now, updated_at=now)
+			self.logger.info("Record " + master['code'] + " added successfully")
+
+	def create_batch(self, masters, chunk_size=1000):
+		#-- result of each master in input order, 0 if added or the exception otherwise
+		results = []
+		for master in masters:
+			try:
+				self.create(master)
+				results.append(0)
+			except RepoMasterAlreadyExistError as e:
+				results.append(e)
+		return results
@@ -0,0 +1,73 @@
+# coding=utf-8
+#
+import logging
+from datetime import timedelta
+from repo_data.models.repo_snapshot_transaction import RepoSnapshotTransaction
+from repo_data.services.memory_store import MemoryStore
+
+class MemoryRepoSnapshotServices:
+
+	#-- same interface, output and exceptions as RepoSnapshotServices, on the
+	#-- in-memory store
+
+	def __init__(self, store=None):
+		self.logger = logging.getLogger(__name__)
+		self.store = store
+		if self.store is None:
+			self.store = MemoryStore.get_instance()
+
+	def delete_all(self):
+		with self.store.lock:
+			self.store.repo_snapshots.clear()
+
+	def create(self, time_stamp=None, chunk_size=1000):
+		with self.store.lock:
+			latest = self.store.now() - timedelta(seconds=1)
+			if time_stamp is None:
+				time_stamp = latest
+			elif time_stamp > latest:
+				raise ValueError("time_stamp of a snapshot must be before " + \
+									str(latest + timedelta(seconds=1)))
+			if time_stamp in self.store.repo_snapshots:
+				return time_stamp
+			history_id, states = self._query_snapshot(time_stamp)
+			self.store.repo_snapshots[time_stamp] = (history_id, states)
+			self.logger.info("Snapshot of " + str(len(states)) + " transactions at " + \
+								str(time_stamp) + " added successfully")
+			return time_stamp
+
+	def _query_states(self, time_stamp):
+		#-- return transaction_id => (status, interest_rate) at time_stamp, the
+		#-- nearest snapshot plus the history added after it and recorded on or
+		#-- before time_stamp, as RepoTransactionServices._get_state_at
+		after_id, states = self._get_snapshot(time_stamp)
+		return self._replay(states, after_id, None, time_stamp)
+
+	def _query_snapshot(self, time_stamp):
+		#-- same as RepoSnapshotServices._query_states
+		history_id = max(((h["created_at"], h["id"]) \
+							for histories in self.store.repo_transaction_history.values() \
+							for h in histories if h["created_at"] <= time_stamp),
+						default=(None, 0))[1]
+		after_id, states = self._get_snapshot(time_stamp)
+		return history_id, self._replay(states, after_id, history_id, None)
+
+	def _get_snapshot(self, time_stamp):
+		#-- return (history_id, copy of the states) of the nearest snapshot
+		since = max((t for t in self.store.repo_snapshots if t <= time_stamp), default=None)
+		if since is None:
+			return 0, {}
+		history_id, states = self.store.repo_snapshots[since]
+		return history_id, dict(states)
+
+	def _replay(self, states, after_id, history_id, time_stamp):
+		#-- replay the histories of id after after_id, up to history_id (if given)
+		#-- and recorded on or before time_stamp (if given) in the order added
+		histories = sorted((h for histories in self.store.repo_transaction_history.values() \
+								for h in histories \
+								if h["id"] > after_id and \
+									(history_id is None or h["id"] <= history_id) and \
+									(time_stamp is None or h["created_at"] <= time_stamp)),
+							key=lambda h: h["id"])
+		return RepoSnapshotTransaction.replay(states,
+						((h["transaction_id"], h["action"], h["interest_rate"]) for h in histories))
@@ -0,0 +1,46 @@
+# coding=utf-8
+# 
+import logging
+from repo_data.services.memory_store import MemoryStore
+
+class MemoryRepoTransactionHistoryServices:
+
+	#-- same interface and output as RepoTransactionHistoryServices, on the in-memory store
+
+	def __init__(self, store=None):
+		self.logger = logging.getLogger(__name__)
+		self.store = store
+		if self.store is None:
+			self.store = MemoryStore.get_instance()
+
+	def delete_all(self):
+		with self.store.lock:
+			self.store.repo_transaction_history.clear()
+
+	def query(self, params):
+		with self.store.lock:
+			transaction_histories = list(self.store.repo_transaction_history \
+											.get(params['transaction_id'], []))
+		#-- return as list of dictionary
+		return [self._model2dict(t) for t in transaction_histories]
+
+	def query_page(self, params, page_size, after_id=None):
+		#-- same as RepoTransactionHistoryServices.query_page
+		with self.store.lock:
+			transaction_histories = [h for h in self.store.repo_transaction_history \
+											.get(params['transaction_id'], []) \
+										if after_id is None or h["id"] > after_id]
+		last_id = None
+		if len(transaction_histories) > page_size:
+			transaction_histories = transaction_histories[0:page_size]
+			last_id = transaction_histories[-1]["id"]
+		return [self._model2dict(t) for t in transaction_histories], last_id
+
+	def _model2dict(self, history):
+		return {
+			"TransactionId" : str(history["transaction_id"]),
+			"Action" : str(history["action"]),
+			"Date" : str(history["date"])[0:10],
+			"InterestRate" : float(history["interest_rate"]),
+			"TimeStamp" : str(history["created_at"])
+		}
@@ -0,0 +1,404 @@
+# coding=utf-8
+#
+import logging
+from datetime import datetime
+from repo_data.constants import Constants
+from repo_data.models.repo_transaction import RepoTransaction
+from repo_data.services.memory_repo_snapshot_services import MemoryRepoSnapshotServices
+from repo_data.services.memory_store import MemoryStore
+from repo_data.utils.error_handling import (RepoTransactionAlreadyExistError,
+											RepoTransactionNotExistError,
+											CloseCanceledRepoTransactionError,
+											RepoMasterNotExistError)
+
+class MemoryRepoTransactionServices:
+
+	#-- same interface, output and exceptions as RepoTransactionServices, on the
+	#-- in-memory store. Repo transactions are indexed by transaction_id,
+	#-- repo_code, portfolio and status
+
+	#-- output column => key of the stored repo transaction
+	columns = [("TransactionId", "transaction_id"),
+				("Type", "transaction_type"),
+				("Portfolio", "portfolio"),
+				("Custodian", "custodian"),
+				("CollateralIDType", "collateral_id_type"),
+				("CollateralID", "collateral_id"),
+				("CollateralGlobalID", "collateral_global_id"),
+				("TradeDate", "trade_date"),
+				("SettleDate", "settle_date"),
+				("IsOpenRepo", "is_open_repo"),
+				("MaturityDate", "maturity_date"),
+				("Quantity", "quantity"),
+				("Currency", "currency"),
+				("Price", "price"),
+				("CollateralValue", "collateral_value"),
+				("RepoName", "repo_code"),
+				("InterestRate", "interest_rate"),
+				("LoanAmount", "loan_amount"),
+				("Broker", "broker"),
+				("Haircut", "haircut"),
+				("Status", "status")]
+
+	def __init__(self, store=None):
+		self.logger = logging.getLogger(__name__)
+		self.store = store
+		if self.store is None:
+			self.store = MemoryStore.get_instance()
+
+	def delete_all(self):
+		with self.store.lock:
+			self.store.clear_transactions()
+
+	def create(self, transaction):
+		with self.store.lock:
+			self._create(transaction)
+			self.logger.info("Record " +  transaction['transaction_id'] + " added successfully")
+
+	def _create(self, transaction):
+		#-- create without logging each record, for the batches. The caller holds
+		#-- the store lock
+		#-- throw exception if transaction_id already exist
+		if transaction['transaction_id'] in self.store.repo_transactions:
+			message = "transaction_id: " + \
+						transaction['transaction_id'] + \
+						". record already exists"
+			self.logger.warn(message)
+			raise RepoTransactionAlreadyExistError(message)
+		#-- throw exception if repo_code not exist
+		if not transaction['repo_code'] in self.store.repo_masters:
+			message = "transaction_id: " + \
+						transaction['transaction_id'] + \
+						". The transaction's repo_code " + \
+						transaction['repo_code'] + " not exists"
+			self.logger.warn(message)
+			raise RepoMasterNotExistError(message)
+		self._add(transaction)
+
+	def create_batch(self, transactions, chunk_size=1000):
+		#-- result of each transaction in input order, 0 if added or the exception otherwise
+		results = []
+		with self.store.lock:
+			for transaction in transactions:
+				try:
+					self._create(transaction)
+					results.append(0)
+				except (RepoTransactionAlreadyExistError, RepoMasterNotExistError) as e:
+					results.append(e)
+		self.logger.info(str(results.count(0)) + " of " + str(len(results)) + " records added successfully")
+		return results
+
+	def _add(self, transaction):
+		now = self.store.now()
+		repo_transaction = dict(transaction,
+								trade_date=str(transaction['trade_date'])[0:10],
+								settle_date=str(transaction['settle_date'])[0:10],
+								created_at=now,
+								updated_at=now)
+		self.store.add_transaction(repo_transaction)
+		self._add_history({
+			"transaction_id" : transaction["transaction_id"],
+			"action" : Constants.REPO_TRANS_HISTORY_ACTION_OPEN,
+			"date" : transaction["settle_date"],
+			"interest_rate" : transaction["interest_rate"]
+		})
+
+	def _add_history(self, transaction_history):
+		now = self.store.now()
+		self.store.repo_transaction_history.setdefault(transaction_history["transaction_id"], []) \
+			.append(dict(transaction_history,
+						id=self.store.next_id(),
+						date=str(transaction_history["date"])[0:10],
+						interest_rate=float(transaction_history["interest_rate"]),
+						created_at=now,
+						updated_at=now))
+
+	def _get(self, transaction_id):
+		#-- throw error if transaction not exists
+		repo_transaction = self.store.repo_transactions.get(transaction_id)
+		if repo_transaction is None:
+			message = "transaction_id: " + \
+						transaction_id + \
+						" not exists"
+			self.logger.warn(message)
+			raise RepoTransactionNotExistError(message)
+		return repo_transaction
+
+	def cancel(self, transaction):
+		with self.store.lock:
+			self._cancel(transaction)
+			self.logger.info("Record " +  transaction['transaction_id'] + " updated successfully")
+
+	def _cancel(self, transaction):
+		#-- the caller holds the store lock
+		repo_trans_to_cxl = self._get(transaction['transaction_id'])
+		self.store.set_transaction_status(repo_trans_to_cxl, Constants.REPO_TRANS_STATUS_CANCEL)
+		self._add_history({
+			"transaction_id" : repo_trans_to_cxl["transaction_id"],
+			"action" : Constants.REPO_TRANS_HISTORY_ACTION_CANCEL,
+			"date" : datetime.today().strftime('%Y-%m-%d'),
+			"interest_rate" : 0
+		})
+
+	def close(self, transaction):
+		with self.store.lock:
+			self._close(transaction)
+			self.logger.info("Record " +  transaction['transaction_id'] + " updated successfully")
+
+	def _close(self, transaction):
+		#-- the caller holds the store lock
+		repo_trans_to_cls = self._get(transaction['transaction_id'])
+		#-- throw error if transaction has been canceled
+		if repo_trans_to_cls["status"] == Constants.REPO_TRANS_STATUS_CANCEL:
+			message = "transaction_id: " + \
+						transaction['transaction_id'] + \
+						". is either closed or canceled"
+			self.logger.warn(message)
+			raise CloseCanceledRepoTransactionError(message)
+		self.store.set_transaction_status(repo_trans_to_cls, Constants.REPO_TRANS_STATUS_CLOSE)
+		self._add_history({
+			"transaction_id" : repo_trans_to_cls["transaction_id"],
+			"action" : Constants.REPO_TRANS_HISTORY_ACTION_CLOSE,
+			"date" : transaction["maturity_date"],
+			"interest_rate" : 0
+		})
+
+	def cancel_batch(self, transactions, chunk_size=1000):
+		#-- result of each cancel in input order, 0 if done or the exception otherwise
+		results = []
+		with self.store.lock:
+			for transaction in transactions:
+				try:
+					self._cancel(transaction)
+					results.append(0)
+				except RepoTransactionNotExistError as e:
+					results.append(e)
+		self.logger.info(str(results.count(0)) + " of " + str(len(results)) + " records canceled successfully")
+		return results
+
+	def close_batch(self, transactions, chunk_size=1000):
+		#-- result of each close in input order, 0 if done or the exception otherwise
+		results = []
+		with self.store.lock:
+			for transaction in transactions:
+				try:
+					self._close(transaction)
+					results.append(0)
+				except (RepoTransactionNotExistError, CloseCanceledRepoTransactionError) as e:
+					results.append(e)
+		self.logger.info(str(results.count(0)) + " of " + str(len(results)) + " records closed successfully")
+		return results
+
+	def rerate(self, transaction):
+		with self.store.lock:
+			repo_trans_to_rerate = self._get(transaction['transaction_id'])
+			self._check_rerate(repo_trans_to_rerate)
+			repo_trans_to_rerate["interest_rate"] = float(transaction["interest_rate"])
+			repo_trans_to_rerate["updated_at"] = self.store.now()
+			self._add_history({
+				"transaction_id" : repo_trans_to_rerate["transaction_id"],
+				"action" : Constants.REPO_TRANS_HISTORY_ACTION_RERATE,
+				"date" : transaction["rate_date"],
+				"interest_rate" : repo_trans_to_rerate["interest_rate"]
+			})
+			self.logger.info("Record " +  repo_trans_to_rerate["transaction_id"] + " updated successfully")
+
+	def _check_rerate(self, repo_transaction):
+		#-- throw error if transaction has been closed or canceled
+		if repo_transaction["status"] == Constants.REPO_TRANS_STATUS_CANCEL or \
+				repo_transaction["status"] == Constants.REPO_TRANS_STATUS_CLOSE:
+			message = "transaction_id: " + \
+						repo_transaction["transaction_id"] + \
+						". is either closed or canceled"
+			self.logger.warn(message)
+			raise CloseCanceledRepoTransactionError(message)
+
+	def rerate_batch(self, transactions, chunk_size=1000):
+		#-- result of each rerate in input order, 0 if done or the exception otherwise
+		results = [None] * len(transactions)
+		#-- group the rerates by transaction_id, each group sorted by rate_date
+		groups = {}
+		for i, transaction in enumerate(transactions):
+			groups.setdefault(transaction['transaction_id'], []).append(i)
+		with self.store.lock:
+			for transaction_id, positions in groups.items():
+				positions.sort(key=lambda i: transactions[i]['rate_date'])
+				try:
+					repo_transaction = self._get(transaction_id)
+					self._check_rerate(repo_transaction)
+				except (RepoTransactionNotExistError, CloseCanceledRepoTransactionError) as e:
+					for i in positions:
+						results[i] = e
+					continue
+				for i in positions:
+					self._add_history({
+						"transaction_id" : transaction_id,
+						"action" : Constants.REPO_TRANS_HISTORY_ACTION_RERATE,
+						"date" : transactions[i]["rate_date"],
+						"interest_rate" : transactions[i]["interest_rate"]
+					})
+					results[i] = 0
+				repo_transaction["interest_rate"] = float(transactions[positions[-1]]["interest_rate"])
+				repo_transaction["updated_at"] = self.store.now()
+		self.logger.info(str(results.count(0)) + " rerates of " + str(len(results)) + " updated successfully")
+		return results
+
+	def query(self, params):
+		return [self._model2dict(t, master) for t, master in self._select(params)]
+
+	def query_columns(self, params):
+		#-- same as RepoTransactionServices.query_columns
+		transactions = self._select(params)
+		columns = {name : [t[key] for t, master in transactions] \
+						for name, key in self.columns}
+		columns["MaturityDate"] = [RepoTransaction.get_maturity_date_string(t["maturity_date"], t["maturity_state"]) \
+										for t, master in transactions]
+		columns["DayCount"] = [master["date_count"] for t, master in transactions]
+		return columns
+
+	def query_iter(self, params, chunk_size=1000):
+		#-- same result as query, converted one by one while iterating
+		for t, master in self._select(params):
+			yield self._model2dict(t, master)
+
+	def query_page(self, params, page_size, after_id=None):
+		#-- same as RepoTransactionServices.query_page
+		transactions = [(t, master) for t, master in self._select(params) \
+							if after_id is None or t["id"] > after_id]
+		last_id = None
+		if len(transactions) > page_size:
+			transactions = transactions[0:page_size]
+			last_id = transactions[-1][0]["id"]
+		return [self._model2dict(t, master) for t, master in transactions], last_id
+
+	def _select(self, params):
+		#-- return list of (transaction, repo master) matching the params
+		def is_given(name):
+			return not params[name] is None and not params[name] == "all"
+		as_of_date = params["as_of_date"]
+		#-- given by getRepoAtTime only
+		time_stamp = params.get("time_stamp")
+		with self.store.lock:
+			#-- start from the smallest index of the given conditions
+			candidates = []
+			if is_given("status"):
+				status = str(params["status"]).lower()
+				if status == Constants.GETREPO_STATUS_OPENCLOSE:
+					#-- almost all transactions, filtered below
+					pass
+				elif status == Constants.REPO_TRANS_STATUS_CANCEL:
+					#-- a canceled transaction stays canceled, also as of a date or time
+					candidates.append(list(self.store.repo_transactions_by_status \
+											.get(params["status"], {})))
+				elif as_of_date is None and time_stamp is None:
+					self.logger.warn("Unknown query status: " + str(params["status"]))
+			if is_given("portfolio"):
+				candidates.append(list(self.store.repo_transactions_by_portfolio \
+										.get(params["portfolio"], {})))
+			if is_given("repo_code"):
+				candidates.append(list(self.store.repo_transactions_by_repo_code \
+										.get(params["repo_code"], {})))
+			if len(candidates) == 0:
+				transaction_ids = list(self.store.repo_transactions)
+			else:
+				transaction_ids = min(candidates, key=len)
+				if len(candidates) > 1:
+					#-- keep the insertion order, the order of the pages
+					selected = set(transaction_ids)
+					transaction_ids = [t for t in self.store.repo_transactions if t in selected]
+			#-- the remaining conditions
+			def is_matched(t):
+				if is_given("status"):
+					status = str(params["status"]).lower()
+					if status == Constants.GETREPO_STATUS_OPENCLOSE and \
+							not t["status"] in (Constants.REPO_TRANS_STATUS_OPEN, Constants.REPO_TRANS_STATUS_CLOSE):
+						return False
+					if status in (Constants.REPO_TRANS_STATUS_OPEN,
+									Constants.REPO_TRANS_STATUS_CLOSE,
+									Constants.REPO_TRANS_STATUS_CANCEL) and \
+							t["status"] != params["status"]:
+						return False
+				if is_given("portfolio") and t["portfolio"] != params["portfolio"]:
+					return False
+				if is_given("custodian") and t["custodian"] != params["custodian"]:
+					return False
+				if is_given("repo_code") and t["repo_code"] != params["repo_code"]:
+					return False
+				if is_given("broker") and t["broker"] != params["broker"]:
+					return False
+				#-- maturity window, the dates are yyyy-mm-dd strings
+				if not params["maturity_from"] is None and \
+						(t["maturity_date"] is None or str(t["maturity_date"])[0:10] < params["maturity_from"]):
+					return False
+				if not params["maturity_to"] is None and \
+						(t["maturity_date"] is None or str(t["maturity_date"])[0:10] > params["maturity_to"]):
+					return False
+				if is_given("has_hair_cut"):
+					if str(params["has_hair_cut"]).lower() == "true":
+						return t["haircut"] != 0
+					else:
+						return t["haircut"] == 0
+				return True
+			transactions = (self.store.repo_transactions[i] for i in transaction_ids)
+			if not time_stamp is None:
+				#-- the status and interest rate at the time instead of the current
+				#-- ones, as RepoTransactionServices._get_state_at
+				states = MemoryRepoSnapshotServices(self.store)._query_states(time_stamp)
+				transactions = (dict(t, status=states[t["transaction_id"]][0],
+										interest_rate=states[t["transaction_id"]][1]) \
+									for t in transactions \
+									if t["transaction_id"] in states)
+			elif not as_of_date is None:
+				#-- the status as of the date instead of the current one
+				transactions = (dict(t, status=self._get_status_as_of(t, as_of_date)) \
+									for t in transactions \
+									if t["settle_date"] <= as_of_date)
+			#-- skip transactions without repo master as the database join does
+			return [(t, self.store.repo_masters[t["repo_code"]]) \
+						for t in transactions \
+						if is_matched(t) and t["repo_code"] in self.store.repo_masters]
+
+	def _get_status_as_of(self, t, as_of_date):
+		#-- same as RepoTransactionServices._get_status_as_of
+		actions = set(h["action"] for h in self.store.repo_transaction_history.get(t["transaction_id"], []) \
+						if h["date"] <= as_of_date)
+		if t["status"] == Constants.REPO_TRANS_STATUS_CANCEL and \
+				Constants.REPO_TRANS_HISTORY_ACTION_CANCEL in actions:
+			return Constants.REPO_TRANS_STATUS_CANCEL
+		if Constants.REPO_TRANS_HISTORY_ACTION_CLOSE in actions or \
+				(not t["maturity_date"] is None and str(t["maturity_date"])[0:10] <= as_of_date):
+			return Constants.REPO_TRANS_STATUS_CLOSE
+		return Constants.REPO_TRANS_STATUS_OPEN
+
+	def _model2dict(self, t, master):
+		#-- return as dictionary
+		return {
+			"TransactionId" : str(t["transaction_id"]),
+			"Type" : str(t["transaction_type"]),
+			"Portfolio" : str(t["portfolio"]),
+			"Custodian" : str(t["custodian"]),
+			"CollateralIDType" : str(t["collateral_id_type"]),
+			"CollateralID" : str(t["collateral_id"]),
+			"CollateralGlobalID" : str(t["collateral_global_id"]),
+			"TradeDate" : str(t["trade_date"])[0:10],
+			"SettleDate" : str(t["settle_date"])[0:10],
+			"IsOpenRepo" : t["is_open_repo"] == 1,
+			"MaturityDate" : RepoTransaction.get_maturity_date_string(t["maturity_date"], t["maturity_state"]),
+			"Quantity" : float(t["quantity"]),
+			"Currency" : str(t["currency"]),
+			"Price" : float(t["price"]),
+			"CollateralValue" : float(t["collateral_value"]),
+			"RepoName" : str(t["repo_code"]),
+			"InterestRate" : float(t["interest_rate"]),
+			"LoanAmount" : float(t["loan_amount"]),
+			"Broker" : str(t["broker"]),
+			"Haircut" : float(t["haircut"]),
+			"Status" : str(t["status"]),
+			"DayCount" : str(master["date_count"])
+		}
+
+	def getUserTranIdsFromRepoName(self, params):
+		with self.store.lock:
+			transaction_ids = list(self.store.repo_transactions_by_repo_code \
+										.get(params['repo_code'], {}))
+		return sorted(str(t) for t in transaction_ids)
@@ -0,0 +1,80 @@
+# coding=utf-8
+#
+import threading
+import time
+from datetime import datetime
+
+class MemoryStore:
+
+	#-- one store per process, shared by all controllers in memory mode
+	instance = None
+	instance_lock = threading.Lock()
+
+	@staticmethod
+	def get_instance():
+		with MemoryStore.instance_lock:
+			if MemoryStore.instance is None:
+				MemoryStore.instance = MemoryStore()
+			return MemoryStore.instance
+
+	def __init__(self):
+		#-- all services lock the store while reading or changing it
+		self.lock = threading.RLock()
+		#-- code => repo master
+		self.repo_masters = {}
+		#-- transaction_id => repo transaction
+		self.repo_transactions = {}
+		#-- repo_code / portfolio / status => {transaction_id : None}, a dictionary
+		#-- is used as a set that keeps the insertion order
+		self.repo_transactions_by_repo_code = {}
+		self.repo_transactions_by_portfolio = {}
+		self.repo_transactions_by_status = {}
+		#-- transaction_id => list of repo transaction history in insertion order
+		self.repo_transaction_history = {}
+		#-- time_stamp => {transaction_id : (status, interest_rate)} of the repo snapshots
+		self.repo_snapshots = {}
+		#-- file_hash => ingested file
+		self.ingested_files = {}
+		self.ingested_records = set()
+		#-- id of the records, increasing in insertion order as the auto increment
+		#-- ids of the database, used as the key of pagination
+		self.last_id = 0
+		#-- (seconds since epoch, datetime) of the last now
+		self.last_now = (None, None)
+
+	def now(self):
+		#-- same precision as the MySQL timestamp columns. The datetime of the
+		#-- second is kept, as the batches ask for it for every record
+		seconds = int(time.time())
+		last_now = self.last_now
+		if last_now[0] != seconds:
+			last_now = (seconds, datetime.fromtimestamp(seconds))
+			self.last_now = last_now
+		return last_now[1]
+
+	def next_id(self):
+		self.last_id = self.last_id + 1
+		return self.last_id
+
+	def add_transaction(self, transaction):
+		transaction["id"] = self.next_id()
+		self.repo_transactions[transaction["transaction_id"]] = transaction
+		for index, key in self._get_indexes(transaction):
+			index.setdefault(key, {})[transaction["transaction_id"]] = None
+
+	def set_transaction_status(self, transaction, status):
+		self.repo_transactions_by_status[transaction["status"]].pop(transaction["transaction_id"], None)
+		transaction["status"] = status
+		transaction["updated_at"] = self.now()
+		self.repo_transactions_by_status.setdefault(status, {})[transaction["transaction_id"]] = None
+
+	def clear_transactions(self):
+		self.repo_transactions.clear()
+		self.repo_transactions_by_repo_code.clear()
+		self.repo_transactions_by_portfolio.clear()
+		self.repo_transactions_by_status.clear()
+
+	def _get_indexes(self, transaction):
+		return [(self.repo_transactions_by_repo_code, transaction["repo_code"]),
+				(self.repo_transactions_by_portfolio, transaction["portfolio"]),
+				(self.repo_transactions_by_status, transaction["status"])]
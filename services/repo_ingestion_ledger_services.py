@@ -0,0 +1,93 @@
+# coding=utf-8
+# 
+import logging
+from repo_data.models.repo_ingested_file import RepoIngestedFile
+from repo_data.models.repo_ingested_record import RepoIngestedRecord
+from sqlalchemy.orm import sessionmaker
+
+class RepoIngestionLedgerServices:
+
+	def __init__(self, db):
+		self.logger = logging.getLogger(__name__)
+		self.db = db
+		#-- one session factory for the life of the service
+		self.session_factory = sessionmaker(bind=db)
+
+	def delete_all(self):
+		try:
+			session = self.session_factory()
+			session.query(RepoIngestedRecord).delete()
+			session.query(RepoIngestedFile).delete()
+			session.commit()
+		except Exception as e:
+			self.logger.error("Failed to delete all records in RepoIngestedFile and RepoIngestedRecord")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+
+	def has_file(self, file_hash):
+		try:
+			session = self.session_factory()
+			return bool(session.query(RepoIngestedFile.id) \
+							.filter_by(file_hash=file_hash) \
+							.first())
+		except Exception as e:
+			self.logger.error("Failed to query RepoIngestedFile")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+
+	def add_file(self, ingested_file):
+		try:
+			session = self.session_factory()
+			#-- the same file may be saved by another process in the meantime
+			has_record = bool(session.query(RepoIngestedFile.id) \
+								.filter_by(file_hash=ingested_file['file_hash']) \
+								.first())
+			if not has_record:
+				session.add(RepoIngestedFile(**ingested_file))
+				session.commit()
+				self.logger.info("File " + ingested_file['file_name'] + " added to ledger")
+		except Exception as e:
+			self.logger.error("Failed to add repo_ingested_file")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+
+	def query_records(self, record_hashes, chunk_size=1000):
+		#-- return the subset of record_hashes found in the ledger
+		try:
+			session = self.session_factory()
+			record_hashes = list(set(record_hashes))
+			existing = set()
+			for start in range(0, len(record_hashes), chunk_size):
+				rows = session.query(RepoIngestedRecord.record_hash) \
+							.filter(RepoIngestedRecord.record_hash.in_(record_hashes[start:start + chunk_size])) \
+							.all()
+				existing.update(row[0] for row in rows)
+			return existing
+		except Exception as e:
+			self.logger.error("Failed to query RepoIngestedRecord")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+
+	def add_records(self, record_hashes):
+		try:
+			session = self.session_factory()
+			#-- skip the hashes already in the ledger
+			new_hashes = set(record_hashes) - self.query_records(record_hashes)
+			if len(new_hashes) > 0:
+				session.execute(RepoIngestedRecord.__table__.insert(),
+								[{"record_hash" : h} for h in new_hashes])
+				session.commit()
+		except Exception as e:
+			self.logger.error("Failed to add repo_ingested_records")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
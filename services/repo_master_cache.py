@@ -0,0 +1,119 @@
+# coding=utf-8
+#
+import logging
+import threading
+import time
+from repo_data.models.repo_master import RepoMaster
+from sqlalchemy.orm import sessionmaker
+
+class RepoMasterCache:
+
+	#-- one cache per database url, shared by all controllers in the process
+	instances = {}
+	instances_lock = threading.Lock()
+
+	@staticmethod
+	def get_instance(db):
+		key = str(db.url)
+		with RepoMasterCache.instances_lock:
+			cache = RepoMasterCache.instances.get(key)
+			if cache is None:
+				cache = RepoMasterCache(db)
+				RepoMasterCache.instances[key] = cache
+			else:
+				#-- use the engine of the latest initializeDatastore call
+				if not cache.db is db:
+					cache.db = db
+					cache.session_factory = sessionmaker(bind=db)
+			return cache
+
+	def __init__(self, db, ttl=None):
+		self.logger = logging.getLogger(__name__)
+		self.db = db
+		#-- one session factory for the life of the cache
+		self.session_factory = sessionmaker(bind=db)
+		#-- seconds before the cache is reloaded, None means never expire
+		self.ttl = ttl
+		self.masters = None
+		self.loaded_at = None
+		self.lock = threading.Lock()
+
+	def invalidate(self):
+		with self.lock:
+			self.masters = None
+			self.loaded_at = None
+
+	def get_all(self):
+		#-- return dictionary of code => {code, currency, date_count}
+		with self.lock:
+			if self.masters is None or self._is_expired():
+				self._load()
+			return self.masters
+
+	def get(self, code):
+		#-- return the master of the code, None if not exists
+		return self.get_many([code]).get(code)
+
+	def get_many(self, codes, chunk_size=1000):
+		#-- same as get_all, but the codes not in the cache are read from the
+		#-- database first, as they may be added by another process. Only the
+		#-- missing codes are read, a search of udx_repo_masters__code
+		with self.lock:
+			if self.masters is None or self._is_expired():
+				self._load()
+			missing = list({code for code in codes if not code in self.masters})
+			if len(missing) > 0:
+				self._load_codes(missing, chunk_size)
+			return self.masters
+
+	def _is_expired(self):
+		return not self.ttl is None and \
+				time.monotonic() - self.loaded_at >= self.ttl
+
+	def _load(self):
+		try:
+			session = self.session_factory()
+			rows = session.query(RepoMaster.code, RepoMaster.currency, RepoMaster.date_count).all()
+			self.masters = {
+				row[0] : {
+					"code" : row[0],
+					"currency" : row[1],
+					"date_count" : row[2]
+				} for row in rows
+			}
+			self.loaded_at = time.monotonic()
+			self.logger.debug(str(len(self.masters)) + " repo masters loaded into cache")
+		except Exception as e:
+			self.logger.error("Failed to load RepoMaster into cache")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+
+	def _load_codes(self, codes, chunk_size):
+		try:
+			session = self.session_factory()
+			rows = []
+			for start in range(0, len(codes), chunk_size):
+				rows.extend(session.query(RepoMaster.code, RepoMaster.currency, RepoMaster.date_count) \
+								.filter(RepoMaster.code.in_(codes[start:start + chunk_size])) \
+								.all())
+			if len(rows) > 0:
+				#-- a new dictionary, the one returned before may still be in use
+				masters = dict(self.masters)
+				masters.update({
+					row[0] : {
+						"code" : row[0],
+						"currency" : row[1],
+						"date_count" : row[2]
+					} for row in rows
+				})
+				self.masters = masters
+			self.logger.debug(str(len(rows)) + " of " + str(len(codes)) + \
+								" repo masters not in cache loaded")
+		except Exception as e:
+			self.logger.error("Failed to load RepoMaster of codes into cache")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
@@ -4,39 +4,59 @@ import logging
 from repo_data.utils.error_handling import RepoMasterAlreadyExistError
 from repo_data.constants import Constants
 from repo_data.models.repo_master import RepoMaster
+from repo_data.services.repo_master_cache import RepoMasterCache
+from repo_data.services.result_cache import ResultCache
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
 
 class RepoMasterServices:
 
-	def __init__(self, db):
+	def __init__(self, db, master_cache=None, result_cache=None):
 		self.logger = logging.getLogger(__name__)
 		self.db = db
+		#-- one session factory for the life of the service
+		self.session_factory = sessionmaker(bind=db)
+		self.master_cache = master_cache
+		if self.master_cache is None:
+			self.master_cache = RepoMasterCache.get_instance(db)
+		self.result_cache = result_cache
+		if self.result_cache is None:
+			self.result_cache = ResultCache.get_instance(db)
 
 	def delete_all(self):
 		try:
-			session = sessionmaker(bind=self.db)()
+			session = self.session_factory()
 			session.query(RepoMaster).delete()
 			session.commit()
+			self.master_cache.invalidate()
 		except Exception as e:
 			self.logger.error("Failed to delete all records in RepoMaster")
 			self.logger.error(e)
 			raise
 		finally:
 			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
 
 	def create(self, master):
 		try:
-			session = sessionmaker(bind=self.db)()
-			has_record = bool(session.query(RepoMaster).filter_by(code=master['code']).first())
-			if has_record:
-				message = "Record " + master['code'] + " already exists"
-				self.logger.warn(message)
-				raise RepoMasterAlreadyExistError(message)
-			else:
-				repo_master = RepoMaster(**master)
-				session.add(repo_master)
+			session = self.session_factory()
+			repo_master = RepoMaster(**master)
+			session.add(repo_master)
+			#-- a duplicated code is rejected by udx_repo_masters__code,
+			#-- so no SELECT is needed beforehand
+			try:
 				session.commit()
-				self.logger.info("Record " + master['code'] + " added successfully")
+			except IntegrityError:
+				session.rollback()
+				has_record = bool(session.query(RepoMaster.id).filter_by(code=master['code']).first())
+				if has_record:
+					message = "Record " + master['code'] + " already exists"
+					self.logger.warn(message)
+					raise RepoMasterAlreadyExistError(message)
+				raise
+			self.master_cache.invalidate()
+			self.logger.info("Record " + master['code'] + " added successfully")
 		except RepoMasterAlreadyExistError:
 			#-- avoid RepoMasterAlreadyExistError being captured by Exception
 			raise
@@ -45,4 +65,64 @@ class RepoMasterServices:
 			self.logger.error(e)
 			raise
 		finally:
-			session.close()
\ No newline at end of file
+			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
+
+	def create_batch(self, masters, chunk_size=1000):
+		#-- result of each master in input order, 0 if added or the exception otherwise
+		results = [None] * len(masters)
+		if len(masters) == 0:
+			return results
+		try:
+			session = self.session_factory()
+			#-- pre-fetch the existing codes with a few IN (...) queries
+			codes = list(set(m['code'] for m in masters))
+			existing_codes = set()
+			for start in range(0, len(codes), chunk_size):
+				rows = session.query(RepoMaster.code) \
+							.filter(RepoMaster.code.in_(codes[start:start + chunk_size])) \
+							.all()
+				existing_codes.update(row[0] for row in rows)
+			for start in range(0, len(masters), chunk_size):
+				positions = []
+				for i in range(start, min(start + chunk_size, len(masters))):
+					#-- skip if code already exist (in datastore or earlier in the batch)
+					if masters[i]['code'] in existing_codes:
+						message = "Record " + masters[i]['code'] + " already exists"
+						self.logger.warn(message)
+						results[i] = RepoMasterAlreadyExistError(message)
+						continue
+					existing_codes.add(masters[i]['code'])
+					positions.append(i)
+				if len(positions) == 0:
+					continue
+				try:
+					#-- executemany and commit once per chunk
+					session.execute(RepoMaster.__table__.insert(), [masters[i] for i in positions])
+					session.commit()
+					for i in positions:
+						results[i] = 0
+					self.logger.info(str(len(positions)) + " records added successfully")
+				except Exception as e:
+					#-- fall back to add the chunk one by one so that only the bad rows fail
+					session.rollback()
+					self.logger.warn("Failed to add the chunk in batch, retry one by one")
+					self.logger.warn(e)
+					for i in positions:
+						try:
+							self.create(masters[i])
+							results[i] = 0
+						except Exception as e:
+							results[i] = e
+				finally:
+					self.master_cache.invalidate()
+			return results
+		except Exception as e:
+			self.logger.error("Failed to add repo_masters in batch")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
@@ -0,0 +1,152 @@
+# coding=utf-8
+#
+import logging
+import threading
+from datetime import timedelta
+from repo_data.models.repo_snapshot import RepoSnapshot
+from repo_data.models.repo_snapshot_transaction import RepoSnapshotTransaction
+from repo_data.models.repo_transaction_history import RepoTransactionHistory
+from sqlalchemy import and_, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+class RepoSnapshotServices:
+
+	#-- the state (status, interest rate) of the repo transactions at a time is
+	#-- replayed from the repo transaction history recorded (created_at) on or
+	#-- before it. A snapshot stores the states at its time_stamp, so that only
+	#-- the history added after the nearest snapshot (id > its history_id) is
+	#-- replayed. created_at is set when the history is added, not when it is
+	#-- committed, so a history committed after the snapshot may be recorded
+	#-- before its time_stamp, with an id after its history_id
+
+	def __init__(self, db):
+		self.logger = logging.getLogger(__name__)
+		self.db = db
+		#-- one session factory for the life of the service
+		self.session_factory = sessionmaker(bind=db)
+		#-- ((id, history_id), states) of the last snapshot loaded or added. The
+		#-- states of a snapshot never change, so they are read once
+		self.snapshot_states = None
+		self.lock = threading.Lock()
+
+	def delete_all(self):
+		try:
+			session = self.session_factory()
+			session.query(RepoSnapshotTransaction).delete()
+			session.query(RepoSnapshot).delete()
+			session.commit()
+		except Exception as e:
+			self.logger.error("Failed to delete all records in RepoSnapshot and RepoSnapshotTransaction")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+			with self.lock:
+				self.snapshot_states = None
+
+	def create(self, time_stamp=None, chunk_size=1000):
+		#-- store the states at time_stamp (default the last second) and return
+		#-- the time_stamp. The history of the current second may still grow, so
+		#-- time_stamp must be before it by the clock of the database
+		try:
+			session = self.session_factory()
+			latest = session.query(func.now()).scalar().replace(microsecond=0) - timedelta(seconds=1)
+			if time_stamp is None:
+				time_stamp = latest
+			elif time_stamp > latest:
+				raise ValueError("time_stamp of a snapshot must be before " + \
+									str(latest + timedelta(seconds=1)))
+			has_record = bool(session.query(RepoSnapshot.id) \
+								.filter(RepoSnapshot.time_stamp == time_stamp) \
+								.first())
+			if has_record:
+				return time_stamp
+			history_id, states = self._query_states(session, time_stamp)
+			snapshot = RepoSnapshot(time_stamp, history_id, len(states))
+			session.add(snapshot)
+			session.flush()
+			rows = [{
+						"snapshot_id" : snapshot.id,
+						"transaction_id" : transaction_id,
+						"status" : status,
+						"interest_rate" : interest_rate
+					} for transaction_id, (status, interest_rate) in states.items()]
+			for start in range(0, len(rows), chunk_size):
+				session.execute(RepoSnapshotTransaction.__table__.insert(), rows[start:start + chunk_size])
+			#-- a snapshot of the same time_stamp by another process is rejected
+			#-- by udx_repo_snapshots__time_stamp, it has the same states
+			try:
+				session.commit()
+				with self.lock:
+					self.snapshot_states = ((snapshot.id, history_id), dict(states))
+			except IntegrityError:
+				session.rollback()
+			self.logger.info("Snapshot of " + str(len(states)) + " transactions at " + \
+								str(time_stamp) + " added successfully")
+			return time_stamp
+		except ValueError:
+			#-- avoid ValueError being captured by Exception
+			raise
+		except Exception as e:
+			self.logger.error("Failed to add snapshot")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+
+	def _query_states(self, session, time_stamp):
+		#-- return (history_id, transaction_id => (status, interest_rate)), the
+		#-- states replayed from the history up to history_id, the last history
+		#-- recorded on or before time_stamp
+		history_id = session.execute(self._build_history_id(time_stamp)).scalar() or 0
+		#-- the nearest snapshot, a search of udx_repo_snapshots__time_stamp
+		snapshot = session.query(RepoSnapshot.id, RepoSnapshot.history_id) \
+						.filter(RepoSnapshot.time_stamp <= time_stamp) \
+						.order_by(RepoSnapshot.time_stamp.desc()) \
+						.first()
+		states = {}
+		after_id = 0
+		if not snapshot is None:
+			states = self._get_snapshot_states(session, snapshot)
+			after_id = snapshot.history_id
+		histories = session.execute(self._build_histories(after_id, history_id))
+		return history_id, RepoSnapshotTransaction.replay(states, histories)
+
+	def _build_history_id(self, time_stamp):
+		#-- the id of the last history recorded on or before time_stamp, a search of
+		#-- idx_repo_transaction_history__created_at. A history recorded on or before
+		#-- time_stamp with a greater id is replayed after the snapshot
+		return select([RepoTransactionHistory.id]) \
+			.where(RepoTransactionHistory.created_at <= time_stamp) \
+			.order_by(RepoTransactionHistory.created_at.desc(), RepoTransactionHistory.id.desc()) \
+			.limit(1)
+
+	def _build_histories(self, after_id, history_id):
+		#-- the histories of id after after_id and up to history_id in the order
+		#-- added, a range search of the primary key. Plain rows of a select
+		#-- instead of the Query, as there may be many
+		return select([
+				RepoTransactionHistory.transaction_id, \
+				RepoTransactionHistory.action, \
+				RepoTransactionHistory.interest_rate]) \
+			.where(and_(
+				RepoTransactionHistory.id > after_id,
+				RepoTransactionHistory.id <= history_id)) \
+			.order_by(RepoTransactionHistory.id)
+
+	def _get_snapshot_states(self, session, snapshot):
+		#-- return a copy of the states of the snapshot
+		key = (snapshot.id, snapshot.history_id)
+		with self.lock:
+			snapshot_states = self.snapshot_states
+		if snapshot_states is None or snapshot_states[0] != key:
+			rows = session.execute(select([
+						RepoSnapshotTransaction.transaction_id, \
+						RepoSnapshotTransaction.status, \
+						RepoSnapshotTransaction.interest_rate]) \
+					.where(RepoSnapshotTransaction.snapshot_id == snapshot.id))
+			snapshot_states = (key, {row[0] : (row[1], float(row[2])) for row in rows})
+			with self.lock:
+				self.snapshot_states = snapshot_states
+		return dict(snapshot_states[1])
@@ -3,17 +3,23 @@
 import logging
 from repo_data.constants import Constants
 from repo_data.models.repo_transaction_history import RepoTransactionHistory
+from repo_data.services.result_cache import ResultCache
 from sqlalchemy.orm import sessionmaker
 
 class RepoTransactionHistoryServices:
 
-	def __init__(self, db):
+	def __init__(self, db, result_cache=None):
 		self.logger = logging.getLogger(__name__)
 		self.db = db
+		#-- one session factory for the life of the service
+		self.session_factory = sessionmaker(bind=db)
+		self.result_cache = result_cache
+		if self.result_cache is None:
+			self.result_cache = ResultCache.get_instance(db)
 		
 	def delete_all(self):
 		try:
-			session = sessionmaker(bind=self.db)()
+			session = self.session_factory()
 			session.query(RepoTransactionHistory).delete()
 			session.commit()
 		except Exception as e:
@@ -22,32 +28,18 @@ class RepoTransactionHistoryServices:
 			raise
 		finally:
 			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
 
 	def query(self, params):
 		try:
-			session = sessionmaker(bind=self.db)()
-			transaction_histories = session.query(
-					RepoTransactionHistory.transaction_id.label("TransactionId"), \
-					RepoTransactionHistory.action.label("Action"), \
-					RepoTransactionHistory.date.label("Date"), \
-					RepoTransactionHistory.interest_rate.label("InterestRate"), \
-					RepoTransactionHistory.created_at.label("TimeStamp")) \
-				.filter(RepoTransactionHistory.transaction_id == params['transaction_id']) \
-				.order_by(RepoTransactionHistory.created_at)
+			session = self.session_factory()
+			transaction_histories = self._build_query(session, params) \
+										.order_by(RepoTransactionHistory.created_at, RepoTransactionHistory.id)
 			#self.logger.debug("Print the generated SQL:")
 			#self.logger.debug(transaction_histories)
 			#-- return as list of dictionary
-			def model2dict(row):
-				d = {}
-				for column in row.keys():
-					if column == "Date":
-						d[column] = str(getattr(row, column))[0:10]
-					elif column == "InterestRate":
-						d[column] = float(getattr(row, column))
-					else:
-						d[column] = str(getattr(row, column))
-				return d
-			transaction_histories_d = [model2dict(t) for t in transaction_histories]
+			transaction_histories_d = [self._model2dict(t) for t in transaction_histories]
 			#self.logger.error("Print the list of dictionary output:")
 			#self.logger.debug(transaction_histories_d)
 			return transaction_histories_d
@@ -56,4 +48,53 @@ class RepoTransactionHistoryServices:
 			self.logger.error(e)
 			raise
 		finally:
-			session.close()
\ No newline at end of file
+			session.close()
+
+	def query_page(self, params, page_size, after_id=None):
+		#-- return (list of dictionary, id of the last history or None if no more page).
+		#-- Keyset pagination ordered by id, which is in the index of transaction_id
+		try:
+			session = self.session_factory()
+			transaction_histories = self._build_query(session, params) \
+										.add_columns(RepoTransactionHistory.id.label("Id"))
+			if not after_id is None:
+				transaction_histories = transaction_histories.filter(RepoTransactionHistory.id > after_id)
+			#-- one more row to know whether there is a next page
+			transaction_histories = transaction_histories.order_by(RepoTransactionHistory.id) \
+										.limit(page_size + 1) \
+										.all()
+			last_id = None
+			if len(transaction_histories) > page_size:
+				transaction_histories = transaction_histories[0:page_size]
+				last_id = transaction_histories[-1].Id
+			return [self._model2dict(t) for t in transaction_histories], last_id
+		except Exception as e:
+			self.logger.error("Error message:")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+
+	def _build_query(self, session, params):
+		return session.query(
+				RepoTransactionHistory.transaction_id.label("TransactionId"), \
+				RepoTransactionHistory.action.label("Action"), \
+				RepoTransactionHistory.date.label("Date"), \
+				RepoTransactionHistory.interest_rate.label("InterestRate"), \
+				RepoTransactionHistory.created_at.label("TimeStamp")) \
+			.filter(RepoTransactionHistory.transaction_id == params['transaction_id'])
+
+	def _model2dict(self, row):
+		#-- return as dictionary
+		d = {}
+		for column in row.keys():
+			if column == "Id":
+				#-- the key of pagination, not part of the output
+				continue
+			elif column == "Date":
+				d[column] = str(getattr(row, column))[0:10]
+			elif column == "InterestRate":
+				d[column] = float(getattr(row, column))
+			else:
+				d[column] = str(getattr(row, column))
+		return d
@@ -4,9 +4,14 @@ import logging
 from datetime import datetime
 from repo_data.constants import Constants
 from repo_data.models.repo_master import RepoMaster
+from repo_data.models.repo_snapshot import RepoSnapshot
+from repo_data.models.repo_snapshot_transaction import RepoSnapshotTransaction
 from repo_data.models.repo_transaction import RepoTransaction
 from repo_data.models.repo_transaction_history import RepoTransactionHistory
-from sqlalchemy import and_, or_
+from repo_data.services.repo_master_cache import RepoMasterCache
+from repo_data.services.result_cache import ResultCache
+from sqlalchemy import and_, or_, bindparam, case, exists, func, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
 from repo_data.utils.error_handling import (RepoTransactionAlreadyExistError,
 											RepoTransactionNotExistError,
@@ -15,13 +20,21 @@ from repo_data.utils.error_handling import (RepoTransactionAlreadyExistError,
 
 class RepoTransactionServices:
 
-	def __init__(self, db):
+	def __init__(self, db, master_cache=None, result_cache=None):
 		self.logger = logging.getLogger(__name__)
 		self.db = db
+		#-- one session factory for the life of the service
+		self.session_factory = sessionmaker(bind=db)
+		self.master_cache = master_cache
+		if self.master_cache is None:
+			self.master_cache = RepoMasterCache.get_instance(db)
+		self.result_cache = result_cache
+		if self.result_cache is None:
+			self.result_cache = ResultCache.get_instance(db)
 
 	def delete_all(self):
 		try:
-			session = sessionmaker(bind=self.db)()
+			session = self.session_factory()
 			session.query(RepoTransaction).delete()
 			session.commit()
 		except Exception as e:
@@ -30,25 +43,17 @@ class RepoTransactionServices:
 			raise
 		finally:
 			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
 
 	def create(self, transaction):
 		try:
-			session = sessionmaker(bind=self.db)()
-			#-- throw exception if transaction_id already exist
-			has_record = bool(session.query(RepoTransaction) \
-									.filter_by(transaction_id=transaction['transaction_id']) \
-									.first())
-			if has_record:
-				message = "transaction_id: " + \
-							transaction['transaction_id'] + \
-							". record already exists"
-				self.logger.warn(message)
-				raise RepoTransactionAlreadyExistError(message)
-			#-- throw exception if transaction_id already exist
-			has_repo_master_record = bool(session.query(RepoMaster) \
-									.filter_by(code=transaction['repo_code']) \
-									.first())
+			session = self.session_factory()
+			#-- throw exception if repo_code not exist
+			has_repo_master_record = not self.master_cache.get(transaction['repo_code']) is None
 			if not has_repo_master_record:
+				#-- an existing transaction_id is reported first
+				self._check_not_exist(session, transaction)
 				message = "transaction_id: " + \
 							transaction['transaction_id'] + \
 							". The transaction's repo_code " + \
@@ -59,16 +64,17 @@ class RepoTransactionServices:
 			#-- create transaction
 			session.add(repo_transaction)
 			#-- add transaction history
-			transaction_history = {
-				"transaction_id" : transaction["transaction_id"],
-				"action" : Constants.REPO_TRANS_HISTORY_ACTION_OPEN,
-				"date" : transaction["settle_date"],
-				"interest_rate" : transaction["interest_rate"]
-			}
-			repo_transaction_history = RepoTransactionHistory(**transaction_history)
+			repo_transaction_history = RepoTransactionHistory(**self._get_open_history(transaction))
 			session.add(repo_transaction_history)
-			#-- commit the transaction after both transaction and transaction_history added
-			session.commit()
+			#-- commit the transaction after both transaction and transaction_history added.
+			#-- A duplicated transaction_id is rejected by udx_repo_transactions__transaction_id,
+			#-- so no SELECT is needed beforehand
+			try:
+				session.commit()
+			except IntegrityError:
+				session.rollback()
+				self._check_not_exist(session, transaction)
+				raise
 			self.logger.info("Record " +  transaction['transaction_id'] + " added successfully")
 		except RepoTransactionAlreadyExistError:
 			#-- avoid RepoTransactionAlreadyExistError being captured by Exception
@@ -82,10 +88,114 @@ class RepoTransactionServices:
 			raise
 		finally:
 			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
+
+	def _check_not_exist(self, session, transaction):
+		#-- throw exception if transaction_id already exist
+		has_record = bool(session.query(RepoTransaction.id) \
+								.filter_by(transaction_id=transaction['transaction_id']) \
+								.first())
+		if has_record:
+			message = "transaction_id: " + \
+						transaction['transaction_id'] + \
+						". record already exists"
+			self.logger.warn(message)
+			raise RepoTransactionAlreadyExistError(message)
+
+	def create_batch(self, transactions, chunk_size=1000):
+		#-- result of each transaction in input order, 0 if added or the exception otherwise
+		results = [None] * len(transactions)
+		if len(transactions) == 0:
+			return results
+		try:
+			session = self.session_factory()
+			#-- pre-fetch the existing transaction_ids and repo codes with a few IN (...) queries
+			existing_ids = self._query_existing(session, RepoTransaction.transaction_id,
+										[t['transaction_id'] for t in transactions], chunk_size)
+			#-- the repo masters not in the cache may be added by another process,
+			#-- get_many reads them from the database
+			masters = self.master_cache.get_many([t['repo_code'] for t in transactions])
+			master_codes = set(masters)
+			for start in range(0, len(transactions), chunk_size):
+				positions = []
+				for i in range(start, min(start + chunk_size, len(transactions))):
+					transaction = transactions[i]
+					#-- skip if transaction_id already exist (in datastore or earlier in the batch)
+					if transaction['transaction_id'] in existing_ids:
+						message = "transaction_id: " + \
+									transaction['transaction_id'] + \
+									". record already exists"
+						self.logger.warn(message)
+						results[i] = RepoTransactionAlreadyExistError(message)
+						continue
+					#-- skip if the transaction's repo_code not exist
+					if not transaction['repo_code'] in master_codes:
+						message = "transaction_id: " + \
+									transaction['transaction_id'] + \
+									". The transaction's repo_code " + \
+									transaction['repo_code'] + " not exists"
+						self.logger.warn(message)
+						results[i] = RepoMasterNotExistError(message)
+						continue
+					existing_ids.add(transaction['transaction_id'])
+					positions.append(i)
+				if len(positions) == 0:
+					continue
+				try:
+					#-- executemany for both tables and commit once per chunk
+					session.execute(RepoTransaction.__table__.insert(),
+									[transactions[i] for i in positions])
+					session.execute(RepoTransactionHistory.__table__.insert(),
+									[self._get_open_history(transactions[i]) for i in positions])
+					session.commit()
+					for i in positions:
+						results[i] = 0
+					self.logger.info(str(len(positions)) + " records added successfully")
+				except Exception as e:
+					#-- fall back to add the chunk one by one so that only the bad rows fail
+					session.rollback()
+					self.logger.warn("Failed to add the chunk in batch, retry one by one")
+					self.logger.warn(e)
+					for i in positions:
+						try:
+							self.create(transactions[i])
+							results[i] = 0
+						except Exception as e:
+							results[i] = e
+			return results
+		except Exception as e:
+			self.logger.error("Failed to add transactions in batch")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
+
+	def _query_existing(self, session, column, values, chunk_size):
+		#-- return the subset of values found in the given column
+		values = list(set(values))
+		existing = set()
+		for start in range(0, len(values), chunk_size):
+			rows = session.query(column) \
+						.filter(column.in_(values[start:start + chunk_size])) \
+						.all()
+			existing.update(row[0] for row in rows)
+		return existing
+
+	def _get_open_history(self, transaction):
+		transaction_history = {
+			"transaction_id" : transaction["transaction_id"],
+			"action" : Constants.REPO_TRANS_HISTORY_ACTION_OPEN,
+			"date" : transaction["settle_date"],
+			"interest_rate" : transaction["interest_rate"]
+		}
+		return transaction_history
 
 	def cancel(self, transaction):
 		try:
-			session = sessionmaker(bind=self.db)()
+			session = self.session_factory()
 			repo_trans_to_cxl = session.query(RepoTransaction) \
 								.filter_by(transaction_id=transaction['transaction_id']) \
 								.first()
@@ -118,10 +228,12 @@ class RepoTransactionServices:
 			raise
 		finally:
 			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
 
 	def close(self, transaction):
 		try:
-			session = sessionmaker(bind=self.db)()
+			session = self.session_factory()
 			repo_trans_to_cls = session.query(RepoTransaction) \
 								.filter_by(transaction_id=transaction['transaction_id']) \
 								.first()
@@ -164,10 +276,144 @@ class RepoTransactionServices:
 			raise
 		finally:
 			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
+
+	def cancel_batch(self, transactions, chunk_size=1000):
+		#-- result of each cancel in input order, 0 if done or the exception otherwise
+		results = [None] * len(transactions)
+		if len(transactions) == 0:
+			return results
+		try:
+			session = self.session_factory()
+			statuses = self._query_statuses(session, [t['transaction_id'] for t in transactions], chunk_size)
+			positions = []
+			transaction_histories = []
+			for i, transaction in enumerate(transactions):
+				#-- throw error if transaction not exists
+				if not transaction['transaction_id'] in statuses:
+					message = "transaction_id: " + \
+								transaction['transaction_id'] + \
+								" not exists"
+					self.logger.warn(message)
+					results[i] = RepoTransactionNotExistError(message)
+					continue
+				transaction_histories.append({
+					"transaction_id" : transaction['transaction_id'],
+					"action" : Constants.REPO_TRANS_HISTORY_ACTION_CANCEL,
+					"date" : datetime.today().strftime('%Y-%m-%d'),
+					"interest_rate" : 0
+				})
+				positions.append(i)
+			self._update_status_batch(session, Constants.REPO_TRANS_STATUS_CANCEL,
+										transaction_histories, chunk_size,
+										self.cancel, transactions, positions, results)
+			return results
+		except Exception as e:
+			self.logger.error("Failed to cancel transactions in batch")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
+
+	def close_batch(self, transactions, chunk_size=1000):
+		#-- result of each close in input order, 0 if done or the exception otherwise
+		results = [None] * len(transactions)
+		if len(transactions) == 0:
+			return results
+		try:
+			session = self.session_factory()
+			statuses = self._query_statuses(session, [t['transaction_id'] for t in transactions], chunk_size)
+			positions = []
+			transaction_histories = []
+			for i, transaction in enumerate(transactions):
+				#-- throw error if transaction not exists
+				if not transaction['transaction_id'] in statuses:
+					message = "transaction_id: " + \
+								transaction['transaction_id'] + \
+								" not exists"
+					self.logger.warn(message)
+					results[i] = RepoTransactionNotExistError(message)
+					continue
+				#-- throw error if transaction has been canceled
+				if statuses[transaction['transaction_id']] == Constants.REPO_TRANS_STATUS_CANCEL:
+					message = "transaction_id: " + \
+								transaction['transaction_id'] + \
+								". is either closed or canceled"
+					self.logger.warn(message)
+					results[i] = CloseCanceledRepoTransactionError(message)
+					continue
+				transaction_histories.append({
+					"transaction_id" : transaction['transaction_id'],
+					"action" : Constants.REPO_TRANS_HISTORY_ACTION_CLOSE,
+					"date" : transaction["maturity_date"],
+					"interest_rate" : 0
+				})
+				positions.append(i)
+			self._update_status_batch(session, Constants.REPO_TRANS_STATUS_CLOSE,
+										transaction_histories, chunk_size,
+										self.close, transactions, positions, results)
+			return results
+		except Exception as e:
+			self.logger.error("Failed to close transactions in batch")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
+
+	def _query_statuses(self, session, transaction_ids, chunk_size):
+		#-- return dictionary of transaction_id => status of the existing transactions
+		transaction_ids = list(set(transaction_ids))
+		statuses = {}
+		for start in range(0, len(transaction_ids), chunk_size):
+			rows = session.query(RepoTransaction.transaction_id, RepoTransaction.status) \
+						.filter(RepoTransaction.transaction_id.in_(transaction_ids[start:start + chunk_size])) \
+						.all()
+			statuses.update((row[0], row[1]) for row in rows)
+		return statuses
+
+	def _update_status_batch(self, session, status, transaction_histories, chunk_size,
+								update_one, transactions, positions, results):
+		#-- set the status of the transactions of the history records with a few
+		#-- UPDATE ... WHERE transaction_id IN (...), add the history records with
+		#-- multi-row inserts, and commit once. The results of the transactions at
+		#-- positions are set to 0, or if the batch fails, to the result of
+		#-- update_one (cancel or close) of each of them
+		if len(transaction_histories) == 0:
+			return
+		transaction_ids = list(dict.fromkeys(h["transaction_id"] for h in transaction_histories))
+		try:
+			for start in range(0, len(transaction_ids), chunk_size):
+				session.execute(RepoTransaction.__table__.update() \
+									.where(RepoTransaction.transaction_id.in_(transaction_ids[start:start + chunk_size])) \
+									.values(status=status))
+			for start in range(0, len(transaction_histories), chunk_size):
+				session.execute(RepoTransactionHistory.__table__.insert() \
+									.values(transaction_histories[start:start + chunk_size]))
+			session.commit()
+			for i in positions:
+				results[i] = 0
+			self.logger.info(str(len(transaction_histories)) + " " + status + " of " + \
+								str(len(transaction_ids)) + " records updated successfully")
+		except Exception as e:
+			#-- fall back to update one by one so that only the bad rows fail
+			session.rollback()
+			self.logger.warn("Failed to update the status in batch, retry one by one")
+			self.logger.warn(e)
+			for i in positions:
+				try:
+					update_one(transactions[i])
+					results[i] = 0
+				except Exception as e:
+					results[i] = e
 
 	def rerate(self, transaction):
 		try:
-			session = sessionmaker(bind=self.db)()
+			session = self.session_factory()
 			repo_trans_to_rerate = session.query(RepoTransaction) \
 								.filter_by(transaction_id=transaction['transaction_id']) \
 								.first()
@@ -211,214 +457,406 @@ class RepoTransactionServices:
 			raise
 		finally:
 			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
+
+	def rerate_batch(self, transactions, chunk_size=1000):
+		#-- result of each rerate in input order, 0 if done or the exception otherwise
+		results = [None] * len(transactions)
+		if len(transactions) == 0:
+			return results
+		try:
+			session = self.session_factory()
+			#-- group the rerates by transaction_id, each group sorted by rate_date
+			groups = {}
+			for i, transaction in enumerate(transactions):
+				groups.setdefault(transaction['transaction_id'], []).append(i)
+			for positions in groups.values():
+				positions.sort(key=lambda i: transactions[i]['rate_date'])
+			#-- get the status of all transactions with a few IN (...) queries
+			statuses = self._query_statuses(session, list(groups), chunk_size)
+			transaction_updates = []
+			transaction_histories = []
+			rerate_positions = []
+			for transaction_id, positions in groups.items():
+				error = None
+				#-- throw error if transaction not exists
+				if not transaction_id in statuses:
+					message = "transaction_id: " + \
+								transaction_id + \
+								" not exists"
+					self.logger.warn(message)
+					error = RepoTransactionNotExistError(message)
+				#-- throw error if transaction has been closed or canceled
+				elif statuses[transaction_id] == Constants.REPO_TRANS_STATUS_CANCEL or \
+						statuses[transaction_id] == Constants.REPO_TRANS_STATUS_CLOSE:
+					message = "transaction_id: " + \
+								transaction_id + \
+								". is either closed or canceled"
+					self.logger.warn(message)
+					error = CloseCanceledRepoTransactionError(message)
+				if error is not None:
+					for i in positions:
+						results[i] = error
+					continue
+				#-- one history record per rerate, one update per transaction with the latest rate
+				for i in positions:
+					transaction_histories.append({
+						"transaction_id" : transaction_id,
+						"action" : Constants.REPO_TRANS_HISTORY_ACTION_RERATE,
+						"date" : transactions[i]["rate_date"],
+						"interest_rate" : float(transactions[i]["interest_rate"])
+					})
+				transaction_updates.append({
+					"b_transaction_id" : transaction_id,
+					"b_interest_rate" : float(transactions[positions[-1]]["interest_rate"])
+				})
+				rerate_positions.extend(positions)
+			if len(transaction_updates) > 0:
+				try:
+					session.execute(RepoTransaction.__table__.update() \
+										.where(RepoTransaction.transaction_id == bindparam("b_transaction_id")) \
+										.values(interest_rate=bindparam("b_interest_rate")),
+									transaction_updates)
+					#-- multi-row insert of the history records
+					for start in range(0, len(transaction_histories), chunk_size):
+						session.execute(RepoTransactionHistory.__table__.insert() \
+											.values(transaction_histories[start:start + chunk_size]))
+					session.commit()
+					self.logger.info(str(len(transaction_histories)) + " rerates of " + \
+										str(len(transaction_updates)) + " records updated successfully")
+				except Exception as e:
+					#-- fall back to rerate one by one (each transaction by rate_date)
+					#-- so that only the bad rows fail
+					session.rollback()
+					self.logger.warn("Failed to rerate in batch, retry one by one")
+					self.logger.warn(e)
+					for i in rerate_positions:
+						try:
+							self.rerate(transactions[i])
+						except Exception as e:
+							results[i] = e
+			for i in range(len(transactions)):
+				if results[i] is None:
+					results[i] = 0
+			return results
+		except Exception as e:
+			self.logger.error("Failed to rerate transactions in batch")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+			#-- cached results are stale after a write
+			self.result_cache.bump()
 
 	def query(self, params):
 		try:
-			session = sessionmaker(bind=self.db)()
-			conditions = []
-			if not params["status"] is None and not params["status"] is "all":
-				if str(params["status"]).lower() == Constants.REPO_TRANS_STATUS_OPEN:
-					date_to_compare = datetime.strptime(params["date"], '%Y-%m-%d')
-					conditions.append(
-						and_(
-								(RepoTransaction.status == params["status"]),
-								(or_(
-									RepoTransaction.is_open_repo == 1,
-									RepoTransaction.maturity_date > date_to_compare
-									)
-								)
-							)
-					)
-				elif str(params["status"]).lower() == Constants.REPO_TRANS_STATUS_CLOSE:
-					date_to_compare = datetime.strptime(params["date"], '%Y-%m-%d')
-					conditions.append(
-						or_(
-								(RepoTransaction.status == params["status"]),
-								(and_(
-									RepoTransaction.is_open_repo == 0,
-									RepoTransaction.maturity_date <= date_to_compare,
-									RepoTransaction.status != Constants.REPO_TRANS_STATUS_CANCEL
-									)
-								)
-							) 
-					)
-				elif str(params["status"]).lower() == Constants.REPO_TRANS_STATUS_CANCEL:
-					conditions.append(RepoTransaction.status == params["status"])
-				else:
-					self.logger.warn("Unknown query status: " + str(params["status"]))
-			if not params["portfolio"] is None and not params["portfolio"] is "all":
-				conditions.append(RepoTransaction.portfolio == params["portfolio"])
-			if not params["custodian"] is None and not params["custodian"] is "all":
-				conditions.append(RepoTransaction.custodian == params["custodian"])
-			if not params["repo_code"] is None and not params["repo_code"] is "all":
-				conditions.append(RepoTransaction.repo_code == params["repo_code"])
-			if not params["broker"] is None and not params["broker"] is "all":
-				conditions.append(RepoTransaction.broker == params["broker"])
-			if not params["has_hair_cut"] is None and not params["has_hair_cut"] is "all":
-				if str(params["has_hair_cut"]).lower() == "true":
-					conditions.append(RepoTransaction.haircut != 0)
-				else:
-					conditions.append(RepoTransaction.haircut == 0)
-			#self.logger.debug(str(conditions))
-			transactions = session.query(
-					RepoTransaction.transaction_id.label("TransactionId"), \
-					RepoTransaction.transaction_type.label("Type"), \
-					RepoTransaction.portfolio.label("Portfolio"), \
-					RepoTransaction.custodian.label("Custodian"), \
-					RepoTransaction.collateral_id_type.label("CollateralIDType"), \
-					RepoTransaction.collateral_id.label("CollateralID"), \
-					RepoTransaction.collateral_global_id.label("CollateralGlobalID"), \
-					RepoTransaction.trade_date.label("TradeDate"), \
-					RepoTransaction.settle_date.label("SettleDate"), \
-					RepoTransaction.is_open_repo.label("IsOpenRepo"), \
-					RepoTransaction.maturity_date.label("MaturityDate"), \
-					RepoTransaction.quantity.label("Quantity"), \
-					RepoTransaction.currency.label("Currency"), \
-					RepoTransaction.price.label("Price"), \
-					RepoTransaction.collateral_value.label("CollateralValue"), \
-					RepoTransaction.repo_code.label("RepoName"), \
-					RepoTransaction.interest_rate.label("InterestRate"), \
-					RepoTransaction.loan_amount.label("LoanAmount"), \
-					RepoTransaction.broker.label("Broker"), \
-					RepoTransaction.haircut.label("Haircut"), \
-					RepoTransaction.status.label("Status"),
-					RepoMaster.date_count.label("DayCount")) \
-				.filter(RepoTransaction.repo_code == RepoMaster.code) \
-				.filter(and_(*conditions))
-			#self.logger.debug("Print the generated SQL:")
-			#self.logger.debug(transactions)
-			#-- return as list of dictionary
-			def model2dict(row):
-				d = {}
-				for column in row.keys():
-					if column == "TradeDate" or \
-							column == "SettleDate":
-						d[column] = str(getattr(row, column))[0:10]
-					elif column == "Quantity" or \
-							column == "Quantity" or \
-							column == "Price" or \
-							column == "CollateralValue" or \
-							column == "InterestRate" or \
-							column == "LoanAmount" or \
-							column == "Haircut":
-						d[column] = float(getattr(row, column))
-					elif column == "IsOpenRepo":
-						if getattr(row, column) == 1:
-							d[column] = True
-						else:
-							d[column] = False
-					else:
-						d[column] = str(getattr(row, column))
-				return d
-			transactions_d = [model2dict(t) for t in transactions]
+			session = self.session_factory()
+			transactions = self._build_query(session, params).all()
+			#-- the repo masters not in the cache may be added by another process,
+			#-- get_many reads them from the database
+			masters = self.master_cache.get_many([t.RepoName for t in transactions])
+			#-- skip transactions without repo master as the join did
+			transactions_d = [self._model2dict(t, masters) for t in transactions if t.RepoName in masters]
 			#self.logger.error("Print the list of dictionary output:")
 			#self.logger.debug(transactions_d)
 			return transactions_d
 		except Exception as e:
 			self.logger.error("Failed to exceution the query:")
-			self.logger.error(conditions)
+			self.logger.error(params)
 			self.logger.error("Error message:")
 			self.logger.error(e)
 			raise
 		finally:
 			session.close()
 
-	def query(self, params):
+	def query_columns(self, params):
+		#-- same result as query, as dictionary of column name => list of values
+		#-- fetched from the database, without converting each row to a dictionary
 		try:
-			session = sessionmaker(bind=self.db)()
-			conditions = []
-			if not params["status"] is None and not params["status"] is "all":
-				if str(params["status"]).lower() == Constants.GETREPO_STATUS_OPENCLOSE:
-					conditions.append(
-						or_(
-								(RepoTransaction.status == Constants.REPO_TRANS_STATUS_OPEN),
-								(RepoTransaction.status == Constants.REPO_TRANS_STATUS_CLOSE)
-							)
-					)
-				elif str(params["status"]).lower() == Constants.REPO_TRANS_STATUS_CANCEL:
-					conditions.append(RepoTransaction.status == params["status"])
-				else:
-					self.logger.warn("Unknown query status: " + str(params["status"]))
-			if not params["portfolio"] is None and not params["portfolio"] is "all":
-				conditions.append(RepoTransaction.portfolio == params["portfolio"])
-			if not params["custodian"] is None and not params["custodian"] is "all":
-				conditions.append(RepoTransaction.custodian == params["custodian"])
-			if not params["repo_code"] is None and not params["repo_code"] is "all":
-				conditions.append(RepoTransaction.repo_code == params["repo_code"])
-			if not params["broker"] is None and not params["broker"] is "all":
-				conditions.append(RepoTransaction.broker == params["broker"])
-			if not params["has_hair_cut"] is None and not params["has_hair_cut"] is "all":
-				if str(params["has_hair_cut"]).lower() == "true":
-					conditions.append(RepoTransaction.haircut != 0)
-				else:
-					conditions.append(RepoTransaction.haircut == 0)
-			#self.logger.debug(str(conditions))
-			transactions = session.query(
-					RepoTransaction.transaction_id.label("TransactionId"), \
-					RepoTransaction.transaction_type.label("Type"), \
-					RepoTransaction.portfolio.label("Portfolio"), \
-					RepoTransaction.custodian.label("Custodian"), \
-					RepoTransaction.collateral_id_type.label("CollateralIDType"), \
-					RepoTransaction.collateral_id.label("CollateralID"), \
-					RepoTransaction.collateral_global_id.label("CollateralGlobalID"), \
-					RepoTransaction.trade_date.label("TradeDate"), \
-					RepoTransaction.settle_date.label("SettleDate"), \
-					RepoTransaction.is_open_repo.label("IsOpenRepo"), \
-					RepoTransaction.maturity_date.label("MaturityDate"), \
-					RepoTransaction.quantity.label("Quantity"), \
-					RepoTransaction.currency.label("Currency"), \
-					RepoTransaction.price.label("Price"), \
-					RepoTransaction.collateral_value.label("CollateralValue"), \
-					RepoTransaction.repo_code.label("RepoName"), \
-					RepoTransaction.interest_rate.label("InterestRate"), \
-					RepoTransaction.loan_amount.label("LoanAmount"), \
-					RepoTransaction.broker.label("Broker"), \
-					RepoTransaction.haircut.label("Haircut"), \
-					RepoTransaction.status.label("Status"),
-					RepoMaster.date_count.label("DayCount")) \
-				.filter(RepoTransaction.repo_code == RepoMaster.code) \
-				.filter(and_(*conditions))
-			#self.logger.debug("Print the generated SQL:")
-			#self.logger.debug(transactions)
-			#-- return as list of dictionary
-			def model2dict(row):
-				d = {}
-				for column in row.keys():
-					if column == "TradeDate" or \
-							column == "SettleDate":
-						d[column] = str(getattr(row, column))[0:10]
-					elif column == "Quantity" or \
-							column == "Quantity" or \
-							column == "Price" or \
-							column == "CollateralValue" or \
-							column == "InterestRate" or \
-							column == "LoanAmount" or \
-							column == "Haircut":
-						d[column] = float(getattr(row, column))
-					elif column == "IsOpenRepo":
-						if getattr(row, column) == 1:
-							d[column] = True
-						else:
-							d[column] = False
-					else:
-						d[column] = str(getattr(row, column))
-				return d
-			transactions_d = [model2dict(t) for t in transactions]
-			#self.logger.error("Print the list of dictionary output:")
-			#self.logger.debug(transactions_d)
-			return transactions_d
+			session = self.session_factory()
+			transactions = self._build_query(session, params)
+			names = [column["name"] for column in transactions.column_descriptions]
+			transactions = transactions.all()
+			repo_name = names.index("RepoName")
+			#-- the repo masters not in the cache may be added by another process,
+			#-- get_many reads them from the database
+			masters = self.master_cache.get_many([t[repo_name] for t in transactions])
+			#-- skip transactions without repo master as the join did
+			transactions = [t for t in transactions if t[repo_name] in masters]
+			columns = {name : [t[i] for t in transactions] for i, name in enumerate(names)}
+			columns["MaturityDate"] = list(map(RepoTransaction.get_maturity_date_string,
+												columns["MaturityDate"], columns.pop("MaturityState")))
+			columns["DayCount"] = [masters[code]["date_count"] for code in columns["RepoName"]]
+			return columns
+		except Exception as e:
+			self.logger.error("Failed to exceution the query:")
+			self.logger.error(params)
+			self.logger.error("Error message:")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+
+	def query_iter(self, params, chunk_size=1000):
+		#-- same result as query, but yield the transactions one by one while fetching
+		#-- chunk_size rows at a time from a server-side cursor (if supported by the
+		#-- driver). The session is open until the iterator is exhausted or closed
+		session = self.session_factory()
+		try:
+			masters = self.master_cache.get_all()
+			#-- repo codes not found in the database
+			missing = set()
+			for t in self._build_query(session, params).yield_per(chunk_size):
+				if not t.RepoName in masters and not t.RepoName in missing:
+					#-- the repo master may be added by another process
+					masters = self.master_cache.get_many([t.RepoName])
+					if not t.RepoName in masters:
+						missing.add(t.RepoName)
+				#-- skip transactions without repo master as the join did
+				if t.RepoName in masters:
+					yield self._model2dict(t, masters)
+		except Exception as e:
+			self.logger.error("Failed to exceution the query:")
+			self.logger.error(params)
+			self.logger.error("Error message:")
+			self.logger.error(e)
+			raise
+		finally:
+			session.close()
+
+	def query_page(self, params, page_size, after_id=None):
+		#-- return (list of dictionary, id of the last transaction or None if no more page).
+		#-- Keyset pagination ordered by id, which starts from an index seek of
+		#-- id > after_id, so a page costs the same however deep it is. Only the
+		#-- pages are ordered, getRepo and iterRepo are not
+		try:
+			session = self.session_factory()
+			transactions = self._build_query(session, params) \
+								.add_columns(RepoTransaction.id.label("Id"))
+			if not after_id is None:
+				transactions = transactions.filter(RepoTransaction.id > after_id)
+			#-- one more row to know whether there is a next page
+			transactions = transactions.order_by(RepoTransaction.id).limit(page_size + 1).all()
+			last_id = None
+			if len(transactions) > page_size:
+				transactions = transactions[0:page_size]
+				last_id = transactions[-1].Id
+			#-- the repo masters not in the cache may be added by another process,
+			#-- get_many reads them from the database
+			masters = self.master_cache.get_many([t.RepoName for t in transactions])
+			#-- skip transactions without repo master as the join did
+			transactions_d = [self._model2dict(t, masters) for t in transactions if t.RepoName in masters]
+			return transactions_d, last_id
 		except Exception as e:
 			self.logger.error("Failed to exceution the query:")
-			self.logger.error(conditions)
+			self.logger.error(params)
 			self.logger.error("Error message:")
 			self.logger.error(e)
 			raise
 		finally:
 			session.close()
+
+	def _build_query(self, session, params):
+		conditions = []
+		status = RepoTransaction.status
+		interest_rate = RepoTransaction.interest_rate
+		#-- given by getRepoAtTime only
+		time_stamp = params.get("time_stamp")
+		if not time_stamp is None:
+			#-- the status and interest rate at the time instead of the current ones,
+			#-- for the transactions added on or before the time
+			status, interest_rate, is_added = self._get_state_at(session, time_stamp)
+			conditions.append(is_added)
+		elif not params["as_of_date"] is None:
+			#-- the status as of the date instead of the current one, for the
+			#-- transactions settled on or before the date
+			status = self._get_status_as_of(params["as_of_date"])
+			conditions.append(RepoTransaction.settle_date <= params["as_of_date"])
+		if not time_stamp is None or not params["as_of_date"] is None:
+			if not params["status"] is None and not params["status"] is "all":
+				if str(params["status"]).lower() == Constants.GETREPO_STATUS_OPENCLOSE:
+					conditions.append(status.in_([Constants.REPO_TRANS_STATUS_OPEN, Constants.REPO_TRANS_STATUS_CLOSE]))
+				elif str(params["status"]).lower() == Constants.REPO_TRANS_STATUS_CANCEL:
+					#-- a canceled transaction stays canceled, so the index of status applies
+					conditions.append(RepoTransaction.status == params["status"])
+					conditions.append(status == params["status"])
+				else:
+					conditions.append(status == params["status"])
+		elif not params["status"] is None and not params["status"] is "all":
+			if str(params["status"]).lower() == Constants.GETREPO_STATUS_OPENCLOSE:
+				conditions.append(
+					or_(
+							(RepoTransaction.status == Constants.REPO_TRANS_STATUS_OPEN),
+							(RepoTransaction.status == Constants.REPO_TRANS_STATUS_CLOSE)
+						)
+				)
+			elif str(params["status"]).lower() == Constants.REPO_TRANS_STATUS_CANCEL:
+				conditions.append(RepoTransaction.status == params["status"])
+			else:
+				self.logger.warn("Unknown query status: " + str(params["status"]))
+		if not params["portfolio"] is None and not params["portfolio"] is "all":
+			conditions.append(RepoTransaction.portfolio == params["portfolio"])
+		if not params["custodian"] is None and not params["custodian"] is "all":
+			conditions.append(RepoTransaction.custodian == params["custodian"])
+		if not params["repo_code"] is None and not params["repo_code"] is "all":
+			conditions.append(RepoTransaction.repo_code == params["repo_code"])
+		if not params["broker"] is None and not params["broker"] is "all":
+			conditions.append(RepoTransaction.broker == params["broker"])
+		if not params["has_hair_cut"] is None and not params["has_hair_cut"] is "all":
+			if str(params["has_hair_cut"]).lower() == "true":
+				conditions.append(RepoTransaction.haircut != 0)
+			else:
+				conditions.append(RepoTransaction.haircut == 0)
+		#-- maturity window, inclusive. Open repos and maturities in error have no maturity_date
+		if not params["maturity_from"] is None:
+			conditions.append(RepoTransaction.maturity_date >= params["maturity_from"])
+		if not params["maturity_to"] is None:
+			conditions.append(RepoTransaction.maturity_date <= params["maturity_to"])
+		#self.logger.debug(str(conditions))
+		#-- not ordered, so the rows come in the order of the index searched without
+		#-- a sort. query_page orders by id for its keyset
+		transactions = session.query(
+				RepoTransaction.transaction_id.label("TransactionId"), \
+				RepoTransaction.transaction_type.label("Type"), \
+				RepoTransaction.portfolio.label("Portfolio"), \
+				RepoTransaction.custodian.label("Custodian"), \
+				RepoTransaction.collateral_id_type.label("CollateralIDType"), \
+				RepoTransaction.collateral_id.label("CollateralID"), \
+				RepoTransaction.collateral_global_id.label("CollateralGlobalID"), \
+				RepoTransaction.trade_date.label("TradeDate"), \
+				RepoTransaction.settle_date.label("SettleDate"), \
+				RepoTransaction.is_open_repo.label("IsOpenRepo"), \
+				RepoTransaction.maturity_date.label("MaturityDate"), \
+				RepoTransaction.quantity.label("Quantity"), \
+				RepoTransaction.currency.label("Currency"), \
+				RepoTransaction.price.label("Price"), \
+				RepoTransaction.collateral_value.label("CollateralValue"), \
+				RepoTransaction.repo_code.label("RepoName"), \
+				interest_rate.label("InterestRate"), \
+				RepoTransaction.loan_amount.label("LoanAmount"), \
+				RepoTransaction.broker.label("Broker"), \
+				RepoTransaction.haircut.label("Haircut"), \
+				status.label("Status"), \
+				RepoTransaction.maturity_state.label("MaturityState")) \
+			.filter(and_(*conditions))
+		#self.logger.debug("Print the generated SQL:")
+		#self.logger.debug(transactions)
+		return transactions
+
+	def _get_status_as_of(self, as_of_date):
+		#-- status of a repo transaction as of the date: canceled if canceled on or
+		#-- before the date, closed if closed or matured on or before the date, open
+		#-- otherwise. The history is searched by idx_repo_transaction_history__transaction_id_action_date
+		def has_history(action):
+			return exists().where(and_(
+						RepoTransactionHistory.transaction_id == RepoTransaction.transaction_id,
+						RepoTransactionHistory.action == action,
+						RepoTransactionHistory.date <= as_of_date))
+		return case([
+					(and_(
+						RepoTransaction.status == Constants.REPO_TRANS_STATUS_CANCEL,
+						has_history(Constants.REPO_TRANS_HISTORY_ACTION_CANCEL)
+					), Constants.REPO_TRANS_STATUS_CANCEL),
+					(or_(
+						has_history(Constants.REPO_TRANS_HISTORY_ACTION_CLOSE),
+						RepoTransaction.maturity_date <= as_of_date
+					), Constants.REPO_TRANS_STATUS_CLOSE)
+				], else_=Constants.REPO_TRANS_STATUS_OPEN)
+
+	def _get_state_at(self, session, time_stamp):
+		#-- return (status, interest rate, whether added) of a repo transaction at the
+		#-- time, the same as replaying the history recorded (created_at) on or
+		#-- before it: the latest open, close or cancel gives the status, the latest
+		#-- open or rerate gives the interest rate. Only the history added after
+		#-- the nearest snapshot (id > its history_id) is searched, the rest is in
+		#-- the snapshot, see RepoSnapshotServices. They are
+		#-- correlated lookups of the history of the transaction, by
+		#-- idx_repo_transaction_history__transaction_id_action_date, and of the
+		#-- snapshot, by udx_repo_snapshot_transactions__snapshot_id_transaction_id
+		snapshot = session.query(RepoSnapshot.id, RepoSnapshot.history_id) \
+						.filter(RepoSnapshot.time_stamp <= time_stamp) \
+						.order_by(RepoSnapshot.time_stamp.desc()) \
+						.first()
+		def get_histories(actions):
+			conditions = [
+				RepoTransactionHistory.transaction_id == RepoTransaction.transaction_id,
+				RepoTransactionHistory.action.in_(actions),
+				RepoTransactionHistory.created_at <= time_stamp
+			]
+			if not snapshot is None:
+				conditions.append(RepoTransactionHistory.id > snapshot.history_id)
+			return and_(*conditions)
+		def get_latest(column, actions):
+			return select([column]) \
+						.where(get_histories(actions)) \
+						.order_by(RepoTransactionHistory.id.desc()) \
+						.limit(1) \
+						.as_scalar()
+		status = get_latest(case([
+					(RepoTransactionHistory.action == Constants.REPO_TRANS_HISTORY_ACTION_CLOSE,
+						Constants.REPO_TRANS_STATUS_CLOSE),
+					(RepoTransactionHistory.action == Constants.REPO_TRANS_HISTORY_ACTION_CANCEL,
+						Constants.REPO_TRANS_STATUS_CANCEL)
+				], else_=Constants.REPO_TRANS_STATUS_OPEN), [
+					Constants.REPO_TRANS_HISTORY_ACTION_OPEN,
+					Constants.REPO_TRANS_HISTORY_ACTION_CLOSE,
+					Constants.REPO_TRANS_HISTORY_ACTION_CANCEL
+				])
+		interest_rate = get_latest(RepoTransactionHistory.interest_rate, [
+					Constants.REPO_TRANS_HISTORY_ACTION_OPEN,
+					Constants.REPO_TRANS_HISTORY_ACTION_RERATE
+				])
+		is_added = exists().where(get_histories([Constants.REPO_TRANS_HISTORY_ACTION_OPEN]))
+		if snapshot is None:
+			return status, interest_rate, is_added
+		def get_snapshot(column):
+			return select([column]) \
+						.where(and_(
+							RepoSnapshotTransaction.snapshot_id == snapshot.id,
+							RepoSnapshotTransaction.transaction_id == RepoTransaction.transaction_id)) \
+						.as_scalar()
+		return func.coalesce(status, get_snapshot(RepoSnapshotTransaction.status)), \
+				func.coalesce(interest_rate, get_snapshot(RepoSnapshotTransaction.interest_rate)), \
+				or_(is_added, exists().where(and_(
+							RepoSnapshotTransaction.snapshot_id == snapshot.id,
+							RepoSnapshotTransaction.transaction_id == RepoTransaction.transaction_id)))
+
+	def _model2dict(self, row, masters):
+		#-- return as dictionary
+		d = {}
+		for column in row.keys():
+			if column == "Id" or \
+					column == "MaturityState":
+				#-- the key of pagination and the state of MaturityDate, not part of the output
+				continue
+			elif column == "TradeDate" or \
+					column == "SettleDate":
+				d[column] = str(getattr(row, column))[0:10]
+			elif column == "MaturityDate":
+				d[column] = RepoTransaction.get_maturity_date_string(row.MaturityDate, row.MaturityState)
+			elif column == "Quantity" or \
+					column == "Quantity" or \
+					column == "Price" or \
+					column == "CollateralValue" or \
+					column == "InterestRate" or \
+					column == "LoanAmount" or \
+					column == "Haircut":
+				d[column] = float(getattr(row, column))
+			elif column == "IsOpenRepo":
+				if getattr(row, column) == 1:
+					d[column] = True
+				else:
+					d[column] = False
+			else:
+				d[column] = str(getattr(row, column))
+		#-- DayCount from the repo master cache instead of joining repo_masters
+		d["DayCount"] = str(masters[row.RepoName]["date_count"])
+		return d
 	
 	def getUserTranIdsFromRepoName(self, params):
 		try:
-			session = sessionmaker(bind=self.db)()
+			session = self.session_factory()
 			transactions = session.query(
 					RepoTransaction.transaction_id.label("TransactionId")) \
 				.filter(RepoTransaction.repo_code == params['repo_code']) \
@@ -0,0 +1,116 @@
+# coding=utf-8
+#
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+class ResultCache:
+
+	#-- one cache per database url, shared by all services in the process
+	instances = {}
+	instances_lock = threading.Lock()
+
+	@staticmethod
+	def get_instance(db):
+		key = str(db.url)
+		with ResultCache.instances_lock:
+			cache = ResultCache.instances.get(key)
+			if cache is None:
+				cache = ResultCache()
+				ResultCache.instances[key] = cache
+			return cache
+
+	def __init__(self, max_bytes=None, ttl=None):
+		self.logger = logging.getLogger(__name__)
+		#-- byte budget of the cached results, None or 0 means the cache is disabled
+		self.max_bytes = max_bytes
+		#-- seconds before a result expires, None means never expire. Writes of
+		#-- other processes do not change the version, the ttl bounds their delay
+		self.ttl = ttl
+		#-- increased by every write, results of older versions are dropped
+		self.version = 0
+		#-- key => (version, loaded_at, size, columns, list of values), least recently used first
+		self.entries = OrderedDict()
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	def is_enabled(self):
+		return bool(self.max_bytes)
+
+	def bump(self):
+		#-- called after each write to the datastore
+		with self.lock:
+			self.version = self.version + 1
+			self.entries.clear()
+			self.bytes = 0
+
+	def get(self, key):
+		#-- return a copy of the cached list of dictionary, None if not cached
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None or entry[0] != self.version or self._is_expired(entry):
+				if not entry is None:
+					self._remove(key)
+				self.misses = self.misses + 1
+				return None
+			self.entries.move_to_end(key)
+			self.hits = self.hits + 1
+		version, loaded_at, size, columns, values = entry
+		return [dict(zip(columns, v)) for v in values]
+
+	def put(self, key, version, rows):
+		#-- cache the list of dictionary queried at the given version. It is
+		#-- dropped if a write happened since then, as the rows may be stale
+		if len(rows) == 0:
+			columns = ()
+		else:
+			columns = tuple(rows[0])
+		values = [tuple(row.values()) for row in rows]
+		size = self._get_size(columns, values)
+		with self.lock:
+			if version != self.version or not self.is_enabled() or size > self.max_bytes:
+				return
+			if key in self.entries:
+				self._remove(key)
+			#-- evict the least recently used results to stay within the budget
+			while self.bytes + size > self.max_bytes:
+				self._remove(next(iter(self.entries)))
+			self.entries[key] = (version, time.monotonic(), size, columns, values)
+			self.bytes = self.bytes + size
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.bytes = 0
+			self.hits = 0
+			self.misses = 0
+
+	def get_stats(self):
+		with self.lock:
+			return {
+				"hits" : self.hits,
+				"misses" : self.misses,
+				"entries" : len(self.entries),
+				"bytes" : self.bytes,
+				"version" : self.version
+			}
+
+	def _remove(self, key):
+		entry = self.entries.pop(key)
+		self.bytes = self.bytes - entry[2]
+
+	def _is_expired(self, entry):
+		return not self.ttl is None and \
+				time.monotonic() - entry[1] >= self.ttl
+
+	def _get_size(self, columns, values):
+		#-- approximate size in bytes, shared values such as repeated strings are
+		#-- counted once per row
+		size = sys.getsizeof(columns) + sys.getsizeof(values)
+		for v in values:
+			size = size + sys.getsizeof(v) + sum(sys.getsizeof(x) for x in v)
+		return size
@@ -1,6 +1,8 @@
 -- drop table repo_masters;
 -- drop table repo_transactions;
 -- drop table repo_transaction_history;
+-- drop table repo_ingested_files;
+-- drop table repo_ingested_records;
 
 CREATE TABLE `repo_masters` (
   `id` int(11) unsigned NOT NULL AUTO_INCREMENT,
@@ -28,7 +30,8 @@ CREATE TABLE `repo_transactions` (
 	`trade_date` datetime NOT NULL,
 	`settle_date` datetime NOT NULL,
 	`is_open_repo` tinyint unsigned NOT NULL DEFAULT '0',
-	`maturity_date` varchar(100),
+	`maturity_date` date,
+	`maturity_state` varchar(10) NOT NULL,
 	`quantity` decimal(18,6) NOT NULL,
 	`currency` varchar(5) NOT NULL,
 	`price` decimal(18,6) NOT NULL,
@@ -45,6 +48,14 @@ CREATE TABLE `repo_transactions` (
 	`updated_by` int(11) unsigned DEFAULT NULL,
 	PRIMARY KEY (`id`),
 	KEY `idx_repo_transactions__repo_code` (`repo_code`),
+	KEY `idx_repo_transactions__status_portfolio` (`status`, `portfolio`),
+	KEY `idx_repo_transactions__portfolio` (`portfolio`),
+	KEY `idx_repo_transactions__custodian_status` (`custodian`, `status`),
+	KEY `idx_repo_transactions__broker_status` (`broker`, `status`),
+	KEY `idx_repo_transactions__haircut_status` (`haircut`, `status`),
+	KEY `idx_repo_transactions__maturity_date` (`maturity_date`),
+	KEY `idx_repo_transactions__status_maturity_date` (`status`, `maturity_date`),
+	KEY `idx_repo_transactions__settle_date` (`settle_date`),
 	UNIQUE KEY `udx_repo_transactions__transaction_id` (`transaction_id`)
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -60,5 +71,51 @@ CREATE TABLE `repo_transaction_history` (
 	`updated_by` int(11) unsigned DEFAULT NULL,
 	PRIMARY KEY (`id`),
 	KEY `idx_repo_transaction_history__transaction_id` (`transaction_id`),
-	KEY `idx_repo_transaction_history__action` (`action`)
+	KEY `idx_repo_transaction_history__action` (`action`),
+	KEY `idx_repo_transaction_history__transaction_id_action_date` (`transaction_id`, `action`, `date`),
+	KEY `idx_repo_transaction_history__created_at` (`created_at`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE `repo_ingested_files` (
+	`id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+	`file_hash` char(64) NOT NULL,
+	`file_name` varchar(255) NOT NULL,
+	`file_type` varchar(20) NOT NULL,
+	`record_count` int(11) unsigned NOT NULL DEFAULT '0',
+	`created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	`updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+	PRIMARY KEY (`id`),
+	UNIQUE KEY `udx_repo_ingested_files__file_hash` (`file_hash`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE `repo_ingested_records` (
+	`id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+	`record_hash` char(64) NOT NULL,
+	`created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	`updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+	PRIMARY KEY (`id`),
+	UNIQUE KEY `udx_repo_ingested_records__record_hash` (`record_hash`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE `repo_snapshots` (
+	`id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+	`time_stamp` datetime NOT NULL,
+	`history_id` int(11) unsigned NOT NULL DEFAULT 0,
+	`transaction_count` int(11) unsigned NOT NULL DEFAULT 0,
+	`created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	`updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+	PRIMARY KEY (`id`),
+	UNIQUE KEY `udx_repo_snapshots__time_stamp` (`time_stamp`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE `repo_snapshot_transactions` (
+	`id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+	`snapshot_id` int(11) unsigned NOT NULL,
+	`transaction_id` varchar(20) NOT NULL,
+	`status` varchar(10) NOT NULL,
+	`interest_rate` decimal(18,6) NOT NULL,
+	`created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	`updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+	PRIMARY KEY (`id`),
+	UNIQUE KEY `udx_repo_snapshot_transactions__snapshot_id_transaction_id` (`snapshot_id`, `transaction_id`)
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
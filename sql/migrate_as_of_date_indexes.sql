@@ -0,0 +1,14 @@
+-- Add the indexes of getRepo as of a date (asOfDate) to an existing
+-- database (created by create.sql before v1.3.0). New databases created by
+-- create.sql already have them. On SQLite, DBConn.create_schema adds them.
+--
+-- The status as of a date looks up the close and cancel of each
+-- transaction on or before the date, a search of
+-- (transaction_id, action, date), and keeps the transactions settled on
+-- or before the date.
+
+ALTER TABLE `repo_transactions`
+	ADD KEY `idx_repo_transactions__settle_date` (`settle_date`);
+
+ALTER TABLE `repo_transaction_history`
+	ADD KEY `idx_repo_transaction_history__transaction_id_action_date` (`transaction_id`, `action`, `date`);
@@ -0,0 +1,14 @@
+-- Add the indexes of the getRepo filters to an existing repo_transactions
+-- table (created by create.sql before v1.3.0). New databases created by
+-- create.sql already have them. On SQLite, DBConn.create_schema adds them.
+--
+-- The filters are equalities (status is open/closed or canceled), so the
+-- order of the columns does not change the index search; each index leads
+-- with a column that getRepo may filter on alone.
+
+ALTER TABLE `repo_transactions`
+	ADD KEY `idx_repo_transactions__status_portfolio` (`status`, `portfolio`),
+	ADD KEY `idx_repo_transactions__portfolio` (`portfolio`),
+	ADD KEY `idx_repo_transactions__custodian_status` (`custodian`, `status`),
+	ADD KEY `idx_repo_transactions__broker_status` (`broker`, `status`),
+	ADD KEY `idx_repo_transactions__haircut_status` (`haircut`, `status`);
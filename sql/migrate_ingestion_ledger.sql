@@ -0,0 +1,27 @@
+-- Add the ingestion ledger to an existing database (created by create.sql
+-- before v1.3.0). New databases created by create.sql already have it. On
+-- SQLite, DBConn.create_schema adds it.
+--
+-- clearRepoData also clears the ledger, so it fails on a database without
+-- these tables, whether or not ledger=True is used.
+
+CREATE TABLE `repo_ingested_files` (
+	`id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+	`file_hash` char(64) NOT NULL,
+	`file_name` varchar(255) NOT NULL,
+	`file_type` varchar(20) NOT NULL,
+	`record_count` int(11) unsigned NOT NULL DEFAULT '0',
+	`created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	`updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+	PRIMARY KEY (`id`),
+	UNIQUE KEY `udx_repo_ingested_files__file_hash` (`file_hash`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE `repo_ingested_records` (
+	`id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+	`record_hash` char(64) NOT NULL,
+	`created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	`updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+	PRIMARY KEY (`id`),
+	UNIQUE KEY `udx_repo_ingested_records__record_hash` (`record_hash`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,25 @@
+-- Store repo_transactions.maturity_date as a date (before v1.3.0 a
+-- varchar(100) of yyyy-mm-dd, '' for an open repo or 'ERROR'). The ''
+-- and 'ERROR' move to the new column maturity_state ('open', 'error',
+-- 'date' otherwise) and maturity_date becomes null for them. getRepo
+-- returns the same MaturityDate. On SQLite, DBConn.create_schema does the
+-- same.
+
+ALTER TABLE `repo_transactions`
+	ADD COLUMN `maturity_state` varchar(10) NOT NULL DEFAULT 'date' AFTER `maturity_date`;
+
+UPDATE `repo_transactions`
+	SET `maturity_state` = CASE `maturity_date`
+							WHEN '' THEN 'open'
+							WHEN 'ERROR' THEN 'error'
+							ELSE 'date' END;
+
+UPDATE `repo_transactions`
+	SET `maturity_date` = NULL
+	WHERE `maturity_state` <> 'date';
+
+ALTER TABLE `repo_transactions`
+	MODIFY COLUMN `maturity_date` date,
+	ALTER COLUMN `maturity_state` DROP DEFAULT,
+	ADD KEY `idx_repo_transactions__maturity_date` (`maturity_date`),
+	ADD KEY `idx_repo_transactions__status_maturity_date` (`status`, `maturity_date`);
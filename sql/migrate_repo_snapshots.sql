@@ -0,0 +1,35 @@
+-- Add the repo snapshots of getRepoAtTime and takeRepoSnapshot to an
+-- existing database (created by create.sql before v1.3.0). New databases
+-- created by create.sql already have them. On SQLite, DBConn.create_schema
+-- adds them.
+--
+-- A snapshot keeps the status and interest rate of every repo transaction
+-- at its time_stamp, so getRepoAtTime replays only the history added after
+-- the nearest snapshot (id > history_id, the last history recorded on or
+-- before time_stamp, found by a search of created_at).
+
+ALTER TABLE `repo_transaction_history`
+	ADD KEY `idx_repo_transaction_history__created_at` (`created_at`);
+
+CREATE TABLE `repo_snapshots` (
+	`id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+	`time_stamp` datetime NOT NULL,
+	`history_id` int(11) unsigned NOT NULL DEFAULT 0,
+	`transaction_count` int(11) unsigned NOT NULL DEFAULT 0,
+	`created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	`updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+	PRIMARY KEY (`id`),
+	UNIQUE KEY `udx_repo_snapshots__time_stamp` (`time_stamp`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE `repo_snapshot_transactions` (
+	`id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+	`snapshot_id` int(11) unsigned NOT NULL,
+	`transaction_id` varchar(20) NOT NULL,
+	`status` varchar(10) NOT NULL,
+	`interest_rate` decimal(18,6) NOT NULL,
+	`created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	`updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+	PRIMARY KEY (`id`),
+	UNIQUE KEY `udx_repo_snapshot_transactions__snapshot_id_transaction_id` (`snapshot_id`, `transaction_id`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,81 @@
+# coding=utf-8
+# 
+
+import unittest2
+import asyncio
+from repo_data import aio
+from repo_data.utils.error_handling import DataStoreNotYetInitializeError \
+									, RepoMasterAlreadyExistError
+
+
+
+class TestAio(unittest2.TestCase):
+
+	def tearDown(self):
+		aio.shutdown()
+
+
+
+	def testNotInitialized(self):
+		aio.shutdown()
+		with self.assertRaises(DataStoreNotYetInitializeError):
+			asyncio.run(aio.getRepo())
+
+
+
+	def testConcurrentCalls(self):
+		"""
+		Add 20 repo transactions and look them up with 200 concurrent calls
+		in a pool of 5 threads.
+		"""
+		async def run():
+			self.assertEqual(0, await aio.initializeDatastore('uat', maxWorkers=5))
+			self.assertEqual(0, await aio.clearRepoData())
+			self.assertEqual(0, await aio.addRepoMaster(getMaster()))
+			with self.assertRaises(RepoMasterAlreadyExistError):
+				await aio.addRepoMaster(getMaster())
+
+			self.assertEqual( [0] * 20
+							, await aio.addRepoTransactions(map(getTransaction, range(20))))
+
+			results = await asyncio.gather(
+				*([aio.getRepo() for _ in range(100)]
+				+ [aio.getRepoTransactionHistory(str(300700 + i % 20)) for i in range(100)]))
+			self.assertTrue(all(len(r) == 20 for r in results[:100]))
+			self.assertTrue(all(len(r) == 1 for r in results[100:]))
+			self.assertEqual( [str(300700 + i) for i in range(20)]
+							, await aio.getUserTranIdsFromRepoName('MMRPE420BS'))
+			self.assertEqual( await aio.getRepo()
+							, [t async for t in aio.iterRepo(chunkSize=3)])
+
+		asyncio.run(run())
+
+
+
+def getMaster():
+	return { 'Code': 'MMRPE420BS'
+		   , 'BifurcationCurrency': 'USD'
+		   , 'AccrualDaysPerMonth': 'Actual'
+		   , 'AccrualDaysPerYear': '360'
+		   }
+
+
+
+def getTransaction(i):
+	return { 'TransactionType': 'Repo_InsertUpdate'
+		   , 'UserTranId1': str(300700 + i)
+		   , 'Portfolio': '12734'
+		   , 'LocationAccount': 'BOCHK'
+		   , 'Investment': 'Isin=XS1234567890'
+		   , 'EventDate': '2018-08-27T00:00:00'
+		   , 'SettleDate': '2018-08-27T00:00:00'
+		   , 'ActualSettleDate': '2020-03-10T00:00:00'
+		   , 'Quantity': '300000'
+		   , 'CounterInvestment': 'USD'
+		   , 'Price': '95.23'
+		   , 'NetCounterAmount': '1818234'
+		   , 'RepoName': 'MMRPE420BS'
+		   , 'Coupon': '0.95'
+		   , 'LoanAmount': '1818234'
+		   , 'Broker': 'BNP-REPO'
+		   }
@@ -3,28 +3,49 @@
 
 import logging
 import logging.config
-from datetime import datetime
+from contextlib import closing
+from datetime import date, datetime, timedelta
 from os.path import abspath, dirname, join
 
+import importlib.util
+import pickle
+import time
+import tracemalloc
 import unittest2
 from repo_data.constants import Constants
-from repo_data.data import (addRepoMaster, 
+from repo_data.data import (controller,
+							addRepoMaster, 
+							addRepoMasters,
 							addRepoTransaction,
+							addRepoTransactions,
                             cancelRepoTransaction, 
+							cancelRepoTransactions,
 							clearRepoData,
                             closeRepoTransaction, 
+							closeRepoTransactions,
 							getRepo, 
+							getRepoAtTime,
+							getRepoPage,
 							getRepoTransactionHistory, 
+							getRepoTransactionHistoryPage,
+							getResultCacheStats,
 							getUserTranIdsFromRepoName, 
 							initializeDatastore,
-							rerateRepoTransaction)
+							iterRepo,
+							rerateRepoTransaction,
+							rerateRepoTransactions,
+							takeRepoSnapshot)
 from repo_data.models.repo_master import RepoMaster
 from repo_data.models.repo_transaction import RepoTransaction
 from repo_data.models.repo_transaction_history import RepoTransactionHistory
+from repo_data.models.repo_snapshot_transaction import RepoSnapshotTransaction
+from repo_data.services.repo_master_cache import RepoMasterCache
+from repo_data.services.repo_transaction_services import RepoTransactionServices
 from repo_data.utils.database import DBConn
 from repo_data.utils.error_handling import (CloseCanceledRepoTransactionError,
                                             NoDataClearingInProuctionModeError,
                                             RepoMasterAlreadyExistError,
+                                            RepoMasterNotExistError,
                                             RepoTransactionAlreadyExistError,
                                             RepoTransactionNotExistError,
 											InvalidRepoTransactionTypeError)
@@ -57,6 +78,11 @@ class TestRepoDataAPI(unittest2.TestCase):
 		self.assertEqual(0, initializeDatastore("production"))
 		#self.assertEqual(0, initializeDatastore("test"))
 		self.assertEqual(0, initializeDatastore("uat"))
+		#-- the engine and its connection pool shall be reused
+		db = DBConn.get_db(self.unittest_dbmode)
+		self.assertEqual(0, initializeDatastore("uat"))
+		self.assertIs(db, DBConn.get_db(self.unittest_dbmode))
+		self.assertIs(db, controller.repo_transaction_services.db)
 
 	def testClearRepoData(self):
 		#-- test if NoDataClearingInProuctionModeError raise under production mode
@@ -88,7 +114,63 @@ class TestRepoDataAPI(unittest2.TestCase):
 		master = self._get_test_repo_master()
 		with self.assertRaises(RepoMasterAlreadyExistError):
 			addRepoMaster(master)
-			
+
+	def testAddByUniqueKey(self):
+		#-- records added by another process, unknown to the repo master cache, are
+		#-- detected by the unique keys when inserting
+		master = self._get_test_repo_master()
+		addRepoMaster(master)
+		session = sessionmaker(bind=DBConn.get_db(self.unittest_dbmode))()
+		session.add(RepoMaster(code="MMRPE420BS-2", currency="USD", date_count="ACT/360"))
+		session.add(RepoTransaction(**controller._get_data_transaction(self._get_test_transaction())))
+		session.commit()
+		session.close()
+		master["Code"] = "MMRPE420BS-2"
+		with self.assertRaises(RepoMasterAlreadyExistError):
+			addRepoMaster(master)
+		with self.assertRaises(RepoTransactionAlreadyExistError):
+			addRepoTransaction(self._get_test_transaction())
+		#-- an existing transaction is reported before a missing repo master
+		transaction = self._get_test_transaction()
+		transaction["RepoName"] = "nosuchreponame"
+		with self.assertRaises(RepoTransactionAlreadyExistError):
+			addRepoTransaction(transaction)
+		#-- nothing is left by the failed inserts
+		self.assertEqual(0, len(getRepoTransactionHistory("300734")))
+		self.assertEqual(1, len(getRepo()))
+
+	def testAddRepoMasters(self):
+		master1 = self._get_test_repo_master()
+		master2 = self._get_test_repo_master()
+		master2["Code"] = "MMRPE420BS-2"
+		#-- duplicated in the same batch
+		master3 = self._get_test_repo_master()
+		#-- invalid input
+		master4 = self._get_test_repo_master()
+		master4["Code"] = "MMRPE420BS-3"
+		master4["AccrualDaysPerMonth"] = "ACT"
+		master5 = self._get_test_repo_master()
+		master5["Code"] = "MMRPE420BS-4"
+		res = addRepoMasters([master1, master2, master3, master4, master5], chunkSize=2)
+		self.assertEqual(5, len(res))
+		self.assertEqual(0, res[0])
+		self.assertEqual(0, res[1])
+		self.assertIsInstance(res[2], RepoMasterAlreadyExistError)
+		self.assertIsInstance(res[3], ValueError)
+		self.assertEqual(0, res[4])
+		session = sessionmaker(bind=DBConn.get_db(self.unittest_dbmode))()
+		self.assertEqual(['MMRPE420BS', 'MMRPE420BS-2', 'MMRPE420BS-4'],
+						sorted(row[0] for row in session.query(RepoMaster.code).all()))
+		session.close()
+		#-- the new masters can be used right away
+		transaction = self._get_test_transaction()
+		transaction["RepoName"] = "MMRPE420BS-4"
+		self.assertEqual(0, addRepoTransaction(transaction))
+		#-- add again and all shall be skipped as duplicates
+		res = addRepoMasters([master1, master2])
+		self.assertIsInstance(res[0], RepoMasterAlreadyExistError)
+		self.assertIsInstance(res[1], RepoMasterAlreadyExistError)
+
 	def testAddRepoTransaction(self):
 		master = self._get_test_repo_master()
 		addRepoMaster(master)
@@ -158,7 +240,8 @@ class TestRepoDataAPI(unittest2.TestCase):
 		transaction_result = session.query(RepoTransaction) \
 								.filter_by(transaction_id=transaction['UserTranId1']) \
 								.first()
-		self.assertEqual("", transaction_result.maturity_date)
+		self.assertIsNone(transaction_result.maturity_date)
+		self.assertEqual(Constants.REPO_TRANS_MATURITY_STATE_OPEN, transaction_result.maturity_state)
 		session.commit()
 		#-- 2.3. good transaction 3 - Maturity Date will be value of ActualSettleDate
 		#-- condition: is_open_repo is true, maturity_date is not CALC
@@ -169,7 +252,8 @@ class TestRepoDataAPI(unittest2.TestCase):
 		transaction_result = session.query(RepoTransaction) \
 								.filter_by(transaction_id=transaction['UserTranId1']) \
 								.first()
-		self.assertEqual("2020-03-10", transaction_result.maturity_date)
+		self.assertEqual(date(2020, 3, 10), transaction_result.maturity_date)
+		self.assertEqual(Constants.REPO_TRANS_MATURITY_STATE_DATE, transaction_result.maturity_state)
 		session.commit()
 		#-- 2.4. good transaction 4 - Maturity Date will be ERROR
 		#-- condition: is_open_repo is false, maturity_date is CALC
@@ -180,7 +264,8 @@ class TestRepoDataAPI(unittest2.TestCase):
 		transaction_result = session.query(RepoTransaction) \
 								.filter_by(transaction_id=transaction['UserTranId1']) \
 								.first()
-		self.assertEqual("ERROR", transaction_result.maturity_date)
+		self.assertIsNone(transaction_result.maturity_date)
+		self.assertEqual(Constants.REPO_TRANS_MATURITY_STATE_ERROR, transaction_result.maturity_state)
 		session.commit()
 		#-- 2.5. good transaction 5 - Maturity Date will be value of ActualSettleDate
 		#-- condition: is_open_repo is false, maturity_date is not CALC
@@ -190,7 +275,8 @@ class TestRepoDataAPI(unittest2.TestCase):
 		transaction_result = session.query(RepoTransaction) \
 								.filter_by(transaction_id=transaction['UserTranId1']) \
 								.first()
-		self.assertEqual("2020-03-10", transaction_result.maturity_date)
+		self.assertEqual(date(2020, 3, 10), transaction_result.maturity_date)
+		self.assertEqual(Constants.REPO_TRANS_MATURITY_STATE_DATE, transaction_result.maturity_state)
 		session.commit()
 		#-- 2.6. good transaction 6 - Maturity Date will be value of ActualSettleDate
 		transaction = self._get_test_transaction()
@@ -209,6 +295,42 @@ class TestRepoDataAPI(unittest2.TestCase):
 		with self.assertRaises(RepoTransactionAlreadyExistError):
 			addRepoTransaction(transaction)
 
+	def testAddRepoTransactions(self):
+		master = self._get_test_repo_master()
+		addRepoMaster(master)
+		transaction1 = self._get_test_transaction()
+		transaction2 = self._get_test_transaction()
+		transaction2["UserTranId1"] = "300735"
+		#-- duplicated in the same batch
+		transaction3 = self._get_test_transaction()
+		#-- repo master not exists
+		transaction4 = self._get_test_transaction()
+		transaction4["UserTranId1"] = "300736"
+		transaction4["RepoName"] = "nosuchreponame"
+		#-- invalid input
+		transaction5 = self._get_test_transaction()
+		transaction5["UserTranId1"] = "300737"
+		transaction5["EventDate"] = "2018-08-32"
+		transaction6 = self._get_test_transaction()
+		transaction6["UserTranId1"] = "300738"
+		res = addRepoTransactions([transaction1, transaction2, transaction3, 
+									transaction4, transaction5, transaction6], chunkSize=2)
+		self.assertEqual(6, len(res))
+		self.assertEqual(0, res[0])
+		self.assertEqual(0, res[1])
+		self.assertIsInstance(res[2], RepoTransactionAlreadyExistError)
+		self.assertIsInstance(res[3], RepoMasterNotExistError)
+		self.assertIsInstance(res[4], ValueError)
+		self.assertEqual(0, res[5])
+		self.assertEqual(['300734', '300735', '300738'], getUserTranIdsFromRepoName("MMRPE420BS"))
+		res = getRepoTransactionHistory("300738")
+		self.assertEqual(1, len(res))
+		self.assertEqual('open', res[0]['Action'])
+		#-- add again and all shall be skipped as duplicates
+		res = addRepoTransactions([transaction1, transaction2])
+		self.assertIsInstance(res[0], RepoTransactionAlreadyExistError)
+		self.assertIsInstance(res[1], RepoTransactionAlreadyExistError)
+
 	def testCancelRepoTransaction(self):
 		#-- 1. create repo_master, repo_transaction and cancel the transaction normally	
 		master = self._get_test_repo_master()
@@ -235,6 +357,32 @@ class TestRepoDataAPI(unittest2.TestCase):
 		with self.assertRaises(RepoTransactionNotExistError):
 			cancelRepoTransaction(unknown_transaction)
 
+	def testCancelRepoTransactions(self):
+		master = self._get_test_repo_master()
+		addRepoMaster(master)
+		transaction1 = self._get_test_transaction()
+		transaction2 = self._get_test_transaction()
+		transaction2["UserTranId1"] = "300735"
+		addRepoTransactions([transaction1, transaction2])
+		res = cancelRepoTransactions([
+			{ "UserTranId1" : "300734" },
+			{ "UserTranId1" : "300734x" },
+			{ "UserTranId1" : "x" * 21 },
+			{ "UserTranId1" : "300735" },
+			#-- cancel again is allowed
+			{ "UserTranId1" : "300734" }
+		], chunkSize=2)
+		self.assertEqual(5, len(res))
+		self.assertEqual(0, res[0])
+		self.assertIsInstance(res[1], RepoTransactionNotExistError)
+		self.assertIsInstance(res[2], ValueError)
+		self.assertEqual(0, res[3])
+		self.assertEqual(0, res[4])
+		self.assertEqual(2, len(getRepo(status="canceled")))
+		res = getRepoTransactionHistory("300734")
+		self.assertEqual(['cancel', 'cancel', 'open'], sorted(el['Action'] for el in res))
+		self.assertEqual([], cancelRepoTransactions([]))
+
 	def testCloseRepoTransaction(self):
 		#-- 1. create repo_master, repo_transaction and close the transaction normally	
 		master = self._get_test_repo_master()
@@ -265,6 +413,59 @@ class TestRepoDataAPI(unittest2.TestCase):
 		with self.assertRaises(RepoTransactionNotExistError):
 			closeRepoTransaction(unknown_transaction)
 
+	def testCloseRepoTransactions(self):
+		master = self._get_test_repo_master()
+		addRepoMaster(master)
+		transaction1 = self._get_test_transaction()
+		transaction2 = self._get_test_transaction()
+		transaction2["UserTranId1"] = "300735"
+		transaction3 = self._get_test_transaction()
+		transaction3["UserTranId1"] = "300736"
+		addRepoTransactions([transaction1, transaction2, transaction3])
+		cancelRepoTransaction({ "UserTranId1" : "300736" })
+		close = lambda tran_id, date: {
+			"UserTranId1" : tran_id,
+			"ActualSettleDate" : date + "T00:00:00"
+		}
+		res = closeRepoTransactions([
+			close("300734", "2018-08-31"),
+			close("300734x", "2018-08-31"),
+			close("300735", "2018-08-32"),
+			close("300736", "2018-08-31"),
+			close("300735", "2018-09-03")
+		], chunkSize=2)
+		self.assertEqual(5, len(res))
+		self.assertEqual(0, res[0])
+		self.assertIsInstance(res[1], RepoTransactionNotExistError)
+		self.assertIsInstance(res[2], ValueError)
+		self.assertIsInstance(res[3], CloseCanceledRepoTransactionError)
+		self.assertEqual(0, res[4])
+		self.assertEqual(['closed', 'closed', 'canceled'],
+						[el['Status'] for el in getRepo(status="all")])
+		res = list(filter(lambda el: el['Action'] == 'close', getRepoTransactionHistory("300735")))
+		self.assertEqual(1, len(res))
+		self.assertEqual('2018-09-03', res[0]['Date'][0:10])
+
+	def testCloseRepoTransactionsFallback(self):
+		#-- a database error in the batch shall only fail the bad row, the others
+		#-- are closed one by one
+		master = self._get_test_repo_master()
+		addRepoMaster(master)
+		transaction1 = self._get_test_transaction()
+		transaction2 = self._get_test_transaction()
+		transaction2["UserTranId1"] = "300735"
+		addRepoTransactions([transaction1, transaction2])
+		services = RepoTransactionServices(DBConn.get_db(self.unittest_dbmode))
+		res = services.close_batch([
+			{ "transaction_id" : "300734", "maturity_date" : "2018-08-31" },
+			#-- date is not null
+			{ "transaction_id" : "300735", "maturity_date" : None }
+		])
+		self.assertEqual(2, len(res))
+		self.assertEqual(0, res[0])
+		self.assertIsInstance(res[1], Exception)
+		self.assertEqual(['closed', 'open'], [el['Status'] for el in getRepo(status="all")])
+
 	def testRerateRepoTransaction(self):
 		#-- 1. create repo_master, repo_transaction and rerate the transaction normally	
 		master = self._get_test_repo_master()
@@ -320,6 +521,76 @@ class TestRepoDataAPI(unittest2.TestCase):
 		with self.assertRaises(RepoTransactionNotExistError):
 			rerateRepoTransaction(unknown_transaction)
 
+	def testRerateRepoTransactions(self):
+		master = self._get_test_repo_master()
+		addRepoMaster(master)
+		transaction1 = self._get_test_transaction()
+		transaction2 = self._get_test_transaction()
+		transaction2["UserTranId1"] = "300735"
+		addRepoTransactions([transaction1, transaction2])
+		closeRepoTransaction({
+			"UserTranId1" : "300735",
+			"ActualSettleDate" : "2021-01-05T00:00:00"
+		})
+		rerate = lambda tran_id, rate, rate_date: {
+			"UserTranId1" : tran_id,
+			"RateTable" : {
+				"Rate" : rate,
+				"RateDate" : rate_date + "T00:00:00"
+			}
+		}
+		#-- rerates of 300734 are out of date order, the latest rate shall be kept
+		res = rerateRepoTransactions([
+			rerate("300734", "1.6565", "2021-01-04"),
+			rerate("300734", "1.4992", "2020-12-31"),
+			rerate("300735", "1.5", "2020-12-31"),
+			rerate("300734x", "1.5", "2020-12-31"),
+			rerate("300734", "1.6565x", "2020-12-31"),
+			rerate("300734", "1.7", "2021-01-02")
+		])
+		self.assertEqual(6, len(res))
+		self.assertEqual(0, res[0])
+		self.assertEqual(0, res[1])
+		self.assertIsInstance(res[2], CloseCanceledRepoTransactionError)
+		self.assertIsInstance(res[3], RepoTransactionNotExistError)
+		self.assertIsInstance(res[4], ValueError)
+		self.assertEqual(0, res[5])
+		session = sessionmaker(bind=DBConn.get_db(self.unittest_dbmode))()
+		transaction_result = session.query(RepoTransaction) \
+								.filter_by(transaction_id="300734") \
+								.first()
+		self.assertEqual(1.6565, transaction_result.interest_rate)
+		session.close()
+		res = list(filter(lambda el: el['Action'] == 'rerate', 
+							getRepoTransactionHistory("300734")))
+		self.assertEqual(3, len(res))
+		self.assertEqual([1.4992, 1.7, 1.6565], 
+						[el['InterestRate'] for el in sorted(res, key=lambda el: el['Date'])])
+		self.assertEqual(0, len(list(filter(lambda el: el['Action'] == 'rerate', 
+							getRepoTransactionHistory("300735")))))
+
+	def testRerateRepoTransactionsFallback(self):
+		#-- a database error in the batch shall only fail the bad row, the others
+		#-- are rerated one by one
+		master = self._get_test_repo_master()
+		addRepoMaster(master)
+		transaction1 = self._get_test_transaction()
+		transaction2 = self._get_test_transaction()
+		transaction2["UserTranId1"] = "300735"
+		addRepoTransactions([transaction1, transaction2])
+		services = RepoTransactionServices(DBConn.get_db(self.unittest_dbmode))
+		res = services.rerate_batch([
+			{ "transaction_id" : "300734", "interest_rate" : 1.6, "rate_date" : "2020-12-31" },
+			#-- date is not null
+			{ "transaction_id" : "300735", "interest_rate" : 1.5, "rate_date" : None }
+		])
+		self.assertEqual(2, len(res))
+		self.assertEqual(0, res[0])
+		self.assertIsInstance(res[1], Exception)
+		self.assertEqual([1.6, 0.95], [el['InterestRate'] for el in getRepo(status="all")])
+		self.assertEqual(['open', 'rerate'], [el['Action'] for el in getRepoTransactionHistory("300734")])
+		self.assertEqual(['open'], [el['Action'] for el in getRepoTransactionHistory("300735")])
+
 	def testGetRepo(self):
 		#-- preprocess: add 2 repo master and 6 transaction
 		master1 = self._get_test_repo_master()
@@ -623,6 +894,475 @@ class TestRepoDataAPI(unittest2.TestCase):
 			con.close()
 		self.assertEqual(count, len(res))
 
+	def testRepoMasterCache(self):
+		db = DBConn.get_db(self.unittest_dbmode)
+		master_cache = RepoMasterCache.get_instance(db)
+		master = self._get_test_repo_master()
+		addRepoMaster(master)
+		transaction = self._get_test_transaction()
+		self.assertEqual(0, addRepoTransaction(transaction))
+		self.assertEqual("ACT/360", getRepo()[0]["DayCount"])
+		self.assertEqual("ACT/360", master_cache.get("MMRPE420BS")["date_count"])
+		#-- 1. clearRepoData shall invalidate the cache
+		clearRepoData()
+		with self.assertRaises(RepoMasterNotExistError):
+			addRepoTransaction(transaction)
+		#-- 2. repo master added outside the cache shall be loaded on cache miss
+		session = sessionmaker(bind=db)()
+		session.add(RepoMaster("MMRPE420BS", "USD", "ACT/365"))
+		session.commit()
+		self.assertEqual(0, addRepoTransaction(transaction))
+		self.assertEqual("ACT/365", getRepo()[0]["DayCount"])
+		#-- 3. repo master changed outside the cache shall only be seen after ttl
+		session.query(RepoMaster).filter_by(code="MMRPE420BS").update({"date_count" : "ACT/360"})
+		session.commit()
+		session.close()
+		self.assertEqual("ACT/365", getRepo()[0]["DayCount"])
+		ttl = master_cache.ttl
+		master_cache.ttl = 0
+		try:
+			self.assertEqual("ACT/360", getRepo()[0]["DayCount"])
+		finally:
+			master_cache.ttl = ttl
+		#-- 4. a cache miss shall only load the missing code, not reload all
+		session = sessionmaker(bind=db)()
+		session.query(RepoMaster).filter_by(code="MMRPE420BS").update({"date_count" : "ACT/365"})
+		session.add(RepoMaster("MMRPE421BS", "USD", "ACT/365"))
+		session.commit()
+		session.close()
+		self.assertEqual("ACT/365", master_cache.get("MMRPE421BS")["date_count"])
+		self.assertEqual("ACT/360", master_cache.get("MMRPE420BS")["date_count"])
+		self.assertIsNone(master_cache.get("MMRPE422BS"))
+
+	def testGetRepoColumns(self):
+		addRepoMaster(self._get_test_repo_master())
+		transactions = []
+		for i in range(5):
+			transaction = self._get_test_transaction()
+			transaction["UserTranId1"] = str(300700 + i)
+			transaction["Price"] = str(95 + i)
+			transactions.append(transaction)
+		transactions[1]["OpenEnded"] = "CALC"
+		transactions[1]["ActualSettleDate"] = "CALC"
+		addRepoTransactions(transactions)
+		cancelRepoTransaction({ "UserTranId1" : "300702" })
+		rows = getRepo(status="all")
+		columns = getRepo(status="all", format="columns")
+		self.assertEqual(list(rows[0]), list(columns))
+		#-- same values as getRepo, dates as date, amounts as float, IsOpenRepo as bool
+		for name, values in columns.items():
+			self.assertEqual(5, len(values))
+			for row, value in zip(rows, values):
+				if name == "TradeDate" or name == "SettleDate":
+					self.assertIsInstance(value, date)
+					self.assertEqual(row[name], str(value))
+				else:
+					self.assertIs(type(row[name]), type(value))
+					self.assertEqual(row[name], value)
+		self.assertEqual([False, True, False, False, False], columns["IsOpenRepo"])
+		self.assertEqual([95.0, 96.0, 97.0, 98.0, 99.0], columns["Price"])
+		self.assertEqual(4, len(getRepo(format="columns")["TransactionId"]))
+		with self.assertRaises(ValueError):
+			getRepo(format="csv")
+
+	@unittest2.skipIf(importlib.util.find_spec("pandas") is None or \
+						importlib.util.find_spec("pyarrow") is None, "pandas or pyarrow not installed")
+	def testGetRepoArrays(self):
+		import numpy
+		addRepoMaster(self._get_test_repo_master())
+		addRepoTransaction(self._get_test_transaction())
+		arrays = getRepo(format="numpy")
+		self.assertEqual(numpy.dtype("datetime64[D]"), arrays["TradeDate"].dtype)
+		self.assertEqual(numpy.dtype("float64"), arrays["Quantity"].dtype)
+		self.assertEqual(numpy.dtype("bool"), arrays["IsOpenRepo"].dtype)
+		self.assertEqual("2018-08-27", str(arrays["TradeDate"][0]))
+		frame = getRepo(format="pandas")
+		self.assertEqual(list(getRepo()[0]), list(frame.columns))
+		self.assertEqual(300000.0, frame["Quantity"][0])
+		table = getRepo(format="arrow")
+		self.assertEqual(1, table.num_rows)
+		self.assertEqual(getRepo(format="columns")["TransactionId"], table.column("TransactionId").to_pylist())
+
+	def testIterRepo(self):
+		addRepoMaster(self._get_test_repo_master())
+		transactions = []
+		for i in range(10):
+			transaction = self._get_test_transaction()
+			transaction["UserTranId1"] = str(300700 + i)
+			transaction["Portfolio"] = "12734" if i % 2 == 0 else "12735"
+			transactions.append(transaction)
+		addRepoTransactions(transactions)
+		cancelRepoTransaction({ "UserTranId1" : "300701" })
+		#-- same result as getRepo in any chunk size
+		for params in [{}, { "status" : "all" }, { "status" : "canceled" }, { "portfolio" : "12735" }]:
+			self.assertEqual(getRepo(**params), list(iterRepo(chunkSize=3, **params)))
+		self.assertEqual(9, len(list(iterRepo(chunkSize=1))))
+		#-- invalid input is reported when called, not when iterating
+		with self.assertRaises(ValueError):
+			iterRepo(status="opened")
+		#-- stop early and release the session
+		with closing(iterRepo(chunkSize=2)) as iterator:
+			self.assertEqual("300700", next(iterator)["TransactionId"])
+
+	def testGetRepoPage(self):
+		addRepoMaster(self._get_test_repo_master())
+		transactions = []
+		for i in range(11):
+			transaction = self._get_test_transaction()
+			transaction["UserTranId1"] = str(300700 + i)
+			transaction["Portfolio"] = "12734" if i % 2 == 0 else "12735"
+			transactions.append(transaction)
+		addRepoTransactions(transactions)
+		cancelRepoTransaction({ "UserTranId1" : "300702" })
+		def getAllPages(pageSize, **params):
+			pages = []
+			token = None
+			while True:
+				page, token = getRepoPage(pageSize=pageSize, pageToken=token, **params)
+				pages.append(page)
+				if token is None:
+					return pages
+		#-- the pages make up the result of getRepo in a fixed order
+		for params in [{}, { "status" : "all" }, { "status" : "canceled" }, { "portfolio" : "12734" }]:
+			for pageSize in [1, 3, 100]:
+				pages = getAllPages(pageSize, **params)
+				self.assertTrue(all(len(page) == pageSize for page in pages[:-1]))
+				self.assertEqual(getRepo(**params), [t for page in pages for t in page])
+		self.assertEqual([4, 4, 2], [len(page) for page in getAllPages(4)])
+		#-- a page is not affected by the changes of the previous pages
+		page, token = getRepoPage(pageSize=5)
+		cancelRepoTransaction({ "UserTranId1" : "300701" })
+		page, token = getRepoPage(pageSize=5, pageToken=token)
+		self.assertEqual(["300706", "300707", "300708", "300709", "300710"],
+						[t["TransactionId"] for t in page])
+		self.assertIsNone(token)
+		#-- invalid input
+		with self.assertRaises(ValueError):
+			getRepoPage(pageSize=0)
+		with self.assertRaises(ValueError):
+			getRepoPage(pageToken="abc")
+		page, token = getRepoTransactionHistoryPage("300701", pageSize=1)
+		with self.assertRaises(ValueError):
+			getRepoPage(pageToken=token)
+
+	def testGetRepoTransactionHistoryPage(self):
+		addRepoMaster(self._get_test_repo_master())
+		addRepoTransaction(self._get_test_transaction())
+		for i in range(5):
+			rerateRepoTransaction({
+				"UserTranId1" : "300734",
+				"RateTable" : {
+					"Rate" : str(1 + i / 10),
+					"RateDate" : "2021-01-0" + str(i + 1) + "T00:00:00"
+				}
+			})
+		page1, token = getRepoTransactionHistoryPage("300734", pageSize=4)
+		page2, token2 = getRepoTransactionHistoryPage("300734", pageSize=4, pageToken=token)
+		self.assertIsNone(token2)
+		self.assertEqual(getRepoTransactionHistory("300734"), page1 + page2)
+		self.assertEqual([4, 2], [len(page1), len(page2)])
+		self.assertEqual(([], None), getRepoTransactionHistoryPage("300734x"))
+
+	def testIterRepoMemory(self):
+		#-- the memory used by iterRepo shall not grow with the no. of transactions
+		addRepoMaster(self._get_test_repo_master())
+		transactions = []
+		for i in range(5000):
+			transaction = self._get_test_transaction()
+			transaction["UserTranId1"] = str(300000 + i)
+			transactions.append(transaction)
+		addRepoTransactions(transactions)
+		def peak(func):
+			tracemalloc.start()
+			try:
+				func()
+				return tracemalloc.get_traced_memory()[1]
+			finally:
+				tracemalloc.stop()
+		def consume():
+			count = 0
+			for transaction in iterRepo(chunkSize=100):
+				count = count + 1
+			self.assertEqual(5000, count)
+		self.assertLess(peak(consume) * 5, peak(lambda: getRepo()))
+
+	def testGetRepoRecords(self):
+		addRepoMaster(self._get_test_repo_master())
+		addRepoTransaction(self._get_test_transaction())
+		rerateRepoTransaction({
+			"UserTranId1" : "300734",
+			"RateTable" : {
+				"Rate" : "1.6565",
+				"RateDate" : "2020-12-31T00:00:00"
+			}
+		})
+		rows = getRepo(status="all")
+		records = getRepo(status="all", format="records")
+		#-- same keys and values as the dictionaries
+		self.assertEqual(rows, records)
+		record = records[0]
+		self.assertEqual(list(rows[0]), list(record))
+		self.assertEqual(list(rows[0].items()), list(record.items()))
+		self.assertEqual("300734", record["TransactionId"])
+		self.assertEqual("300734", record.TransactionId)
+		self.assertEqual("open", record.get("Status"))
+		self.assertIsNone(record.get("Id"))
+		self.assertTrue("DayCount" in record)
+		self.assertEqual(rows[0], dict(record))
+		with self.assertRaises(KeyError):
+			record["Id"]
+		#-- read only
+		with self.assertRaises(TypeError):
+			record["Status"] = "close"
+		with self.assertRaises(AttributeError):
+			record.Status = "close"
+		self.assertEqual(record, pickle.loads(pickle.dumps(record)))
+		histories = getRepoTransactionHistory("300734", format="records")
+		self.assertEqual(getRepoTransactionHistory("300734"), histories)
+		self.assertEqual(["open", "rerate"], [h["Action"] for h in histories])
+		with self.assertRaises(ValueError):
+			getRepoTransactionHistory("300734", format="pandas")
+
+	def testGetRepoRecordsMemory(self):
+		#-- the records shall take much less memory than the dictionaries
+		addRepoMaster(self._get_test_repo_master())
+		transactions = []
+		for i in range(5000):
+			transaction = self._get_test_transaction()
+			transaction["UserTranId1"] = str(300000 + i)
+			transactions.append(transaction)
+		addRepoTransactions(transactions)
+		def size(func):
+			#-- memory held by the result
+			tracemalloc.start()
+			try:
+				result = func()
+				self.assertEqual(5000, len(result))
+				return tracemalloc.get_traced_memory()[0]
+			finally:
+				tracemalloc.stop()
+		#-- warm up, so that the memory of the first call (e.g. the caches and the
+		#-- interned strings) is not counted as the memory of the result
+		getRepo(format="records")
+		getRepo()
+		self.assertLess(size(lambda: getRepo(format="records")), size(lambda: getRepo()))
+
+	def testMaturityDate(self):
+		addRepoMaster(self._get_test_repo_master())
+		transactions = []
+		for i, (open_ended, actual_settle_date) in enumerate([
+				(None, "2020-03-10T00:00:00"),
+				("CALC", "CALC"),
+				(None, "CALC"),
+				(None, "2020-03-11T00:00:00"),
+				(None, "2020-04-01T00:00:00")]):
+			transaction = self._get_test_transaction()
+			transaction["UserTranId1"] = str(300700 + i)
+			transaction["ActualSettleDate"] = actual_settle_date
+			if not open_ended is None:
+				transaction["OpenEnded"] = open_ended
+			transactions.append(transaction)
+		addRepoTransactions(transactions)
+		#-- 1. same MaturityDate as when it was stored as a string, by UserTranId1
+		#-- as getRepo is in the order of the index searched
+		self.assertEqual(["2020-03-10", "", "ERROR", "2020-03-11", "2020-04-01"],
+						[t["MaturityDate"] for t in sorted(getRepo(), key=lambda t: t["TransactionId"])])
+		columns = getRepo(format="columns")
+		self.assertEqual(["2020-03-10", "", "ERROR", "2020-03-11", "2020-04-01"],
+						[d for _, d in sorted(zip(columns["TransactionId"], columns["MaturityDate"]))])
+		#-- 2. maturity window, inclusive
+		def maturing(maturity_from, maturity_to):
+			return [t["TransactionId"] for t in getRepo(maturityFrom=maturity_from, maturityTo=maturity_to)]
+		self.assertEqual(["300700", "300703"], maturing("2020-03-10", "2020-03-11"))
+		self.assertEqual(["300703", "300704"], maturing("2020-03-11", None))
+		self.assertEqual(["300700"], maturing(None, "2020-03-10"))
+		self.assertEqual([], maturing("2020-03-12", "2020-03-31"))
+		self.assertEqual(["300704"], [t["TransactionId"] for t in iterRepo(maturityFrom="2020-04-01")])
+		self.assertEqual(["300703"], [t["TransactionId"] for t in
+										getRepoPage(maturityFrom="2020-03-11", maturityTo="2020-03-31")[0]])
+		#-- 3. invalid dates
+		with self.assertRaises(ValueError):
+			getRepo(maturityFrom="2020-03-32")
+		with self.assertRaises(ValueError):
+			getRepo(maturityTo="2020-03-10T00:00:00")
+
+	def testAsOfDate(self):
+		addRepoMaster(self._get_test_repo_master())
+		transactions = []
+		for i, (settle_date, open_ended, actual_settle_date) in enumerate([
+				("2020-01-02T00:00:00", None, "2020-03-10T00:00:00"),
+				("2020-01-02T00:00:00", "CALC", "CALC"),
+				("2020-01-02T00:00:00", None, "2020-04-01T00:00:00"),
+				("2020-03-20T00:00:00", None, "2020-06-30T00:00:00")]):
+			transaction = self._get_test_transaction()
+			transaction["UserTranId1"] = str(300710 + i)
+			transaction["SettleDate"] = settle_date
+			transaction["ActualSettleDate"] = actual_settle_date
+			if not open_ended is None:
+				transaction["OpenEnded"] = open_ended
+			transactions.append(transaction)
+		addRepoTransactions(transactions)
+		#-- 300710 matures on 2020-03-10 without being closed, the open repo
+		#-- 300711 is closed on 2020-02-14 and 300712 is canceled today
+		closeRepoTransaction({"UserTranId1" : "300711", "ActualSettleDate" : "2020-02-14T00:00:00"})
+		cancelRepoTransaction({"UserTranId1" : "300712"})
+		today = datetime.today().strftime("%Y-%m-%d")
+		def statuses(as_of_date, status="all"):
+			return [(t["TransactionId"], t["Status"]) for t in getRepo(status, asOfDate=as_of_date)]
+		#-- 1. status as of the date, of the transactions settled on or before it
+		self.assertEqual([], statuses("2020-01-01"))
+		self.assertEqual([("300710", "open"), ("300711", "open"), ("300712", "open")],
+						statuses("2020-02-13"))
+		self.assertEqual([("300710", "open"), ("300711", "closed"), ("300712", "open")],
+						statuses("2020-03-09"))
+		self.assertEqual([("300710", "closed"), ("300711", "closed"), ("300712", "open"),
+						("300713", "open")], statuses("2020-03-31"))
+		self.assertEqual([("300710", "closed"), ("300711", "closed"), ("300712", "canceled"),
+						("300713", "closed")], statuses(today))
+		#-- 2. the status filter applies to the status as of the date
+		self.assertEqual([("300712", "open"), ("300713", "open")], statuses("2020-03-31", "open"))
+		self.assertEqual([("300710", "closed"), ("300711", "closed")], statuses("2020-03-31", "closed"))
+		self.assertEqual([], statuses("2020-03-31", "canceled"))
+		self.assertEqual([("300712", "canceled")], statuses(today, "canceled"))
+		self.assertEqual(["300710", "300711", "300713"],
+						[t for t, status in statuses(today, "openclose")])
+		self.assertEqual(["open", "open"], getRepo("open", asOfDate="2020-03-31", format="columns")["Status"])
+		self.assertEqual(["300712", "300713"], [t["TransactionId"] for t in iterRepo("open", asOfDate="2020-03-31")])
+		self.assertEqual(["300712"], [t["TransactionId"] for t in
+										getRepoPage("open", pageSize=1, asOfDate="2020-03-31")[0]])
+		#-- 3. the current status without asOfDate
+		self.assertEqual([("300710", "open"), ("300711", "closed"), ("300712", "canceled"),
+						("300713", "open")], statuses(None))
+		#-- 4. open and closed only as of a date, invalid dates
+		with self.assertRaises(ValueError):
+			getRepo("open")
+		with self.assertRaises(ValueError):
+			getRepo("closed")
+		with self.assertRaises(ValueError):
+			getRepo(asOfDate="2020-03-32")
+
+	def testRepoAtTime(self):
+		addRepoMaster(self._get_test_repo_master())
+		transaction = self._get_test_transaction()
+		addRepoTransaction(transaction)
+		addRepoTransaction(dict(transaction, UserTranId1="300735"))
+		#-- the history of each step is recorded in a later second
+		time.sleep(1.1)
+		rerateRepoTransaction({"UserTranId1" : "300734", "RateTable" : {"Rate" : "1.5", "RateDate" : "2020-03-02T00:00:00"}})
+		closeRepoTransaction({"UserTranId1" : "300735", "ActualSettleDate" : "2020-03-02T00:00:00"})
+		time.sleep(1.1)
+		cancelRepoTransaction({"UserTranId1" : "300734"})
+		time.sleep(1.1)
+		time_stamps = [h["TimeStamp"] for h in getRepoTransactionHistory("300734")]
+		opened, rerated, canceled = time_stamps
+		def states(time_stamp, status="all"):
+			return [(t["TransactionId"], t["Status"], t["InterestRate"]) \
+						for t in getRepoAtTime(time_stamp, status)]
+		def expect():
+			before = str(datetime.strptime(opened, "%Y-%m-%d %H:%M:%S") - timedelta(seconds=1))
+			self.assertEqual([], states(before))
+			self.assertEqual([("300734", "open", 0.95), ("300735", "open", 0.95)], states(opened))
+			self.assertEqual([("300734", "open", 1.5), ("300735", "closed", 0.95)], states(rerated))
+			self.assertEqual([("300734", "canceled", 1.5), ("300735", "closed", 0.95)], states(canceled))
+			self.assertEqual([("300735", "closed", 0.95)], states(canceled, "openclose"))
+			self.assertEqual([("300734", "open", 1.5)], states(rerated.replace(" ", "T"), "open"))
+		#-- 1. replayed from the whole history
+		expect()
+		self.assertEqual([(t["TransactionId"], t["Status"], t["InterestRate"]) for t in getRepo("all")],
+						states(canceled))
+		#-- 2. replayed from the snapshots, the same states
+		self.assertEqual(rerated, takeRepoSnapshot(rerated))
+		self.assertEqual(rerated, takeRepoSnapshot(rerated.replace(" ", "T")))
+		self.assertEqual(str, type(takeRepoSnapshot()))
+		expect()
+		#-- 3. only the history after the snapshot is replayed
+		session = sessionmaker(bind=DBConn.get_db(self.unittest_dbmode))()
+		try:
+			session.query(RepoSnapshotTransaction) \
+				.filter(RepoSnapshotTransaction.transaction_id == "300735") \
+				.update({"interest_rate" : 2.0}, synchronize_session=False)
+			session.commit()
+		finally:
+			session.close()
+		self.assertEqual([("300734", "canceled", 1.5), ("300735", "closed", 2.0)], states(canceled))
+		self.assertEqual([("300734", "open", 0.95), ("300735", "open", 0.95)], states(opened))
+		#-- 4. a history recorded (created_at) before the snapshot but committed
+		#-- after it, as a write still open when the snapshot is taken, is replayed
+		session = sessionmaker(bind=DBConn.get_db(self.unittest_dbmode))()
+		try:
+			history = RepoTransactionHistory("300735", "rerate", "2020-03-02T00:00:00", 3.0)
+			history.created_at = datetime.strptime(rerated, "%Y-%m-%d %H:%M:%S")
+			session.add(history)
+			session.commit()
+		finally:
+			session.close()
+		self.assertEqual([("300734", "open", 1.5), ("300735", "closed", 3.0)], states(rerated))
+		self.assertEqual([("300734", "canceled", 1.5), ("300735", "closed", 3.0)], states(canceled))
+		#-- 5. invalid time stamps, a snapshot of the current second
+		with self.assertRaises(ValueError):
+			getRepoAtTime("2020-03-02")
+		with self.assertRaises(ValueError):
+			takeRepoSnapshot("2020-03-02 25:00:00")
+		with self.assertRaises(ValueError):
+			takeRepoSnapshot("2999-12-31 00:00:00")
+
+	def testResultCache(self):
+		result_cache = controller.repo_transaction_services.result_cache
+		addRepoMaster(self._get_test_repo_master())
+		addRepoTransaction(self._get_test_transaction())
+		#-- 1. disabled if result_cache_size is not set
+		getRepo()
+		self.assertEqual(0, getResultCacheStats()["misses"])
+		result_cache.max_bytes = 1000000
+		try:
+			#-- 2. the same (normalized) params hit the cache
+			rows = getRepo(hasHairCut="True")
+			self.assertEqual(rows, getRepo(hasHairCut="true"))
+			stats = getResultCacheStats()
+			self.assertEqual(1, stats["hits"])
+			self.assertEqual(1, stats["misses"])
+			self.assertEqual(1, stats["entries"])
+			self.assertLess(0, stats["bytes"])
+			#-- 3. the cached rows are not changed by the caller
+			rows = getRepo()
+			rows[0]["Status"] = "changed"
+			self.assertEqual("open", getRepo()[0]["Status"])
+			self.assertEqual("open", getRepo(format="records")[0]["Status"])
+			histories = getRepoTransactionHistory("300734")
+			self.assertEqual(histories, getRepoTransactionHistory("300734"))
+			#-- 4. writes drop the cached results
+			version = getResultCacheStats()["version"]
+			closeRepoTransaction({
+				"UserTranId1" : "300734",
+				"ActualSettleDate" : "2021-01-05T00:00:00"
+			})
+			stats = getResultCacheStats()
+			self.assertLess(version, stats["version"])
+			self.assertEqual(0, stats["entries"])
+			self.assertEqual("closed", getRepo()[0]["Status"])
+			self.assertEqual(["open", "close"], [h["Action"] for h in getRepoTransactionHistory("300734")])
+			#-- a result queried before a write is not cached
+			version = result_cache.version
+			addRepoMaster(dict(self._get_test_repo_master(), Code="MMRPE420BS-2"))
+			result_cache.put(("getRepo",), version, rows)
+			self.assertIsNone(result_cache.get(("getRepo",)))
+			#-- 5. least recently used results are evicted beyond the byte budget
+			getRepo(status="all")
+			getRepo()
+			getRepo(status="all")
+			size = getResultCacheStats()["bytes"]
+			result_cache.max_bytes = size + 1
+			getRepo(status="canceled")
+			self.assertEqual(2, getResultCacheStats()["entries"])
+			hits = getResultCacheStats()["hits"]
+			getRepo(status="all")
+			self.assertEqual(hits + 1, getResultCacheStats()["hits"])
+			getRepo()
+			self.assertEqual(hits + 1, getResultCacheStats()["hits"])
+		finally:
+			result_cache.max_bytes = None
+			result_cache.clear()
+
 	def testGetRepoTransactionHistory(self):
 		#-- preprocess: add 2 repo master and 6 transaction
 		master1 = self._get_test_repo_master()
@@ -0,0 +1,123 @@
+# coding=utf-8
+# 
+
+import unittest2
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from sqlalchemy import event
+from tempfile import TemporaryDirectory
+from repo_data.constants import Constants
+from repo_data.controllers import AppController
+from repo_data.utils.database import DBConn
+from repo_data.tests.test_data_memory import getMaster, getTransaction
+
+
+
+class TestConcurrency(unittest2.TestCase):
+
+	def setUp(self):
+		"""
+		On SQLite, run on a file-backed database in a temporary directory, where
+		each thread has its own connection, instead of the in-memory database
+		whose one connection is shared by all threads.
+		"""
+		self.directory = None
+		self.configFile = os.environ.get('REPO_DATA_DATABASE_CONFIG')
+		if DBConn.get_db(Constants.DBMODE_UAT).url.drivername.startswith('sqlite'):
+			self.directory = TemporaryDirectory()
+			configFile = join(self.directory.name, 'database_config.ini')
+			with open(configFile, 'w') as f:
+				for section, name in [('Database Test', 'test'), ('Database UAT', 'uat')]:
+					f.write('[{0}]\nurl = sqlite:///{1}\n\n'.format(
+							section, join(self.directory.name, name + '.sqlite')))
+			os.environ['REPO_DATA_DATABASE_CONFIG'] = configFile
+
+		# a controller of its own, as the data functions keep the engines they started with.
+		# The same data in both modes, as initializeDatastore switches between them
+		self.controller = AppController()
+		for mode in ['test', 'uat']:
+			self.controller.initializeDatastore(mode)
+			self.controller.clearRepoData()
+			self.controller.addRepoMaster(getMaster('MMRPE420BS'))
+			self.controller.addRepoTransactions(
+				[getTransaction(i, 'MMRPE420BS') for i in range(300700, 300750)])
+
+
+
+	def tearDown(self):
+		if self.directory is None:
+			return
+
+		for mode in [Constants.DBMODE_TEST, Constants.DBMODE_UAT]:
+			DBConn.get_db(mode).dispose()
+		if self.configFile is None:
+			del os.environ['REPO_DATA_DATABASE_CONFIG']
+		else:
+			os.environ['REPO_DATA_DATABASE_CONFIG'] = self.configFile
+		self.directory.cleanup()
+
+
+
+	def addRoundTrip(self, engine, seconds=0.02):
+		"""
+		SQLite runs in process, so a query has no round trip to a database
+		server for other threads to use. Make each query wait like one (to
+		a remote server) on its connection, then the threads only overlap if
+		they have their own connections.
+
+		Return the function to remove the wait.
+		"""
+		def wait(conn, cursor, statement, parameters, context, executemany):
+			with conn.info.setdefault('roundTripLock', threading.Lock()):
+				time.sleep(seconds)
+
+		event.listen(engine, 'before_cursor_execute', wait)
+		return lambda: event.remove(engine, 'before_cursor_execute', wait)
+
+
+
+	def testStress(self):
+		"""
+		Call getRepo and getRepoTransactionHistory from 1 and 16 threads,
+		while another thread keeps calling initializeDatastore. All the
+		results shall be correct, and as the calls mostly wait for the
+		round trips of their queries, 16 threads shall make several times
+		the calls of 1 thread.
+		"""
+		controller = self.controller
+		stop = threading.Event()
+		def initializeAgain():
+			while not stop.is_set():
+				controller.initializeDatastore('uat')
+				controller.initializeDatastore('test')
+
+		def lookup(i):
+			return len(controller.getRepo()) \
+				 , len(controller.getRepoTransactionHistory(str(300700 + i % 50)))
+
+		def throughput(threads, calls):
+			start = time.perf_counter()
+			with ThreadPoolExecutor(max_workers=threads) as executor:
+				results = list(executor.map(lookup, range(calls)))
+			self.assertEqual([(50, 1)] * calls, results)
+			return calls / (time.perf_counter() - start)
+
+		removeRoundTrips = [ self.addRoundTrip(DBConn.get_db(mode))
+						   for mode in [Constants.DBMODE_TEST, Constants.DBMODE_UAT]]
+		initializer = threading.Thread(target=initializeAgain)
+		initializer.start()
+		try:
+			single = throughput(1, 50)
+			multiple = throughput(16, 400)
+		finally:
+			stop.set()
+			initializer.join()
+			for removeRoundTrip in removeRoundTrips:
+				removeRoundTrip()
+
+		self.assertGreater( multiple, 4 * single
+						  , 'calls per second: 1 thread {0:.1f}, 16 threads {1:.1f}'.format(
+								single, multiple))
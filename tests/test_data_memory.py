@@ -0,0 +1,279 @@
+# coding=utf-8
+# 
+
+import unittest2
+import time
+from datetime import datetime
+from repo_data.data import initializeDatastore, clearRepoData, getRepo, iterRepo, getRepoPage \
+						, getRepoTransactionHistory, getRepoTransactionHistoryPage, getUserTranIdsFromRepoName \
+						, addRepoMaster, addRepoMasters, addRepoTransaction, addRepoTransactions \
+						, closeRepoTransaction, closeRepoTransactions \
+						, cancelRepoTransaction, cancelRepoTransactions \
+						, rerateRepoTransaction, rerateRepoTransactions \
+						, getRepoAtTime, takeRepoSnapshot \
+						, isFileIngested, addIngestedFile, getIngestedRecordHashes \
+						, addIngestedRecordHashes
+from repo_data.services.memory_store import MemoryStore
+from repo_data.services.memory_repo_master_services import MemoryRepoMasterServices
+from repo_data.services.memory_repo_transaction_services import MemoryRepoTransactionServices
+from repo_data.services.repo_master_cache import RepoMasterCache
+from repo_data.services.repo_master_services import RepoMasterServices
+from repo_data.services.repo_transaction_services import RepoTransactionServices
+from repo_data.services.result_cache import ResultCache
+from repo_data.utils.database import DBConn
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+
+
+class TestMemoryDatastore(unittest2.TestCase):
+
+	def tearDown(self):
+		initializeDatastore('uat')
+
+
+
+	def testSameAsDatabase(self):
+		"""
+		Run the same actions on the database and the in-memory datastore,
+		the results and exceptions shall be the same.
+		"""
+		initializeDatastore('uat')
+		expected = runActions()
+		initializeDatastore('memory')
+		self.assertEqual(expected, runActions())
+
+
+
+	def testClearRepoData(self):
+		initializeDatastore('memory')
+		clearRepoData()
+		addRepoMaster(getMaster('MMRPE420BS'))
+		addRepoTransaction(getTransaction(300734, 'MMRPE420BS'))
+
+		# the data stays when the datastore is initialized again
+		initializeDatastore('memory')
+		self.assertEqual(1, len(getRepo()))
+		clearRepoData()
+		self.assertEqual([], getRepo())
+		self.assertEqual([], getRepoTransactionHistory('300734'))
+
+
+
+	def testReplaySpeed(self):
+		"""
+		Open, rerate and close 100000 trades in the in-memory services, in
+		a small part of the time per trade of the database services (on an
+		in-memory SQLite), so the check does not depend on the machine load.
+		"""
+		store = MemoryStore()
+		ids = list(map(str, range(300000, 400000)))
+		memorySeconds = replay( MemoryRepoMasterServices(store)
+							  , MemoryRepoTransactionServices(store), ids)
+
+		#-- its own caches, the shared ones are kept by url (of the test database)
+		db = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+		DBConn.create_schema(db)
+		masterCache = RepoMasterCache(db)
+		resultCache = ResultCache()
+		try:
+			dbIds = ids[:5000]
+			dbSeconds = replay( RepoMasterServices(db, masterCache, resultCache)
+							  , RepoTransactionServices(db, masterCache, resultCache), dbIds)
+		finally:
+			db.dispose()
+		self.assertLess( memorySeconds / len(ids) * 4, dbSeconds / len(dbIds)
+					   , 'seconds per trade: memory {0}, database {1}'.format(
+							memorySeconds / len(ids), dbSeconds / len(dbIds)))
+
+
+
+def runActions():
+	"""
+	=> [List] result of each action, the exception type if it fails, and
+		the data in datastore at the end (without the TimeStamp of histories).
+	"""
+	clearRepoData()
+	actions = \
+		[ lambda: addRepoMaster(getMaster('MMRPE420BS'))
+		, lambda: addRepoMaster(getMaster('MMRPE420BS'))
+		, lambda: addRepoMaster(getMaster('MMRPE420BS-2'))
+		, lambda: addRepoTransaction(getTransaction(300734, 'MMRPE420BS'))
+		, lambda: addRepoTransaction(getTransaction(300734, 'MMRPE420BS'))
+		, lambda: addRepoTransaction(getTransaction(300735, 'nosuchreponame'))
+		, lambda: addRepoTransaction(dict(getTransaction(300735, 'MMRPE420BS'), EventDate='x'))
+		, lambda: list(map(type, addRepoTransactions(
+					[ getTransaction(300736, 'MMRPE420BS-2')
+					, getTransaction(300737, 'MMRPE420BS')
+					, getTransaction(300737, 'MMRPE420BS')
+					, getTransaction(300738, 'nosuchreponame')
+					, getTransaction(300739, 'MMRPE420BS', Portfolio='12739', Broker='BOC-REPO')
+					, getTransaction(300740, 'MMRPE420BS', OpenEnded='CALC', ActualSettleDate='CALC')
+					])))
+		, lambda: rerateRepoTransaction(getRerate(300734, '1.6565', '2020-12-31'))
+		, lambda: rerateRepoTransaction(getRerate(300734, '1.6565x', '2020-12-31'))
+		, lambda: list(map(type, rerateRepoTransactions(
+					[ getRerate(300736, '0.7', '2021-01-04')
+					, getRerate(300736, '0.65', '2021-01-02')
+					, getRerate(300799, '0.65', '2021-01-02')
+					])))
+		, lambda: cancelRepoTransaction({'UserTranId1': '300737'})
+		, lambda: cancelRepoTransaction({'UserTranId1': '300799'})
+		, lambda: closeRepoTransaction({'UserTranId1': '300737', 'ActualSettleDate': '2021-01-05T00:00:00'})
+		, lambda: closeRepoTransaction({'UserTranId1': '300736', 'ActualSettleDate': '2021-01-05T00:00:00'})
+		, lambda: closeRepoTransaction({'UserTranId1': '300736', 'ActualSettleDate': '2021-01-06T00:00:00'})
+		, lambda: rerateRepoTransaction(getRerate(300736, '0.6', '2021-01-07'))
+		, lambda: list(map(type, addRepoMasters(
+					[ getMaster('MMRPE420BS-3')
+					, getMaster('MMRPE420BS')
+					, dict(getMaster('MMRPE420BS-4'), AccrualDaysPerYear='x')
+					])))
+		, lambda: list(map(type, addRepoTransactions(
+					[ getTransaction(300741, 'MMRPE420BS-3')
+					, getTransaction(300742, 'MMRPE420BS-3')
+					])))
+		, lambda: list(map(type, cancelRepoTransactions(
+					[ {'UserTranId1': '300741'}
+					, {'UserTranId1': '300799'}
+					])))
+		, lambda: list(map(type, closeRepoTransactions(
+					[ {'UserTranId1': '300741', 'ActualSettleDate': '2021-01-05T00:00:00'}
+					, {'UserTranId1': '300742', 'ActualSettleDate': '2021-01-05T00:00:00'}
+					, {'UserTranId1': '300799', 'ActualSettleDate': '2021-01-05T00:00:00'}
+					, {'UserTranId1': '300742', 'ActualSettleDate': '2021-01-05'}
+					])))
+		, lambda: isFileIngested('a' * 64)
+		, lambda: addIngestedFile({'FileHash': 'a' * 64, 'FileName': 'a.xml', 'FileType': 'RepoTrade', 'RecordCount': 1})
+		, lambda: isFileIngested('a' * 64)
+		, lambda: addIngestedRecordHashes(['b' * 64, 'c' * 64])
+		, lambda: sorted(getIngestedRecordHashes(['b' * 64, 'd' * 64]))
+		, lambda: getUserTranIdsFromRepoName('MMRPE420BS')
+		, lambda: byId(list(iterRepo(status='all', chunkSize=2)))
+		, lambda: getRepo(status='all', format='columns')
+		, lambda: getRepoPage(status='all', pageSize=3)[0]
+		, lambda: getRepoPage(status='all', pageSize=3, pageToken=getRepoPage(status='all', pageSize=3)[1])[0]
+		, lambda: getRepoPage(status='all', pageSize=100)[1]
+		, lambda: withoutTimeStamp(getRepoTransactionHistoryPage('300736', pageSize=2)[0])
+		, lambda: byId(getRepo(status='all', format='records'))
+		, lambda: withoutTimeStamp(getRepoTransactionHistory('300736', format='records'))
+		, lambda: byId(getRepo(status='all', maturityFrom='2020-03-10', maturityTo='2020-03-10'))
+		, lambda: byId(getRepo(maturityFrom='2020-03-11'))
+		, lambda: byId(getRepo(status='all', asOfDate='2020-03-10'))
+		, lambda: byId(getRepo(status='open', asOfDate='2020-03-09'))
+		, lambda: byId(getRepo(status='closed', asOfDate='2021-01-05'))
+		, lambda: byId(getRepo(status='canceled', asOfDate=datetime.today().strftime('%Y-%m-%d')))
+		, lambda: byId(getRepo(status='open'))
+		, lambda: byId(getRepoAtTime('2999-12-31 00:00:00', status='all'))
+		, lambda: byId(getRepoAtTime('2000-01-01 00:00:00'))
+		, lambda: takeRepoSnapshot('2000-01-01 00:00:00')
+		, lambda: takeRepoSnapshot('2999-12-31 00:00:00')
+		, lambda: type(takeRepoSnapshot())
+		, lambda: byId(getRepoAtTime('2999-12-31T00:00:00', status='closed', portfolio='12734'))
+		]
+
+	def run(action):
+		try:
+			return action()
+		except Exception as e:
+			return type(e)
+
+	withoutTimeStamp = lambda histories: \
+		[dict(h, TimeStamp=None) for h in histories]
+
+	# getRepo is in the order of the index searched on the database
+	byId = lambda transactions: \
+		sorted(transactions, key=lambda t: t['TransactionId'])
+
+	queries = \
+		[ dict(status='all')
+		, dict()
+		, dict(status='canceled')
+		, dict(portfolio='12739')
+		, dict(repoName='MMRPE420BS-2')
+		, dict(broker='BOC-REPO', status='openclose')
+		, dict(hasHairCut='False', portfolio='12734')
+		, dict(hasHairCut='True')
+		]
+
+	return list(map(run, actions)) \
+		 + [byId(getRepo(**q)) for q in queries] \
+		 + [ withoutTimeStamp(getRepoTransactionHistory(str(i)))
+			 for i in range(300734, 300741)]
+
+
+
+def replay(masterServices, transactionServices, ids):
+	"""
+	[RepoMasterServices] masterServices, [RepoTransactionServices] transactionServices,
+	[List] ids => [Float] seconds to open, rerate and close (every other one)
+		the trades of ids with the batch methods and query them.
+	"""
+	start = time.perf_counter()
+	masterServices.create({'code': 'MMRPE420BS', 'currency': 'USD', 'date_count': 'ACT/360'})
+	assert [0] * len(ids) == transactionServices.create_batch(list(map(getDataTransaction, ids)))
+	assert [0] * len(ids) == transactionServices.rerate_batch(
+		[ {'transaction_id': i, 'interest_rate': 0.5, 'rate_date': '2021-01-04'}
+		  for i in ids])
+	assert [0] * len(ids[::2]) == transactionServices.close_batch(
+		[ {'transaction_id': i, 'maturity_date': '2021-01-05'}
+		  for i in ids[::2]])
+
+	params = { 'status': 'openclose', 'portfolio': '12734', 'custodian': 'all'
+			 , 'repo_code': 'all', 'broker': 'all', 'has_hair_cut': 'all'
+			 , 'maturity_from': None, 'maturity_to': None, 'as_of_date': None}
+	assert len(ids) == len(transactionServices.query(params))
+	return time.perf_counter() - start
+
+
+
+def getMaster(code):
+	return { 'Code': code
+		   , 'BifurcationCurrency': 'USD'
+		   , 'AccrualDaysPerMonth': 'Actual'
+		   , 'AccrualDaysPerYear': '360'
+		   }
+
+
+
+def getTransaction(userTranId, repoName, **kwargs):
+	return dict({ 'TransactionType': 'Repo_InsertUpdate'
+				, 'UserTranId1': str(userTranId)
+				, 'Portfolio': '12734'
+				, 'LocationAccount': 'BOCHK'
+				, 'Investment': 'Isin=XS1234567890'
+				, 'EventDate': '2018-08-27T00:00:00'
+				, 'SettleDate': '2018-08-27T00:00:00'
+				, 'ActualSettleDate': '2020-03-10T00:00:00'
+				, 'Quantity': '300000'
+				, 'CounterInvestment': 'USD'
+				, 'Price': '95.23'
+				, 'NetCounterAmount': '1818234'
+				, 'RepoName': repoName
+				, 'Coupon': '0.95'
+				, 'LoanAmount': '1818234'
+				, 'Broker': 'BNP-REPO'
+				}, **kwargs)
+
+
+
+def getDataTransaction(transactionId):
+	return { 'transaction_id': transactionId, 'transaction_type': 'RP'
+		   , 'portfolio': '12734', 'custodian': 'BOCHK'
+		   , 'collateral_id_type': 'ISIN', 'collateral_id': 'XS1234567890'
+		   , 'collateral_global_id': '', 'trade_date': '2018-08-27'
+		   , 'settle_date': '2018-08-27', 'is_open_repo': 0
+		   , 'maturity_date': '2020-03-10', 'maturity_state': 'date', 'quantity': 300000.0
+		   , 'currency': 'USD', 'price': 95.23, 'collateral_value': 1818234.0
+		   , 'repo_code': 'MMRPE420BS', 'interest_rate': 0.95
+		   , 'loan_amount': 1818234.0, 'broker': 'BNP-REPO', 'haircut': 0
+		   , 'status': 'open'
+		   }
+
+
+
+def getRerate(userTranId, rate, rateDate):
+	return { 'UserTranId1': str(userTranId)
+		   , 'RateTable': { 'Rate': rate
+						  , 'RateDate': rateDate + 'T00:00:00'
+						  }
+		   }
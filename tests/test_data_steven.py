@@ -7,11 +7,15 @@ from repo_data.data import initializeDatastore, clearRepoData, getRepo \
 									, getRepoTransactionHistory \
 									, getUserTranIdsFromRepoName
 from repo_data.repo_datastore import saveRepoMasterFileToDB, saveRepoTradeFileToDB \
-									, saveRepoRerateFileToDB
+									, saveRepoRerateFileToDB, iterRecordsFromXML \
+									, saveRepoDirectoryToDB
+from repo_data.utils.ingestion_report import IngestionReport
 from steven_utils.utility import mergeDict
 from toolz.functoolz import compose
 from functools import partial
 from os.path import join, dirname, abspath
+from shutil import copy
+from tempfile import TemporaryDirectory
 
 
 getCurrentDir = lambda: dirname(abspath(__file__))
@@ -107,6 +111,223 @@ class TestDatastore(unittest2.TestCase):
 
 
 
+	def testAllInBatch(self):
+		"""
+		Same as testAll, but the trades and rerates are saved in batch
+		mode, where the cancel and close trades come after the open trades
+		in the same file.
+		"""
+		clearRepoData()
+		self.assertEqual(7, saveRepoMasterFileToDB(
+			join(getCurrentDir(), 'samples', 'RepoMaster_20210305_20210305154653.xml')))
+
+		inputFile = join(getCurrentDir(), 'samples', 'RepoTrade_20210305_20210305155621.xml')
+		self.assertEqual(9, saveRepoTradeFileToDB(inputFile, batchSize=2))
+
+		data = getRepo()
+		self.assertEqual(6, len(data))	# 6 not canceled
+		self.verifyHKDRepoPosition(data)
+		self.verifyUSDRepoPosition(data)
+		self.verifyClosedRepoPosition(data)
+
+		data = getRepo(status='canceled')
+		self.assertEqual(1, len(data))
+		self.verifyCanceledRepoPosition(data)
+
+		# add the file again, the open trades are skipped as duplicates
+		self.assertEqual(2, saveRepoTradeFileToDB(inputFile, batchSize=2))
+
+		# Add 2 rerate actions to a repo position 316444 in one batch
+		self.assertEqual(2, saveRepoRerateFileToDB(
+			join(getCurrentDir(), 'samples', 'Repo_ReRate_20210305_20210305174826.xml')
+		  , batchSize=10))
+		self.assertEqual(2, len(list(filter( lambda el: el['Action'] == 'rerate'
+										   , getRepoTransactionHistory('316444')))))
+
+
+
+	def testAllStreaming(self):
+		"""
+		Same as testAll, but the files (with Geneva header) are read
+		in streaming mode.
+		"""
+		clearRepoData()
+		self.assertEqual(7, saveRepoMasterFileToDB(
+			join(getCurrentDir(), 'samples', 'RepoMaster_20210305_WithHeaders.xml')
+		  , streaming=True))
+
+		self.assertEqual(9, saveRepoTradeFileToDB(
+			join(getCurrentDir(), 'samples', 'RepoTrade_20210305_WithHeaders_20210305155621.xml')
+		  , streaming=True))
+
+		data = getRepo()
+		self.assertEqual(6, len(data))
+		self.verifyHKDRepoPosition(data)
+		self.verifyUSDRepoPosition(data)
+		self.verifyClosedRepoPosition(data)
+
+		self.assertEqual(2, saveRepoRerateFileToDB(
+			join(getCurrentDir(), 'samples', 'Repo_ReRate_20210305_WithHeaders_20210305174826.xml')
+		  , streaming=True))
+		self.assertEqual(2, len(list(filter( lambda el: el['Action'] == 'rerate'
+										   , getRepoTransactionHistory('316444')))))
+
+
+
+	def testIterRecordsFromXML(self):
+		"""
+		The same records are read from files with and without Geneva header.
+		"""
+		withoutHeader = list(iterRecordsFromXML(
+			join(getCurrentDir(), 'samples', 'Repo_ReRate_20210305_20210305174826.xml')))
+		withHeader = list(iterRecordsFromXML(
+			join(getCurrentDir(), 'samples', 'Repo_ReRate_20210305_WithHeaders_20210305174826.xml')))
+		self.assertEqual(2, len(withoutHeader))
+		self.assertEqual(withoutHeader, withHeader)
+		self.assertEqual('UserTranId1=316444', withHeader[1]['Loan'])
+		self.assertEqual('2021-03-12T00:00:00', withHeader[1]['RateTable']['RateDate'])
+		self.assertEqual('0.65', withHeader[1]['RateTable']['Rate'])
+
+
+
+	def testSaveRepoDirectory(self):
+		"""
+		Save a directory of 1 master file, 1 trade file and 1 rerate file,
+		listed in the reverse order of the dependencies.
+		"""
+		clearRepoData()
+		with TemporaryDirectory() as directory:
+			for fileName in [ 'Repo_ReRate_20210305_20210305174826.xml'
+							, 'RepoTrade_20210305_WithHeaders_20210305155621.xml'
+							, 'RepoMaster_20210305_20210305154653.xml'
+							]:
+				copy(join(getCurrentDir(), 'samples', fileName), directory)
+
+			result = saveRepoDirectoryToDB(directory, workers=2)
+
+		self.assertEqual(18, result['saved'])
+		self.assertEqual( ['RepoMaster', 'RepoTrade', 'Repo_ReRate']
+						, list(map(lambda r: r['type'], result['files'])))
+		self.assertEqual([7, 9, 2], list(map(lambda r: r['saved'], result['files'])))
+
+		data = getRepo()
+		self.assertEqual(6, len(data))
+		self.verifyHKDRepoPosition(data)
+		self.assertEqual(2, len(list(filter( lambda el: el['Action'] == 'rerate'
+										   , getRepoTransactionHistory('316444')))))
+
+
+
+	def testSaveRepoDirectoryBothVariants(self):
+		"""
+		A directory with the same trade export with and without Geneva header,
+		only the file with header is saved.
+		"""
+		clearRepoData()
+		with TemporaryDirectory() as directory:
+			for fileName in [ 'RepoMaster_20210305_20210305154653.xml'
+							, 'RepoTrade_20210305_20210305155621.xml'
+							, 'RepoTrade_20210305_WithHeaders_20210305155621.xml'
+							]:
+				copy(join(getCurrentDir(), 'samples', fileName), directory)
+
+			result = saveRepoDirectoryToDB(directory, workers=2)
+
+		self.assertEqual(16, result['saved'])
+		self.assertEqual( ['RepoMaster_20210305_20210305154653.xml'
+						  , 'RepoTrade_20210305_WithHeaders_20210305155621.xml']
+						, list(map(lambda r: r['file'], result['files'])))
+		self.assertEqual(['RepoTrade_20210305_20210305155621.xml'], result['skipped'])
+		self.assertEqual(6, len(getRepo()))
+
+
+
+	def testLedger(self):
+		"""
+		With the ingestion ledger, a file saved before is skipped, and a file
+		with the same records but different content (with Geneva header) only
+		saves the records not saved before.
+		"""
+		clearRepoData()
+		inputFile = join(getCurrentDir(), 'samples', 'RepoMaster_20210305_20210305154653.xml')
+		self.assertEqual(7, saveRepoMasterFileToDB(inputFile, ledger=True))
+		self.assertEqual(0, saveRepoMasterFileToDB(inputFile, ledger=True))
+
+		inputFile = join(getCurrentDir(), 'samples', 'Repo_ReRate_20210305_20210305174826.xml')
+		self.assertEqual(0, saveRepoRerateFileToDB(inputFile, ledger=True))	# no trades yet
+
+		self.assertEqual(9, saveRepoTradeFileToDB(
+			join(getCurrentDir(), 'samples', 'RepoTrade_20210305_20210305155621.xml')
+		  , ledger=True))
+		self.assertEqual(0, saveRepoTradeFileToDB(
+			join(getCurrentDir(), 'samples', 'RepoTrade_20210305_WithHeaders_20210305155621.xml')
+		  , streaming=True, ledger=True))
+
+		# the failed rerate records are retried
+		self.assertEqual(2, saveRepoRerateFileToDB(inputFile, ledger=True))
+		self.assertEqual(0, saveRepoRerateFileToDB(inputFile, ledger=True))
+		self.assertEqual(2, len(list(filter( lambda el: el['Action'] == 'rerate'
+										   , getRepoTransactionHistory('316444')))))
+
+
+
+	def testLedgerPreloaded(self):
+		"""
+		Files saved before without the ingestion ledger are added to the
+		ledger by the first sweep with it, so the second sweep skips them.
+		"""
+		clearRepoData()
+		fileNames = [ 'RepoMaster_20210305_20210305154653.xml'
+					, 'RepoTrade_20210305_20210305155621.xml'
+					]
+		saveRepoMasterFileToDB(join(getCurrentDir(), 'samples', fileNames[0]))
+		saveRepoTradeFileToDB(join(getCurrentDir(), 'samples', fileNames[1]))
+
+		with TemporaryDirectory() as directory:
+			for fileName in fileNames:
+				copy(join(getCurrentDir(), 'samples', fileName), directory)
+
+			result = saveRepoDirectoryToDB(directory, workers=2, ledger=True)
+			self.assertEqual(fileNames, list(map(lambda r: r['file'], result['files'])))
+			self.assertEqual([], result['skipped'])
+
+			result = saveRepoDirectoryToDB(directory, workers=2, ledger=True)
+			self.assertEqual([], result['files'])
+			self.assertEqual(fileNames, result['skipped'])
+			self.assertEqual(0, result['saved'])
+
+		self.assertEqual(6, len(getRepo()))
+
+
+
+	def testIngestionReport(self):
+		"""
+		Save the same trade file twice with a report, the second time all
+		open trades are duplicates.
+		"""
+		clearRepoData()
+		saveRepoMasterFileToDB(
+			join(getCurrentDir(), 'samples', 'RepoMaster_20210305_20210305154653.xml'))
+
+		reports = []
+		report = IngestionReport(slowest=3, callback=reports.append)
+		inputFile = join(getCurrentDir(), 'samples', 'RepoTrade_20210305_20210305155621.xml')
+		self.assertEqual(9, saveRepoTradeFileToDB(inputFile, streaming=True, report=report))
+		self.assertEqual([report], reports)
+		self.assertEqual(9, report.record_count)
+		self.assertEqual(9, report.saved_count)
+		self.assertEqual(3, len(report.slowest_records()))
+		for name in [ IngestionReport.STAGE_PARSE, IngestionReport.STAGE_VALIDATE
+					, IngestionReport.STAGE_DB]:
+			self.assertTrue(report.stage_seconds[name] > 0)
+
+		report = IngestionReport()
+		self.assertEqual(2, saveRepoTradeFileToDB(inputFile, report=report))
+		self.assertEqual(9, report.to_dict()['records'])
+		self.assertEqual({'RepoTransactionAlreadyExistError': 7}, report.to_dict()['errors'])
+
+
+
 	def verifyHKDRepoPosition(self, data):
 		L = list(filter(lambda p: p['Currency'] == 'HKD', data))
 		self.assertEqual(2, len(L))	# one open, one close
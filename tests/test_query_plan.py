@@ -0,0 +1,273 @@
+# coding=utf-8
+#
+
+import itertools
+import unittest2
+from datetime import datetime
+from repo_data.constants import Constants
+from repo_data.data import initializeDatastore
+from repo_data.services.repo_snapshot_services import RepoSnapshotServices
+from repo_data.services.repo_transaction_services import RepoTransactionServices
+from repo_data.utils.database import DBConn
+from repo_data.utils.validator import AppValidatorFactory
+from repo_data.models.repo_transaction import RepoTransaction
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+
+
+
+class TestQueryPlan(unittest2.TestCase):
+
+	def setUp(self):
+		initializeDatastore('uat')
+		self.db = DBConn.get_db(Constants.DBMODE_UAT)
+		if not self.db.dialect.name in ('sqlite', 'mysql'):
+			self.skipTest('EXPLAIN not supported for ' + self.db.dialect.name)
+
+
+
+	def testGetRepoQueryPlan(self):
+		"""
+		Every combination of the getRepo filters allowed by the validator
+		shall search an index of repo_transactions instead of scanning the
+		whole table, except those without an equality filter or a maturity
+		window: no filter at all, or only hasHairCut True (haircut != 0), the
+		status as of a date and one of the maturity dates or asOfDate, where
+		a scan in id order is cheaper than searching the index and sorting.
+		"""
+		services = RepoTransactionServices(self.db)
+		session = sessionmaker(bind=self.db)()
+		try:
+			validator = AppValidatorFactory().get_validator('getRepo')
+			combinations = [ params for params in getFilterCombinations(validator.schema)
+							 if validator.validate(params)]
+			self.assertEqual(2560, len(combinations))
+			for params in combinations:
+				if not hasEqualityFilter(params) and \
+						(params['maturity_from'] is None or params['maturity_to'] is None):
+					continue
+				query = services._build_query(session, params)
+				self.assertFalse( explainIsFullScan(session, query.statement)
+								, 'full scan for ' + str(params) + ', plan: ' + \
+								  str(explain(session, query.statement)))
+		finally:
+			session.close()
+
+
+
+	def testAsOfDateQueryPlan(self):
+		"""
+		The close and cancel of each transaction on or before asOfDate shall
+		be a search of (transaction_id, action, date) of the history.
+		"""
+		services = RepoTransactionServices(self.db)
+		session = sessionmaker(bind=self.db)()
+		try:
+			for status in AppValidatorFactory().get_validator('getRepo').schema['status']['allowed']:
+				params = { 'status': status, 'portfolio': '12734', 'custodian': 'all'
+						 , 'repo_code': 'all', 'broker': 'all', 'has_hair_cut': 'all'
+						 , 'maturity_from': None, 'maturity_to': None, 'as_of_date': '2020-03-31'}
+				statement = services._build_query(session, params).statement
+				rows = explain(session, statement)
+				self.assertFalse(explainIsFullScan(session, statement), str(rows))
+				if self.db.dialect.name == 'sqlite':
+					self.assertTrue(any( 'idx_repo_transaction_history__transaction_id_action_date' in row[-1]
+										 for row in rows), str(rows))
+				else:
+					self.assertTrue(any( 'idx_repo_transaction_history__transaction_id_action_date' in (row['possible_keys'] or '')
+										 for row in rows), str(rows))
+		finally:
+			session.close()
+
+
+
+	def testRepoAtTimeQueryPlan(self):
+		"""
+		The status and interest rate of each transaction at a time shall be
+		index searches of its history, and of its row in the snapshot if
+		any, instead of reading the whole history.
+		"""
+		services = RepoTransactionServices(self.db)
+		snapshotServices = RepoSnapshotServices(self.db)
+		session = sessionmaker(bind=self.db)()
+		try:
+			snapshotServices.create(datetime(2020, 3, 1))
+			for time_stamp, tables in [ (datetime(2000, 1, 1), ['repo_transaction_history'])
+									  , (datetime(2020, 3, 31), ['repo_transaction_history', 'repo_snapshot_transactions'])
+									  ]:
+				for status in AppValidatorFactory().get_validator('getRepoAtTime').schema['status']['allowed']:
+					params = { 'status': status, 'portfolio': '12734', 'custodian': 'all'
+							 , 'repo_code': 'all', 'broker': 'all', 'has_hair_cut': 'all'
+							 , 'maturity_from': None, 'maturity_to': None, 'as_of_date': None
+							 , 'time_stamp': time_stamp}
+					statement = services._build_query(session, params).statement
+					rows = explain(session, statement)
+					self.assertFalse(explainIsFullScan(session, statement), str(rows))
+					for table in tables:
+						if self.db.dialect.name == 'sqlite':
+							self.assertTrue(any(row[-1].startswith('SEARCH ' + table + ' ') for row in rows), str(rows))
+						else:
+							self.assertTrue(any(row['table'] == table for row in rows), str(rows))
+		finally:
+			session.close()
+			snapshotServices.delete_all()
+
+
+
+	def testReplayQueryPlan(self):
+		"""
+		The last history of a snapshot shall be a search of created_at, the
+		history replayed after it a range search of the primary key.
+		"""
+		services = RepoSnapshotServices(self.db)
+		session = sessionmaker(bind=self.db)()
+		try:
+			statement = services._build_histories(0, 100)
+			rows = explain(session, statement)
+			self.assertFalse(explainIsFullScan(session, statement), str(rows))
+
+			statement = services._build_history_id(datetime(2020, 3, 31))
+			rows = explain(session, statement)
+			self.assertFalse(explainIsFullScan(session, statement), str(rows))
+			if self.db.dialect.name == 'sqlite':
+				self.assertTrue(any( 'idx_repo_transaction_history__created_at' in row[-1]
+									 for row in rows), str(rows))
+			else:
+				self.assertTrue(any( 'idx_repo_transaction_history__created_at' in (row['possible_keys'] or '')
+									 for row in rows), str(rows))
+		finally:
+			session.close()
+
+
+
+	def testMaturityWindowQueryPlan(self):
+		"""
+		A maturity window shall be a range search of an index with
+		maturity_date, with or without the status.
+		"""
+		services = RepoTransactionServices(self.db)
+		session = sessionmaker(bind=self.db)()
+		try:
+			for status in AppValidatorFactory().get_validator('getRepo').schema['status']['allowed']:
+				params = { 'status': status, 'portfolio': 'all', 'custodian': 'all'
+						 , 'repo_code': 'all', 'broker': 'all', 'has_hair_cut': 'all'
+						 , 'maturity_from': '2020-01-01', 'maturity_to': '2020-03-31', 'as_of_date': None}
+				rows = explain(session, services._build_query(session, params).statement)
+				if self.db.dialect.name == 'sqlite':
+					self.assertTrue(any('maturity_date>?' in row[-1] for row in rows), str(rows))
+				else:
+					self.assertTrue(any('maturity_date' in (row['possible_keys'] or '') for row in rows), str(rows))
+		finally:
+			session.close()
+
+
+
+	def testCreateMissingIndexes(self):
+		"""
+		DBConn.create_schema adds the indexes missing from an existing
+		SQLite table, as sql/migrate_getrepo_indexes.sql does on MySQL.
+		"""
+		engine = create_engine('sqlite://')
+		table = RepoTransaction.__table__
+		#-- the table as created before the getRepo indexes
+		table.create(engine)
+		for index in table.indexes:
+			index.drop(engine)
+		DBConn.create_schema(engine)
+		self.assertEqual( sorted(index.name for index in table.indexes)
+						, sorted(index['name'] for index in inspect(engine).get_indexes(table.name)))
+
+
+
+	def testMigrateMaturityDate(self):
+		"""
+		DBConn.create_schema moves '' and 'ERROR' of an existing SQLite
+		maturity_date (a string before v1.3.0) to maturity_state, as
+		sql/migrate_maturity_date.sql does on MySQL.
+		"""
+		engine = create_engine('sqlite://')
+		#-- the columns as before v1.3.0
+		engine.execute( 'CREATE TABLE repo_transactions (id INTEGER PRIMARY KEY, '
+						'transaction_id VARCHAR(20) NOT NULL, portfolio VARCHAR(100), '
+						'custodian VARCHAR(100), settle_date DATETIME, maturity_date VARCHAR(100), '
+						'repo_code VARCHAR(100), broker VARCHAR(100), haircut NUMERIC(18, 6), '
+						'status VARCHAR(10))')
+		engine.execute( "INSERT INTO repo_transactions (transaction_id, maturity_date) VALUES "
+						"('300734', '2020-03-10'), ('300735', ''), ('300736', 'ERROR')")
+		DBConn.create_schema(engine)
+		rows = engine.execute( 'SELECT transaction_id, maturity_date, maturity_state '
+							   'FROM repo_transactions ORDER BY id').fetchall()
+		self.assertEqual( [ ('300734', '2020-03-10', 'date')
+						  , ('300735', None, 'open')
+						  , ('300736', None, 'error')]
+						, [tuple(row) for row in rows])
+		self.assertIn( 'idx_repo_transactions__maturity_date'
+					 , [index['name'] for index in inspect(engine).get_indexes('repo_transactions')])
+		#-- MaturityDate as before
+		self.assertEqual( ['2020-03-10', '', 'ERROR']
+						, [ RepoTransaction.get_maturity_date_string(row[1], row[2])
+							for row in rows])
+
+
+
+def getFilterCombinations(schema):
+	"""
+	[Dictionary] validator schema => [List] ([Dictionary] params)
+
+	Each allowed value of the fields with 'allowed', None or a date for
+	the nullable (date) fields, 'all' or a value for the other fields.
+	"""
+	def getValues(rules):
+		if 'allowed' in rules:
+			return rules['allowed']
+		elif rules.get('nullable', False):
+			return [None, '2020-03-10']
+		return ['all', 'x']
+
+	names = sorted(schema)
+	values = [getValues(schema[name]) for name in names]
+	return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+
+def hasEqualityFilter(params):
+	"""
+	[Dictionary] params => [Bool] whether a filter is an equality
+
+	As of a date, only canceled is an equality of the status, an open or
+	closed transaction may have been otherwise on the date.
+	"""
+	if params['as_of_date'] is None or params['status'] == 'canceled':
+		if params['status'] != 'all':
+			return True
+	return any(params[name] != 'all' for name in ('portfolio', 'custodian', 'repo_code', 'broker')) \
+		or params['has_hair_cut'].lower() == 'false'
+
+
+
+def explain(session, statement):
+	"""
+	[Session] session, [Select] statement => [List] rows of EXPLAIN
+	"""
+	sql = str(statement.compile( dialect=session.bind.dialect
+							   , compile_kwargs={'literal_binds': True}))
+	if session.bind.dialect.name == 'sqlite':
+		return [tuple(row) for row in session.execute('EXPLAIN QUERY PLAN ' + sql)]
+	return [dict(row) for row in session.execute('EXPLAIN ' + sql)]
+
+
+
+def explainIsFullScan(session, statement):
+	"""
+	[Session] session, [Select] statement => [Bool] the plan reads the
+	whole table (or a whole index) instead of searching an index.
+
+	On MySQL the plan of a small test table may still be a scan, so the
+	statement only needs an index it can use (possible_keys).
+	"""
+	rows = explain(session, statement)
+	if session.bind.dialect.name == 'sqlite':
+		#-- the last column is the detail, e.g. 'SEARCH repo_transactions USING INDEX ...'
+		#-- or 'SCAN repo_transactions' (older versions: 'SCAN TABLE ...')
+		return any(row[-1].startswith('SCAN') for row in rows)
+	return any(row['possible_keys'] is None for row in rows)
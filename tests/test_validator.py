@@ -0,0 +1,122 @@
+# coding=utf-8
+# 
+
+import unittest2
+from concurrent.futures import ThreadPoolExecutor
+from repo_data.utils.validator import AppValidatorFactory
+from repo_data.tests.test_data_memory import getMaster, getTransaction, getRerate
+import time
+
+
+
+class TestValidator(unittest2.TestCase):
+
+	def testValidatorReused(self):
+		v = AppValidatorFactory().get_validator('addRepoTransaction')
+		self.assertIs(v, AppValidatorFactory().get_validator('addRepoTransaction'))
+		self.assertIsNot(v, AppValidatorFactory().get_validator('closeRepoTransaction'))
+
+		# another thread gets its own validator
+		with ThreadPoolExecutor(max_workers=1) as executor:
+			other = executor.submit(AppValidatorFactory().get_validator, 'addRepoTransaction').result()
+		self.assertIsNot(v, other)
+
+		with self.assertRaises(Exception):
+			AppValidatorFactory().get_validator('noSuchMethod')
+
+
+
+	def testConcurrentValidation(self):
+		"""
+		Validate good and bad transactions from 8 threads, each result
+		and error shall belong to its own document.
+		"""
+		def validate(i):
+			transaction = getTransaction(300000 + i, 'MMRPE420BS')
+			if i % 2 == 1:
+				transaction['EventDate'] = '2018-08-32T00:00:00'
+			v = AppValidatorFactory().get_validator('addRepoTransaction')
+			return v.validate(transaction), sorted(v.errors)
+
+		with ThreadPoolExecutor(max_workers=8) as executor:
+			results = list(executor.map(validate, range(2000)))
+
+		self.assertEqual( [(True, []) if i % 2 == 0 else (False, ['EventDate']) for i in range(2000)]
+						, results)
+
+
+
+	def testBatchValidation(self):
+		"""
+		The errors of each record shall be the same as validating the
+		records one by one.
+		"""
+		badValues = ['', 'abc', '2018-08-27', 'Isin=', '=XS1234', 'x'*200, 'CALC', '1.5']
+		transactions = []
+		for i in range(len(badValues)):
+			for field in getTransaction(0, 'MMRPE420BS'):
+				transaction = getTransaction(300000 + i, 'MMRPE420BS')
+				transaction[field] = badValues[i]
+				transactions.append(transaction)
+		transactions.append(getTransaction(300000, 'MMRPE420BS', Extra='abc'))
+		transactions.append({k: v for k, v in getTransaction(300000, 'MMRPE420BS').items() if k != 'Price'})
+		# values not of string type, which raise in cerberus for the fields without type
+		transactions.append(getTransaction(300000, 'MMRPE420BS', Broker=None))
+		transactions.append(getTransaction(300000, 'MMRPE420BS', Portfolio=12734))
+		transactions.append(getTransaction(300000, 'MMRPE420BS', UserTranId1=[]))
+		self.assertBatchErrors('addRepoTransaction', transactions)
+
+		rerates = [ getRerate(300000, '0.5', '2018-09-01'), getRerate(300000, 'abc', '2018-09-01')
+				  , getRerate(300000, '0.5', '2018-09'), getRerate('x'*21, '0.5', '2018-09-01')
+				  , {'UserTranId1': '300000', 'RateTable': {}}, {'UserTranId1': '300000'}
+				  , {'UserTranId1': '300000', 'RateTable': {'Rate': '0.5'}}
+				  , {'UserTranId1': '300000', 'RateTable': 'abc'}]
+		self.assertBatchErrors('rerateRepoTransaction', rerates)
+
+		masters = [ getMaster('TEST'), dict(getMaster('TEST'), AccrualDaysPerMonth='abc')
+				  , dict(getMaster('TEST'), BifurcationCurrency='USDHKD')]
+		self.assertBatchErrors('addRepoMaster', masters)
+
+		recordHashes = [{'record_hashes': h} for h in [[], ['abc'], ['x'*65], [1], 'abc', ['abc', None]]]
+		self.assertBatchErrors('addIngestedRecordHashes', recordHashes)
+
+
+
+	def testBatchValidationColumnar(self):
+		"""
+		A columnar table gives the same errors as its records, None means
+		the field is not in the record.
+		"""
+		transactions = [getTransaction(300000 + i, 'MMRPE420BS') for i in range(100)]
+		transactions[10]['EventDate'] = '2018-08-32T00:00:00'
+		transactions[20]['OpenEnded'] = 'CALC'
+		transactions[30]['OpenEnded'] = 'abc'
+		del transactions[40]['Broker']
+		table = {field: [t.get(field) for t in transactions] for field in transactions[20]}
+		v = AppValidatorFactory().get_batch_validator('addRepoTransaction')
+		errors = v.validate(table)
+		self.assertEqual(v.validate(transactions), errors)
+		self.assertEqual([10, 30, 40], [i for i, e in enumerate(errors) if e])
+		self.assertEqual({'Broker': ['required field']}, errors[40])
+
+		with self.assertRaises(ValueError):
+			v.validate({'UserTranId1': ['1', '2'], 'Broker': ['abc']})
+
+
+
+	def testBatchValidationSpeed(self):
+		transactions = [getTransaction(300000 + i, 'MMRPE420BS') for i in range(100000)]
+		transactions[50000]['Price'] = 'abc'
+		t = time.time()
+		errors = AppValidatorFactory().get_batch_validator('addRepoTransaction').validate(transactions)
+		self.assertLess(time.time() - t, 5)
+		self.assertEqual({'Price': ['must be of number type']}, errors[50000])
+		self.assertEqual(1, len([e for e in errors if e]))
+
+
+
+	def assertBatchErrors(self, methodName, records):
+		v = AppValidatorFactory().get_validator(methodName)
+		expected = [{} if v.validate(record) else v.errors for record in records]
+		self.assertTrue(any(expected))
+		self.assertEqual(expected, AppValidatorFactory().get_batch_validator(methodName).validate(records))
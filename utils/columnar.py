@@ -0,0 +1,84 @@
+# coding=utf-8
+# 
+from datetime import date, datetime
+from repo_data.constants import Constants
+
+#-- type of the output columns, string if not listed
+column_types = {
+	"TradeDate" : "date",
+	"SettleDate" : "date",
+	"IsOpenRepo" : "bool",
+	"Quantity" : "float",
+	"Price" : "float",
+	"CollateralValue" : "float",
+	"InterestRate" : "float",
+	"LoanAmount" : "float",
+	"Haircut" : "float"
+}
+
+#-- format => name of the package needed
+formats = {
+	Constants.GETREPO_FORMAT_COLUMNS : None,
+	Constants.GETREPO_FORMAT_NUMPY : "numpy",
+	Constants.GETREPO_FORMAT_PANDAS : "pandas",
+	Constants.GETREPO_FORMAT_ARROW : "pyarrow"
+}
+
+def check_format(format):
+	#-- throw ValueError if the format is unknown, ImportError if its package is not installed
+	if not format in formats:
+		raise ValueError("Input validation error. Details: {'format': ['unallowed value " + \
+							str(format) + "']}")
+	if not formats[format] is None:
+		try:
+			__import__(formats[format])
+		except ImportError:
+			raise ImportError("Package " + formats[format] + " is required for format " + \
+								format + ", please install it")
+
+def to_format(columns, format):
+	#-- columns is dictionary of column name => list of values as fetched from the datastore.
+	#-- return the columns in the format, the values of each column in one type
+	check_format(format)
+	if format == Constants.GETREPO_FORMAT_COLUMNS:
+		return {name : to_list(name, values) for name, values in columns.items()}
+	elif format == Constants.GETREPO_FORMAT_NUMPY:
+		return {name : to_array(name, values) for name, values in columns.items()}
+	elif format == Constants.GETREPO_FORMAT_PANDAS:
+		import pandas
+		return pandas.DataFrame({name : to_array(name, values) for name, values in columns.items()},
+								columns=list(columns))
+	elif format == Constants.GETREPO_FORMAT_ARROW:
+		import pyarrow
+		return pyarrow.table({name : pyarrow.array(to_array(name, values)) \
+								for name, values in columns.items()})
+
+def to_list(name, values):
+	column_type = column_types.get(name, "string")
+	if column_type == "date":
+		return [to_date(value) for value in values]
+	elif column_type == "bool":
+		return [value == 1 for value in values]
+	elif column_type == "float":
+		return [float(value) for value in values]
+	return [str(value) for value in values]
+
+def to_array(name, values):
+	#-- dates as datetime64[D], floats as float64, bools as bool and strings as object
+	import numpy
+	column_type = column_types.get(name, "string")
+	if column_type == "date":
+		return numpy.array([to_date(value) for value in values], dtype="datetime64[D]")
+	elif column_type == "bool":
+		return numpy.array(values, dtype="int64") == 1
+	elif column_type == "float":
+		return numpy.array(values, dtype="float64")
+	return numpy.array([str(value) for value in values], dtype=object)
+
+def to_date(value):
+	#-- the database returns datetime, the in-memory datastore 'yyyy-mm-dd' strings
+	if isinstance(value, datetime):
+		return value.date()
+	elif isinstance(value, date):
+		return value
+	return datetime.strptime(str(value)[0:10], "%Y-%m-%d").date()
@@ -3,38 +3,192 @@
 from os.path import abspath, dirname, join
 
 import configparser
-from sqlalchemy import create_engine
+import os
+import threading
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from repo_data.constants import Constants
+from repo_data.models import (repo_master,
+								repo_transaction,
+								repo_transaction_history,
+								repo_ingested_file,
+								repo_ingested_record,
+								repo_snapshot,
+								repo_snapshot_transaction)
 
 getCurrentDirectory = lambda : \
 	dirname(abspath(__file__))
 
 class DBConn:
 
-	#-- return a db engine based on the given mode
+	#-- engines by config file and mode, so that initializeDatastore reuses the warm
+	#-- connection pool, and another config file gets its own engines
+	engines = {}
+	engines_lock = threading.Lock()
+
+	#-- SQLite engines by url, so that all callers share the same in-memory database
+	sqlite_engines = {}
+	sqlite_engines_lock = threading.Lock()
+
+	#-- return the config and the config section name of the given mode
 	@staticmethod
-	def get_db(mode):
+	def get_config(mode):
 		if mode != Constants.DBMODE_TEST and \
 				mode != Constants.DBMODE_UAT and \
 				mode != Constants.DBMODE_PRODUCTION:
 			message = "Unkown database mode: " + str(mode)
 			raise Exception(message)
 		config = configparser.ConfigParser()
-		config.read( join(getCurrentDirectory(), "..", "database_config.ini") )
+		config.read(DBConn.get_config_file())
 		#-- default is test database
 		config_section = 'Database Test'
 		if (mode == Constants.DBMODE_UAT):
 			config_section = 'Database UAT'
 		if (mode == Constants.DBMODE_PRODUCTION):
 			config_section = 'Database Production'
-		username = config.get(config_section, 'username')
-		password = config.get(config_section, 'password')
-		host = config.get(config_section, 'host')
-		port = config.get(config_section, 'port')
-		dbname = config.get(config_section, 'dbname')
-		#-- convert port to a string
-		conn_string = "mysql+mysqlconnector://" + username + ":" + password + "@" + host + ":" + str(port) + "/" + dbname
-		engine = create_engine(conn_string)
+		return config, config_section
+
+	#-- return the path of the config file. The environment variable
+	#-- REPO_DATA_DATABASE_CONFIG overrides database_config.ini, e.g. to run the
+	#-- tests on SQLite
+	@staticmethod
+	def get_config_file():
+		return os.environ.get("REPO_DATA_DATABASE_CONFIG",
+								join(getCurrentDirectory(), "..", "database_config.ini"))
+
+	#-- return the optional repo master cache ttl (in seconds) of the given mode,
+	#-- None if not set, i.e. the cache is only reloaded when repo master changes
+	@staticmethod
+	def get_master_cache_ttl(mode):
+		config, config_section = DBConn.get_config(mode)
+		ttl = config.get(config_section, 'master_cache_ttl', fallback='')
+		if ttl.strip() == '':
+			return None
+		return float(ttl)
+
+	#-- return the optional byte budget of the getRepo / getRepoTransactionHistory
+	#-- result cache of the given mode, None if not set, i.e. the cache is disabled
+	@staticmethod
+	def get_result_cache_size(mode):
+		config, config_section = DBConn.get_config(mode)
+		size = config.get(config_section, 'result_cache_size', fallback='')
+		if size.strip() == '':
+			return None
+		return int(size)
+
+	#-- return the optional result cache ttl (in seconds) of the given mode, None
+	#-- if not set, i.e. cached results are only dropped by writes of this process
+	@staticmethod
+	def get_result_cache_ttl(mode):
+		config, config_section = DBConn.get_config(mode)
+		ttl = config.get(config_section, 'result_cache_ttl', fallback='')
+		if ttl.strip() == '':
+			return None
+		return float(ttl)
+
+	#-- return the cached db engine of the given mode, created on first call
+	@staticmethod
+	def get_db(mode):
+		key = (DBConn.get_config_file(), mode)
+		with DBConn.engines_lock:
+			engine = DBConn.engines.get(key)
+			if engine is None:
+				engine = DBConn.create_db(mode)
+				DBConn.engines[key] = engine
+			return engine
+
+	#-- dispose the cached engines and their connections, so that the next
+	#-- get_db call reads database_config.ini again
+	@staticmethod
+	def dispose_all():
+		with DBConn.engines_lock:
+			with DBConn.sqlite_engines_lock:
+				for engine in set(DBConn.engines.values()) | set(DBConn.sqlite_engines.values()):
+					engine.dispose()
+				DBConn.engines.clear()
+				DBConn.sqlite_engines.clear()
+
+	#-- return a new db engine based on the given mode
+	@staticmethod
+	def create_db(mode):
+		config, config_section = DBConn.get_config(mode)
+		#-- a database url, such as sqlite:////path/repodatadb.sqlite or sqlite://
+		#-- for in-memory SQLite, overrides the other settings of the section
+		conn_string = config.get(config_section, 'url', fallback='').strip()
+		if conn_string == '':
+			driver = config.get(config_section, 'driver', fallback='mysql+mysqlconnector')
+			username = config.get(config_section, 'username')
+			password = config.get(config_section, 'password')
+			host = config.get(config_section, 'host')
+			port = config.get(config_section, 'port')
+			dbname = config.get(config_section, 'dbname')
+			#-- convert port to a string
+			conn_string = driver + "://" + username + ":" + password + "@" + host + ":" + str(port) + "/" + dbname
+		if conn_string.startswith("sqlite"):
+			return DBConn.get_sqlite_db(conn_string)
+		#-- connection pool options, MySQL closes connections idle for wait_timeout
+		#-- (8 hours by default), so recycle them before that
+		engine = create_engine(conn_string,
+								pool_size=config.getint(config_section, 'pool_size', fallback=5),
+								max_overflow=config.getint(config_section, 'max_overflow', fallback=10),
+								pool_pre_ping=config.getboolean(config_section, 'pool_pre_ping', fallback=True),
+								pool_recycle=config.getint(config_section, 'pool_recycle', fallback=3600))
 		return engine
+
+	#-- return a SQLite engine of the url with the schema created
+	@staticmethod
+	def get_sqlite_db(conn_string):
+		with DBConn.sqlite_engines_lock:
+			engine = DBConn.sqlite_engines.get(conn_string)
+			if engine is None:
+				if conn_string in ("sqlite://", "sqlite:///:memory:"):
+					#-- one connection shared by all threads, otherwise each
+					#-- connection has its own in-memory database
+					engine = create_engine(conn_string,
+											connect_args={"check_same_thread" : False},
+											poolclass=StaticPool)
+				else:
+					engine = create_engine(conn_string,
+											connect_args={"check_same_thread" : False})
+				DBConn.create_schema(engine)
+				DBConn.sqlite_engines[conn_string] = engine
+			return engine
+
+	#-- create the tables and indexes (same as sql/create.sql) if not exist
+	@staticmethod
+	def create_schema(engine):
+		for model in (repo_master,
+						repo_transaction,
+						repo_transaction_history,
+						repo_ingested_file,
+						repo_ingested_record,
+						repo_snapshot,
+						repo_snapshot_transaction):
+			model.BaseModel.metadata.create_all(engine)
+			if model is repo_transaction:
+				DBConn.migrate_maturity_date(engine)
+			#-- create_all skips existing tables, so add the indexes added since
+			#-- then to them, like the scripts sql/migrate_*.sql do on MySQL
+			for table in model.BaseModel.metadata.tables.values():
+				existing_indexes = set(index["name"] for index in inspect(engine).get_indexes(table.name))
+				for index in table.indexes:
+					if not index.name in existing_indexes:
+						index.create(engine)
+
+	#-- store maturity_date of an existing SQLite repo_transactions as a date with
+	#-- maturity_state, as sql/migrate_maturity_date.sql does on MySQL. SQLite
+	#-- stores a date as a yyyy-mm-dd string, so only '' and 'ERROR' are changed
+	@staticmethod
+	def migrate_maturity_date(engine):
+		columns = [column["name"] for column in inspect(engine).get_columns("repo_transactions")]
+		if "maturity_state" in columns:
+			return
+		with engine.begin() as connection:
+			connection.execute("ALTER TABLE repo_transactions "
+								"ADD COLUMN maturity_state VARCHAR(10) NOT NULL DEFAULT 'date'")
+			connection.execute("UPDATE repo_transactions SET maturity_state = "
+								"CASE maturity_date WHEN '' THEN 'open' WHEN 'ERROR' THEN 'error' ELSE 'date' END")
+			connection.execute("UPDATE repo_transactions SET maturity_date = NULL "
+								"WHERE maturity_state <> 'date'")
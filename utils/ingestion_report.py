@@ -0,0 +1,111 @@
+# coding=utf-8
+# 
+import heapq
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+#-- the report of the ingestion running in the current thread, None if no report is wanted
+_active_report = ContextVar("active_report", default=None)
+
+class IngestionReport:
+
+	STAGE_PARSE = "parse"
+	STAGE_VALIDATE = "validate"
+	STAGE_DB = "db"
+
+	def __init__(self, slowest=10, callback=None):
+		#-- callback is called with the report when the ingestion finishes
+		self.slowest = slowest
+		self.callback = callback
+		self.stage_seconds = defaultdict(float)
+		self.error_counts = Counter()
+		self.record_count = 0
+		self.saved_count = 0
+		self.elapsed_seconds = 0.0
+		self._slowest_records = []
+		self._started_at = None
+
+	@contextmanager
+	def stage(self, name):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.stage_seconds[name] += time.perf_counter() - start
+
+	def add_record(self, record_id, seconds, result):
+		#-- seconds is None if the record is saved in batch and not timed on its own
+		self.record_count += 1
+		if result == 1:
+			self.saved_count += 1
+		if seconds is not None and self.slowest > 0:
+			item = (seconds, self.record_count, record_id)
+			if len(self._slowest_records) < self.slowest:
+				heapq.heappush(self._slowest_records, item)
+			else:
+				heapq.heappushpop(self._slowest_records, item)
+
+	def add_error(self, error):
+		self.error_counts[type(error).__name__] += 1
+
+	def records_per_second(self):
+		if self.elapsed_seconds == 0:
+			return 0.0
+		return self.record_count / self.elapsed_seconds
+
+	def slowest_records(self):
+		#-- list of (record id, seconds), the slowest first
+		return [(record_id, seconds) for seconds, _, record_id in \
+					sorted(self._slowest_records, reverse=True)]
+
+	def to_dict(self):
+		return {
+			"records" : self.record_count,
+			"saved" : self.saved_count,
+			"elapsedSeconds" : self.elapsed_seconds,
+			"recordsPerSecond" : self.records_per_second(),
+			"stageSeconds" : dict(self.stage_seconds),
+			"errors" : dict(self.error_counts),
+			"slowestRecords" : self.slowest_records()
+		}
+
+	def __repr__(self):
+		return "IngestionReport(" + str(self.to_dict()) + ")"
+
+@contextmanager
+def active_report(report):
+	#-- make the report active in the current thread for the duration of
+	#-- the ingestion, and call its callback at the end. report can be None
+	if report is None:
+		yield None
+		return
+	token = _active_report.set(report)
+	start = time.perf_counter()
+	try:
+		yield report
+	finally:
+		report.elapsed_seconds += time.perf_counter() - start
+		_active_report.reset(token)
+		if report.callback is not None:
+			report.callback(report)
+
+def get_active_report():
+	return _active_report.get()
+
+@contextmanager
+def _no_stage():
+	yield
+
+def stage(name):
+	#-- time the block into the stage of the active report, if any
+	report = _active_report.get()
+	if report is None:
+		return _no_stage()
+	return report.stage(name)
+
+def add_error(error):
+	report = _active_report.get()
+	if report is not None:
+		report.add_error(error)
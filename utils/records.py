@@ -0,0 +1,70 @@
+# coding=utf-8
+#
+from collections.abc import Mapping
+import sys
+
+class Record(Mapping):
+	#-- read only row with one slot per field instead of a dictionary per row.
+	#-- It is a Mapping with the field names as keys, so record["Status"],
+	#-- record.get("Status"), dict(record) and record == dictionary work as before
+	__slots__ = ()
+	#-- the field names, set by the subclasses
+	fields = frozenset()
+	#-- the fields of few distinct values repeated in many rows, like Portfolio or
+	#-- Status, whose strings are interned to be shared. Unique values such as
+	#-- TransactionId are not, the intern table would only grow with them
+	interned = frozenset()
+
+	def __init__(self, d):
+		for name in self.__slots__:
+			value = d[name]
+			if type(value) is str and name in self.interned:
+				value = sys.intern(value)
+			object.__setattr__(self, name, value)
+
+	def __setattr__(self, name, value):
+		raise AttributeError(type(self).__name__ + " is read only")
+
+	def __getitem__(self, key):
+		if not key in self.fields:
+			raise KeyError(key)
+		return getattr(self, key)
+
+	def __iter__(self):
+		return iter(self.__slots__)
+
+	def __len__(self):
+		return len(self.__slots__)
+
+	def __contains__(self, key):
+		return key in self.fields
+
+	def __reduce__(self):
+		return (type(self), (dict(self),))
+
+	def __repr__(self):
+		return type(self).__name__ + "(" + repr(dict(self)) + ")"
+
+class RepoTransactionRecord(Record):
+	#-- row of getRepo
+	__slots__ = ( "TransactionId", "Type", "Portfolio", "Custodian", "CollateralIDType"
+				, "CollateralID", "CollateralGlobalID", "TradeDate", "SettleDate"
+				, "IsOpenRepo", "MaturityDate", "Quantity", "Currency", "Price"
+				, "CollateralValue", "RepoName", "InterestRate", "LoanAmount", "Broker"
+				, "Haircut", "Status", "DayCount")
+	fields = frozenset(__slots__)
+	interned = frozenset(( "Type", "Portfolio", "Custodian", "CollateralIDType", "Currency"
+						 , "RepoName", "Broker", "Status", "DayCount"))
+
+class RepoTransactionHistoryRecord(Record):
+	#-- row of getRepoTransactionHistory
+	__slots__ = ("TransactionId", "Action", "Date", "InterestRate", "TimeStamp")
+	fields = frozenset(__slots__)
+	interned = frozenset(("Action",))
+
+def to_records(rows, record_type):
+	#-- replace the dictionaries of the list by records one by one, so that each
+	#-- dictionary is freed as soon as it is converted
+	for i, row in enumerate(rows):
+		rows[i] = record_type(row)
+	return rows
@@ -2,36 +2,92 @@
 # 
 from cerberus import Validator
 from cerberus.errors import BasicErrorHandler
+from collections.abc import Mapping, Sequence
 from datetime import datetime
 from repo_data.utils.error_handling import InvalidRepoTransactionTypeError
-import yaml
+from itertools import repeat
+import copy
 import re
+import threading
+import yaml
 
 class AppValidatorFactory:
 
+	#-- method_name => schema, parsed once on first use and shared by all threads
+	schemas = {}
+	schemas_lock = threading.Lock()
+	#-- method_name => validator of each thread. A validator keeps the document and
+	#-- errors of its last validation, so it is reused by its own thread only
+	thread_local = threading.local()
+	#-- method_name => batch validator
+	batch_validators = {}
+
 	def get_validator(self, method_name):
+		validators = getattr(AppValidatorFactory.thread_local, "validators", None)
+		if validators is None:
+			validators = {}
+			AppValidatorFactory.thread_local.validators = validators
+		validator = validators.get(method_name)
+		if validator is None:
+			#-- each validator gets its own copy of the schema
+			validator = AppValidator(copy.deepcopy(self._get_schema(method_name)))
+			validators[method_name] = validator
+		return validator
+
+	def get_batch_validator(self, method_name):
+		#-- a batch validator keeps no state between validations, so one is shared by all threads
+		schema = self._get_schema(method_name)
+		with AppValidatorFactory.schemas_lock:
+			validator = AppValidatorFactory.batch_validators.get(method_name)
+			if validator is None:
+				validator = AppBatchValidator(method_name, copy.deepcopy(schema))
+				AppValidatorFactory.batch_validators[method_name] = validator
+			return validator
+
+	def _get_schema(self, method_name):
+		with AppValidatorFactory.schemas_lock:
+			schema = AppValidatorFactory.schemas.get(method_name)
+			if schema is None:
+				schema = self._load_schema(method_name)
+				AppValidatorFactory.schemas[method_name] = schema
+			return schema
+
+	def _load_schema(self, method_name):
 		if method_name == "addRepoMaster":
-			return self._get_add_repo_master_validator()
+			return self._get_add_repo_master_schema()
 		elif method_name == "addRepoTransaction":
-			return self._get_add_transaction_validator()
+			return self._get_add_transaction_schema()
 		elif method_name == "cancelRepoTransaction":
-			return self._get_cancel_transaction_validator()
+			return self._get_cancel_transaction_schema()
 		elif method_name == "closeRepoTransaction":
-			return self._get_close_transaction_validator()
+			return self._get_close_transaction_schema()
 		elif method_name == "rerateRepoTransaction":
-			return self._get_rerate_transaction_validator()
+			return self._get_rerate_transaction_schema()
 		elif method_name == "getRepo":
-			return self._get_repo_validator()
+			return self._get_repo_schema()
 		elif method_name == "getRepoTransactionHistory":
-			return self._get_repo_transaction_history_validator()
+			return self._get_repo_transaction_history_schema()
+		elif method_name == "getRepoAtTime":
+			return self._get_repo_at_time_schema()
+		elif method_name == "takeRepoSnapshot":
+			return self._get_take_repo_snapshot_schema()
+		elif method_name == "getPage":
+			return self._get_page_schema()
 		elif method_name == "getUserTranIdsFromRepoName":
-			return self._get_user_tranids_from_repo_name_validator()
+			return self._get_user_tranids_from_repo_name_schema()
+		elif method_name == "isFileIngested":
+			return self._get_is_file_ingested_schema()
+		elif method_name == "addIngestedFile":
+			return self._get_add_ingested_file_schema()
+		elif method_name == "getIngestedRecordHashes" or \
+				method_name == "addIngestedRecordHashes":
+			return self._get_ingested_record_hashes_schema()
 		else:
 			raise Exception("No validator defined for method_name: " + \
 								method_name + \
 								". Please check and add back")
 
-	def _get_add_repo_master_validator(self):
+	def _get_add_repo_master_schema(self):
 		#-- note: yaml need to use space not tab for indentation
 		schema_text = '''
 Code:
@@ -49,10 +105,9 @@ AccrualDaysPerYear:
   required: true
   check_with: actual_or_number_format
 '''
-		schema = yaml.load(schema_text, Loader=yaml.FullLoader)
-		return AppValidator(schema)
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
 
-	def _get_add_transaction_validator(self):
+	def _get_add_transaction_schema(self):
 		schema_text = '''
 TransactionType:
   required: true
@@ -114,21 +169,19 @@ Broker:
   type: string
   maxlength: 100
 '''
-		schema = yaml.load(schema_text, Loader=yaml.FullLoader)
-		return AppValidator(schema)
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
 
 
-	def _get_cancel_transaction_validator(self):
+	def _get_cancel_transaction_schema(self):
 		schema_text = '''
 UserTranId1:
   required: true
   type: string
   maxlength: 20
 '''
-		schema = yaml.load(schema_text, Loader=yaml.FullLoader)
-		return AppValidator(schema)
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
 
-	def _get_close_transaction_validator(self):
+	def _get_close_transaction_schema(self):
 		schema_text = '''
 UserTranId1:
   required: true
@@ -138,10 +191,9 @@ ActualSettleDate:
   required: true
   check_with: iso8601_date_format
 '''
-		schema = yaml.load(schema_text, Loader=yaml.FullLoader)
-		return AppValidator(schema)
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
 
-	def _get_rerate_transaction_validator(self):
+	def _get_rerate_transaction_schema(self):
 		schema_text = '''
 UserTranId1:
   required: true
@@ -159,14 +211,14 @@ RateTable:
       required: true
       check_with: iso8601_date_format
 '''
-		schema = yaml.load(schema_text, Loader=yaml.FullLoader)
-		return AppValidator(schema)
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
 
-	def _get_repo_validator(self):
+	def _get_repo_schema(self):
 		schema_text = '''
 status:
   type: string
-  allowed: ['all', 'openclose', 'canceled']
+  allowed: ['all', 'openclose', 'open', 'closed', 'canceled']
+  check_with: status_format
 portfolio:
   type: string
   maxlength: 100
@@ -182,43 +234,149 @@ broker:
 has_hair_cut:
   type: string
   allowed: ['all', 'True', 'False', 'true', 'false']
+maturity_from:
+  type: string
+  nullable: true
+  check_with: yyyy_mm_dd_date_format
+maturity_to:
+  type: string
+  nullable: true
+  check_with: yyyy_mm_dd_date_format
+as_of_date:
+  type: string
+  nullable: true
+  check_with: yyyy_mm_dd_date_format
 '''
-		schema = yaml.load(schema_text, Loader=yaml.FullLoader)
-		return AppValidator(schema)
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
 
-	def _get_repo_transaction_history_validator(self):
+	def _get_repo_at_time_schema(self):
+		schema_text = '''
+time_stamp:
+  required: true
+  type: string
+  check_with: time_stamp_format
+status:
+  type: string
+  allowed: ['all', 'openclose', 'open', 'closed', 'canceled']
+portfolio:
+  type: string
+  maxlength: 100
+custodian:
+  type: string
+  maxlength: 100
+repo_code:
+  type: string
+  maxlength: 100
+broker:
+  type: string
+  maxlength: 100
+has_hair_cut:
+  type: string
+  allowed: ['all', 'True', 'False', 'true', 'false']
+'''
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
+
+	def _get_take_repo_snapshot_schema(self):
+		schema_text = '''
+time_stamp:
+  required: true
+  type: string
+  nullable: true
+  check_with: time_stamp_format
+'''
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
+
+	def _get_repo_transaction_history_schema(self):
 		schema_text = '''
 transaction_id:
   required: true
   type: string
   maxlength: 20
 '''
-		schema = yaml.load(schema_text, Loader=yaml.FullLoader)
-		return AppValidator(schema)
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
 
-	def _get_user_tranids_from_repo_name_validator(self):
+	def _get_page_schema(self):
+		schema_text = '''
+page_size:
+  required: true
+  type: integer
+  min: 1
+  max: 10000
+page_token:
+  required: true
+  type: string
+  nullable: true
+'''
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
+
+	def _get_user_tranids_from_repo_name_schema(self):
 		schema_text = '''
 repo_code:
   required: true
   type: string
   maxlength: 100
 '''
-		schema = yaml.load(schema_text, Loader=yaml.FullLoader)
-		return AppValidator(schema)
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
+
+	def _get_is_file_ingested_schema(self):
+		schema_text = '''
+file_hash:
+  required: true
+  type: string
+  maxlength: 64
+'''
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
+
+	def _get_add_ingested_file_schema(self):
+		schema_text = '''
+FileHash:
+  required: true
+  type: string
+  maxlength: 64
+FileName:
+  required: true
+  type: string
+  maxlength: 255
+FileType:
+  required: true
+  type: string
+  maxlength: 20
+RecordCount:
+  required: true
+  type: integer
+  min: 0
+'''
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
+
+	def _get_ingested_record_hashes_schema(self):
+		schema_text = '''
+record_hashes:
+  required: true
+  type: list
+  schema:
+    type: string
+    maxlength: 64
+'''
+		return yaml.load(schema_text, Loader=yaml.FullLoader)
 
 class AppValidator(Validator):
 	
 	iso8601_date_format_regex = r'^(-?(?:[1-9][0-9]*)?[0-9]{4})-(1[0-2]|0[1-9])-(3[01]|0[1-9]|[12][0-9])T(2[0-3]|[01][0-9]):([0-5][0-9]):([0-5][0-9])(\.[0-9]+)?(Z|[+-](?:2[0-3]|[01][0-9]):[0-5][0-9])?$'
+	#-- compiled once for all validators
+	match_iso8601 = re.compile(iso8601_date_format_regex).match
+
+	def validate(self, document, schema=None, update=False, normalize=False):
+		#-- the schemas have no normalization rules (default, coerce, rename etc.),
+		#-- so skip the normalization, which re-checks every schema rule on each call
+		return super(AppValidator, self).validate(document, schema, update, normalize)
 
 	def _check_with_iso8601_date_format(self, field, value):
-		match_iso8601 = re.compile(self.iso8601_date_format_regex).match
-		if not match_iso8601(value):
+		if not AppValidator.match_iso8601(value):
 			self._error(field, "date format must be in yyyy-MM-dd'T'HH:mm:ss.SSS'Z'")
 	
 	def _check_with_iso8601_date_or_calc_format(self, field, value):
 		if not str(value).lower() == "calc":
-			match_iso8601 = re.compile(self.iso8601_date_format_regex).match
-			if not match_iso8601(value):
+			if not AppValidator.match_iso8601(value):
 				self._error(field, "must be either CALC or in date format yyyy-MM-dd'T'HH:mm:ss.SSS'Z'")
 
 	def _check_with_maturity_date_format(self, field, value):
@@ -233,14 +391,30 @@ class AppValidator(Validator):
 			except ValueError:
 				self._error(field, "the first 10 chars of the date must be in yyyy-mm-dd")
 
-	"""
-	#-- comment out as the date in the getRepo() is removed
+	def _check_with_status_format(self, field, value):
+		#-- open and closed are the status as of a date, the current status of
+		#-- an open repo stays open until it is closed
+		if value in ("open", "closed") and self.document.get("as_of_date") is None:
+			self._error(field, "open and closed are allowed with as_of_date only")
+
 	def _check_with_yyyy_mm_dd_date_format(self, field, value):
+		if not isinstance(value, str):
+			#-- None of a nullable field, or a wrong type reported by the type rule
+			return
 		try:
 			datetime.strptime(value, "%Y-%m-%d")
 		except ValueError:
 			self._error(field, "date format must be in yyyy-mm-dd")
-	"""
+
+	def _check_with_time_stamp_format(self, field, value):
+		if not isinstance(value, str):
+			#-- None of a nullable field, or a wrong type reported by the type rule
+			return
+		#-- the TimeStamp of getRepoTransactionHistory, or with T as the iso dates
+		try:
+			datetime.strptime(value.replace("T", " "), "%Y-%m-%d %H:%M:%S")
+		except ValueError:
+			self._error(field, "time stamp format must be in yyyy-mm-dd HH:MM:SS")
 
 	def _check_with_actual_or_number_format(self, field, value):
 		if not value.lower() == "actual":
@@ -272,3 +446,198 @@ class AppValidator(Validator):
 	def _check_with_openended_format(self, field, value):
 		if value.lower() != "calc":
 			self._error(field, "must contains string value CALC")
+
+class AppBatchValidator:
+
+	#-- validates a whole record set column by column, i.e. each rule of a field
+	#-- is checked over all the values of the field in one pass. Records passing
+	#-- all the checks are valid, the others are validated again by cerberus to
+	#-- get the errors, so the errors are the same as validating the records one
+	#-- by one. Fields with rules not listed in column_rules are always checked
+	#-- by cerberus
+	column_rules = ("required", "type", "maxlength", "allowed", "empty", "min", "check_with", "schema")
+
+	#-- marks a field not in the record
+	missing = object()
+
+	def __init__(self, method_name, schema):
+		self.method_name = method_name
+		self.schema = schema
+
+	def validate(self, records):
+		#-- records is either a list of dictionary or a columnar table, i.e. a dictionary
+		#-- of field name => list of values, where None means the field is not in the record.
+		#-- return list of errors of each record in input order, empty dictionary if valid
+		if isinstance(records, Mapping):
+			columns, size, unknown = self._get_columns_from_table(records)
+			get_record = lambda i: {field : values[i] for field, values in records.items() \
+										if not values[i] is None}
+		else:
+			columns, size, unknown = self._get_columns_from_records(records, self.schema)
+			get_record = lambda i: records[i]
+		invalid = unknown | self._check_columns(columns, size, self.schema)
+		errors = [{} for i in range(size)]
+		if len(invalid) > 0:
+			v = AppValidatorFactory().get_validator(self.method_name)
+			for i in sorted(invalid):
+				if not v.validate(get_record(i)):
+					errors[i] = v.errors
+		return errors
+
+	def _get_columns_from_table(self, table):
+		size = max([len(values) for values in table.values()], default=0)
+		missing = AppBatchValidator.missing
+		columns = {
+			field : [missing if value is None else value for value in values]
+					for field, values in table.items() if field in self.schema
+		}
+		#-- records having a value of unknown column
+		unknown = set()
+		for field, values in table.items():
+			if len(values) != size:
+				raise ValueError("Column " + str(field) + " has " + str(len(values)) + \
+									" values, expected " + str(size))
+			if not field in self.schema:
+				unknown.update(i for i, value in enumerate(values) if not value is None)
+		return columns, size, unknown
+
+	def _get_columns_from_records(self, records, schema):
+		missing = AppBatchValidator.missing
+		fields = set(schema)
+		#-- records not being a dictionary or having fields not in schema
+		unknown = set(i for i, record in enumerate(records) \
+						if not isinstance(record, Mapping) or not record.keys() <= fields)
+		if len(unknown) > 0:
+			records = [{} if i in unknown else record for i, record in enumerate(records)]
+		columns = {
+			field : [record.get(field, missing) for record in records] for field in schema
+		}
+		return columns, len(records), unknown
+
+	def _check_columns(self, columns, size, schema):
+		#-- return set of index of records failing any rule
+		missing = AppBatchValidator.missing
+		invalid = set()
+		for field, rules in schema.items():
+			values = columns.get(field)
+			if values is None:
+				values = [missing] * size
+			if not set(rules) <= set(AppBatchValidator.column_rules):
+				invalid.update(range(size))
+				continue
+			if missing in values:
+				indices = [i for i, value in enumerate(values) if not value is missing]
+				if rules.get("required", False):
+					invalid.update(i for i, value in enumerate(values) if value is missing)
+				values = [values[i] for i in indices]
+				invalid.update(indices[j] for j in self._check_values(rules, values))
+			else:
+				invalid.update(self._check_values(rules, values))
+		return invalid
+
+	def _check_values(self, rules, values):
+		#-- return list of position of values failing any rule, null value not allowed
+		invalid = []
+		if None in values:
+			invalid.extend(j for j, value in enumerate(values) if value is None)
+		for rule, constraint in rules.items():
+			if rule == "type":
+				check = AppBatchValidator.type_checks.get(constraint)
+			elif rule == "maxlength":
+				check = lambda values, m=constraint: map(m.__ge__, map(len, values))
+			elif rule == "allowed":
+				check = lambda values, a=constraint: map(a.__contains__, values)
+			elif rule == "empty":
+				check = (lambda values: repeat(True, len(values))) if constraint else \
+							(lambda values: map(bool, map(len, values)))
+			elif rule == "min":
+				check = lambda values, m=constraint: (value >= m for value in values)
+			elif rule == "check_with":
+				check = AppBatchValidator.check_with_checks.get(constraint)
+			elif rule == "schema":
+				invalid.extend(self._check_sub_values(rules, constraint, values))
+				continue
+			else:
+				continue
+			if check is None:
+				return range(len(values))
+			invalid.extend(self._find_invalid(check, values))
+		return invalid
+
+	def _check_sub_values(self, rules, schema, values):
+		#-- rules of the fields of a dictionary, or of the items of a list
+		if rules.get("type") == "dict":
+			positions = [j for j, value in enumerate(values) if isinstance(value, Mapping)]
+			columns, size, unknown = self._get_columns_from_records([values[j] for j in positions], schema)
+			return [positions[k] for k in unknown | self._check_columns(columns, size, schema)]
+		elif rules.get("type") == "list":
+			owners = []
+			items = []
+			for j, value in enumerate(values):
+				if isinstance(value, Sequence) and not isinstance(value, str):
+					owners.extend([j] * len(value))
+					items.extend(value)
+			if not set(schema) <= set(AppBatchValidator.column_rules) or "schema" in schema:
+				return owners
+			return [owners[k] for k in self._check_values(schema, items)]
+		return range(len(values))
+
+	def _find_invalid(self, check, values):
+		#-- strings of a column often repeat (dates, currencies, brokers etc.),
+		#-- so check each distinct string once
+		if all(map(isinstance, values, repeat(str))):
+			distinct = list(set(values))
+			if len(distinct) * 2 < len(values):
+				failed = set(distinct[k] for k in self._find_invalid_values(check, distinct))
+				if len(failed) == 0:
+					return []
+				return [j for j, value in enumerate(values) if value in failed]
+		return self._find_invalid_values(check, values)
+
+	def _find_invalid_values(self, check, values):
+		#-- check the whole column at once, then value by value if the check raises
+		try:
+			flags = list(check(values))
+		except Exception:
+			flags = [AppBatchValidator._is_valid(check, value) for value in values]
+		if all(flags):
+			return []
+		return [j for j, flag in enumerate(flags) if not flag]
+
+	@staticmethod
+	def _is_valid(check, value):
+		try:
+			return next(iter(check([value])))
+		except Exception:
+			return False
+
+	@staticmethod
+	def _check_floats(values):
+		#-- raise ValueError if any value is not a number
+		return repeat(True, len(list(map(float, values))))
+
+	#-- a check takes a column of values, and returns a flag of each value
+	type_checks = {
+		"string" : lambda values: map(isinstance, values, repeat(str)),
+		"integer" : lambda values: (isinstance(value, int) and not isinstance(value, bool) \
+										for value in values),
+		"dict" : lambda values: map(isinstance, values, repeat(Mapping)),
+		"list" : lambda values: (isinstance(value, Sequence) and not isinstance(value, str) \
+										for value in values)
+	}
+
+	#-- same checks as the check_with rules of AppValidator, a value is invalid
+	#-- if its flag is False or the check raises
+	check_with_checks = {
+		"iso8601_date_format" : lambda values: (match is not None for match in \
+													map(AppValidator.match_iso8601, values)),
+		"iso8601_date_or_calc_format" : lambda values: (str(value).lower() == "calc" or \
+															AppValidator.match_iso8601(value) is not None \
+															for value in values),
+		"actual_or_number_format" : lambda values: (value.lower() == "actual" or \
+														int(value) is not None for value in values),
+		"float_format" : _check_floats.__func__,
+		"investment_format" : lambda values: ("" not in value.split("=", 1) and "=" in value \
+													for value in values),
+		"openended_format" : lambda values: (value.lower() == "calc" for value in values)
+	}